@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# bench_examples.py
+# Part of the WaterColorBot driver for Inkscape
+#
+# Times each stage of the driver over the example drawings that ship with
+# it, with the EBB replaced by a null serial port that answers every command
+# at once. Results are written as JSON, so that two runs (say, before and
+# after a change) can be compared:
+#
+#   python benchmarks/bench_examples.py -o before.json
+#   (make changes)
+#   python benchmarks/bench_examples.py -o after.json --compare before.json
+#
+# Stages, per file (best of --repeat runs, in seconds):
+#   parse      Reading the SVG document
+#   traverse   recursivelyTraverseSvg() and plotPath(), less the stages below
+#   flatten    flattenPath(): parsing path data, applyTransformToPath() and subdivideCubicPath()
+#   planning   plotLineAndTime(), penUpRapidMove() and wcb_planner
+#   commands   ebb_serial and ebb_motion calls, through the pipeline to the port
+#   plot       The whole plot (effect()), including all of the above but parsing
+#   colorsnap  wcbColorSnap (wcb_color.py) over the same file, parsing included
+#
+# The geometry cache is not used, unless --cache is given: then the first run
+# of each file fills a temporary cache, and any further runs read from it.
+#
+# The plotink and ink_extensions packages must be importable, as for the
+# extensions themselves.
+
+import argparse
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import deque
+
+ROOT = os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), '..' )
+sys.path.insert( 0, os.path.join( ROOT, 'extensions' ) )
+
+import wcb
+import wcb_color
+import wcb_conf
+import wcb_planner
+import wcb_virtual
+
+FILES = sorted( glob.glob( os.path.join( ROOT, 'examples', 'waterColor', '*.svg' ) ) ) + \
+    [os.path.join( ROOT, 'examples', 'testonly', 'PrecisionTest.svg' )]
+
+# Settings of the Inkscape dialog, at their defaults:
+OPTIONS = ['--tab=splash', '--paintMode=wc', '--penDownSpeed=75', '--penUpSpeed=200',
+    '--resolution=2', '--smoothness=0.2', '--reInkDist=12.0']
+
+STAGES = ( 'parse', 'traverse', 'flatten', 'planning', 'commands', 'plot', 'colorsnap' )
+
+
+class NullPort( object ):
+    '''Serial port stand-in that answers as an idle EBB would, without delay.'''
+
+    REPLIES = {
+        'QB': [b'0\r\n', b'OK\r\n'],
+        'QP': [b'1\r\n', b'OK\r\n'],
+        'QM': [b'QM,0,0,0,0\r\n'],
+        'V': [b'EBBv13_and_above (null port)\r\n'],
+    }
+
+    def __init__( self ):
+        self.clock = wcb_virtual.VirtualClock()    # So that MotionPipeline never sleeps
+        self.responses = deque()
+        self.commandCount = 0
+
+    def write( self, data ):
+        for cmd in data.split( b'\r' )[:-1]:
+            self.commandCount += 1
+            name = cmd.split( b',' )[0].strip().upper().decode( 'ascii' )
+            self.responses.extend( self.REPLIES.get( name, [b'OK\r\n'] ) )
+        return len( data )
+
+    def readline( self ):
+        if self.responses:
+            return self.responses.popleft()
+        return b''
+
+    @property
+    def in_waiting( self ):
+        return len( self.responses )
+
+    def close( self ):
+        pass
+
+
+class StageTimer( object ):
+    '''
+    Accumulates the time spent in wrapped functions, by stage. Time spent in
+    a nested stage is charged to that stage only, and not to its caller.
+    '''
+
+    def __init__( self ):
+        self.times = dict( ( stage, 0.0 ) for stage in STAGES )
+        self.stack = []
+        self.patched = []
+
+    def wrap( self, owner, name, stage ):
+        original = getattr( owner, name )
+        timer = self
+
+        def timed( *args, **kwargs ):
+            frame = [time.time(), 0.0]
+            timer.stack.append( frame )
+            try:
+                return original( *args, **kwargs )
+            finally:
+                timer.stack.pop()
+                elapsed = time.time() - frame[0]
+                timer.times[stage] += elapsed - frame[1]
+                if timer.stack:
+                    timer.stack[-1][1] += elapsed
+
+        self.patched.append( ( owner, name, original, owner.__dict__.get( name ) is not None ) )
+        setattr( owner, name, timed )
+
+    def restore( self ):
+        for owner, name, original, wasOwn in reversed( self.patched ):
+            if wasOwn:
+                setattr( owner, name, original )
+            else:
+                delattr( owner, name )    # Instance attribute hiding a method
+        self.patched = []
+
+
+def timePlot( fileName ):
+    timer = StageTimer()
+    effect = wcb.WCB()
+    effect.getoptions( OPTIONS )
+
+    tStart = time.time()
+    effect.parse( fileName )
+    timer.times['parse'] = time.time() - tStart
+
+    port = NullPort()
+    effect.openSerialPort = lambda: port
+
+    for name in ( 'recursivelyTraverseSvg', 'plotPath' ):
+        timer.wrap( effect, name, 'traverse' )
+    for name in ( 'plotLineAndTime', 'penUpRapidMove' ):
+        timer.wrap( effect, name, 'planning' )
+    timer.wrap( effect, 'flattenPath', 'flatten' )
+    for name in ( 'junctionSpeeds', 'sliceMove', 'constantSpeedMoves', 'rapidProfile' ):
+        timer.wrap( wcb_planner, name, 'planning' )
+    for name in ( 'command', 'query' ):
+        timer.wrap( wcb.ebb_serial, name, 'commands' )
+    for name in ( 'sendEnableMotors', 'sendDisableMotors', 'doXYMove', 'doTimedPause',
+            'QueryPRGButton' ):
+        timer.wrap( wcb.ebb_motion, name, 'commands' )
+
+    try:
+        tStart = time.time()
+        effect.effect()
+        timer.times['plot'] = time.time() - tStart
+    finally:
+        timer.restore()
+    return timer.times, port.commandCount
+
+
+def timeColorSnap( fileName ):
+    effect = wcb_color.wcbColorSnap()
+    tStart = time.time()
+    effect.affect( ['--snapLayers=true', fileName], output=False )
+    return time.time() - tStart
+
+
+def gitRevision():
+    try:
+        return subprocess.check_output( ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=ROOT ).decode( 'ascii' ).strip()
+    except ( OSError, subprocess.CalledProcessError ):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser( description='Time the WaterColorBot driver over the example files.' )
+    parser.add_argument( '-o', '--output', default='bench_examples.json', help='JSON results file' )
+    parser.add_argument( '-r', '--repeat', type=int, default=3, help='Runs per file; the best is kept' )
+    parser.add_argument( '--compare', help='Earlier JSON results to compare against' )
+    parser.add_argument( '--cache', action='store_true', help='Use a (temporary) geometry cache' )
+    parser.add_argument( 'files', nargs='*', help='SVG files (default: the bundled examples)' )
+    args = parser.parse_args()
+
+    cacheDir = None
+    wcb_conf.S_Geometry_Cache_File = ''
+    if args.cache:
+        cacheDir = tempfile.mkdtemp()
+        wcb_conf.S_Geometry_Cache_File = os.path.join( cacheDir, 'geometry.cache' )
+
+    results = {}
+    stderr = sys.stderr
+    for fileName in args.files or FILES:
+        best = None
+        commands = 0
+        for _ in range( max( 1, args.repeat ) ):
+            sys.stderr = open( os.devnull, 'w' )    # Hide messages meant for the Inkscape user
+            try:
+                times, commands = timePlot( fileName )
+                times['colorsnap'] = timeColorSnap( fileName )
+            finally:
+                sys.stderr.close()
+                sys.stderr = stderr
+            if best is None:
+                best = times
+            else:
+                best = dict( ( stage, min( best[stage], times[stage] ) ) for stage in STAGES )
+        best['ebb commands'] = commands
+        results[os.path.basename( fileName )] = best
+    if cacheDir is not None:
+        shutil.rmtree( cacheDir )
+
+    baseline = None
+    if args.compare:
+        with open( args.compare ) as inFile:
+            baseline = json.load( inFile )['files']
+
+    print( '%-24s' % 'File' + ''.join( '%11s' % stage for stage in STAGES ) )
+    for name, times in sorted( results.items() ):
+        row = '%-24s' % name[:24] + ''.join( '%11.4f' % times[stage] for stage in STAGES )
+        print( row )
+        if baseline and name in baseline:
+            print( '%-24s' % '  vs. baseline' + ''.join( '%10.2fx' % ( baseline[name][stage] / times[stage] )
+                if times[stage] > 0 else '%11s' % '-' for stage in STAGES ) )
+
+    with open( args.output, 'w' ) as outFile:
+        json.dump( { 'revision': gitRevision(), 'python': sys.version.split()[0],
+            'time': time.strftime( '%Y-%m-%dT%H:%M:%S' ), 'options': OPTIONS, 'cache': args.cache,
+            'files': results }, outFile, indent=1, sort_keys=True )
+    print( 'Results written to ' + args.output )
+
+
+if __name__ == '__main__':
+    main()
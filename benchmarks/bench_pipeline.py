@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# bench_pipeline.py
+# Part of the WaterColorBot driver for Inkscape
+#
+# Measures how many pen-down SM segments per second the host can hand to the
+# EBB, with and without the command pipeline in wcb_motion.py. The EBB is
+# replaced by a scripted port that answers every command with "OK" after a
+# fixed USB round-trip latency, so no hardware is needed.
+#
+# Usage: python benchmarks/bench_pipeline.py [segments] [latency_ms]
+
+import os
+import sys
+import time
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), '..', 'extensions' ) )
+
+import wcb_motion
+
+
+class ScriptedPort( object ):
+    '''
+    Fake serial port. Each command is acknowledged with "OK" once the round
+    trip latency has elapsed since the write that carried it.
+    '''
+
+    def __init__( self, latency ):
+        self.latency = latency
+        self.acks = []        # Time at which each queued "OK" becomes readable
+        self.partial = b''
+
+    def write( self, data ):
+        ready = time.time() + self.latency
+        self.partial += data
+        count = self.partial.count( b'\r' )
+        self.partial = self.partial[self.partial.rfind( b'\r' ) + 1:]
+        self.acks.extend( [ready] * count )
+
+    @property
+    def in_waiting( self ):
+        now = time.time()
+        return 4 * len( [t for t in self.acks if t <= now] )
+
+    def readline( self ):
+        if not self.acks:
+            return b''
+        delay = self.acks[0] - time.time()
+        if delay > 0:
+            time.sleep( delay )
+        self.acks.pop( 0 )
+        return b'OK\r\n'
+
+    def close( self ):
+        pass
+
+
+def command( port, cmd ):
+    '''Same write/read pattern as ebb_serial.command().'''
+    port.write( cmd.encode( 'ascii' ) )
+    return port.readline()
+
+
+def run( port, segments ):
+    tStart = time.time()
+    for i in range( segments ):
+        xd = ( i % 7 ) - 3
+        yd = ( i % 5 ) - 2
+        command( port, ','.join( ['SM', str( 1 ), str( xd ), str( yd )] ) + '\r' )
+    port.close()
+    return segments / ( time.time() - tStart )
+
+
+def main():
+    segments = 2000
+    latency = 0.002
+    if len( sys.argv ) > 1:
+        segments = int( sys.argv[1] )
+    if len( sys.argv ) > 2:
+        latency = float( sys.argv[2] ) / 1000.0
+
+    before = run( ScriptedPort( latency ), segments )
+    after = run( wcb_motion.MotionPipeline( ScriptedPort( latency ) ), segments )
+
+    print( 'Segments: %d, round trip latency: %.1f ms' % ( segments, latency * 1000.0 ) )
+    print( 'One command per round trip: %10.0f segments/s' % before )
+    print( 'Pipelined SM stream:        %10.0f segments/s' % after )
+    print( 'Speedup: %.1fx' % ( after / before ) )
+
+
+if __name__ == '__main__':
+    main()
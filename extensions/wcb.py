@@ -31,11 +31,11 @@
 # TODO: Advise user when no layers were found to plot-- from Paint tab
 
 import sys
+import os
 import gettext
+import hashlib
 import string
-import time
 import math
-from array import *
 
 from lxml import etree
 
@@ -58,6 +58,16 @@ except NameError:
 
 
 import wcb_conf          #Some settings can be changed here.
+import wcb_cache
+import wcb_daemon
+import wcb_geometry
+import wcb_journal
+import wcb_motion
+import wcb_paths
+import wcb_planner
+import wcb_profile
+import wcb_program
+import wcb_virtual
 
 F_DEFAULT_SPEED = 1
 N_PEN_DOWN_DELAY = 400    # delay (ms) for the pen to go down before the next move
@@ -144,6 +154,26 @@ class WCB( inkex.Effect ):
             action="store", type=int,
             dest="resolution", default=3,
             help="Resolution factor." )    
+        self.arg_parser.add_argument( "--reorder",
+            action="store", type=inkex.boolean_option,
+            dest="reorder", default=False,
+            help="Reorder the paths within each layer to reduce brush-up travel" )
+        self.arg_parser.add_argument( "--reversePaths",
+            action="store", type=inkex.boolean_option,
+            dest="reversePaths", default=False,
+            help="Paint paths from either end, and closed loops from any vertex" )
+        self.arg_parser.add_argument( "--joinPaths",
+            action="store", type=inkex.boolean_option,
+            dest="joinPaths", default=False,
+            help="Paint touching paths as one stroke, without lifting the brush" )
+        self.arg_parser.add_argument( "--simplify",
+            action="store", type=inkex.boolean_option,
+            dest="simplify", default=False,
+            help="Leave out vertices that do not change the painted path" )
+        self.arg_parser.add_argument( "--accelEnable",
+            action="store", type=inkex.boolean_option,
+            dest="accelEnable", default=False,
+            help="Plan acceleration and cornering speed while painting." )
             
         self.arg_parser.add_argument( "--paintMode",
             action="store", type=str,
@@ -178,6 +208,10 @@ class WCB( inkex.Effect ):
             action="store", type=float,
             dest="WalkDistance", default=1,
             help="Distance for manual walk" )            
+        self.arg_parser.add_argument( "--programFile",
+            action="store", type=str,
+            dest="programFile", default="WaterColorBot.wcbp",
+            help="Motion program file, for compiling and painting compiled plots" )
             
         self.arg_parser.add_argument( "--resumeType",
             action="store", type=str,
@@ -188,9 +222,43 @@ class WCB( inkex.Effect ):
             action="store", type=int,
             dest="layernumber", default=N_DEFAULT_LAYER,
             help="Selected layer for multilayer plotting" )            
+
+        self.arg_parser.add_argument( "--backend",
+            action="store", type=str,
+            dest="backend", default=wcb_conf.S_Serial_Backend,
+            help="ebb: use the WaterColorBot; virtual: simulate one, and report plot time" )
+
+        self.arg_parser.add_argument( "--dryRun",
+            action="store", type=inkex.boolean_option,
+            dest="dryRun", default=False,
+            help="Estimate painting time and travel, without moving the WaterColorBot" )
+
+        self.arg_parser.add_argument( "--profile",
+            action="store", type=inkex.boolean_option,
+            dest="profile", default=False,
+            help="Time each phase of the plot, and report the timings as JSON" )
+
+        self.arg_parser.add_argument( "--profileFile",
+            action="store", type=str,
+            dest="profileFile", default="",
+            help="File for the timing report (default: show it in a message)" )
             
             
         self.serialPort = None
+        self.virtualEBB = None
+        self.estimator = None   # Set during a dry run
+        self.profiler = None
+        self.geometryCache = None
+        self.journal = None     # Progress journal (wcb_journal), while plotting
+        self.daemonSocket = wcb_conf.S_Daemon_Socket    # Plotter daemon to send work to, if running
+        self.daemonFinished = None    # Whether the daemon ran the plot to its end, if it was sent there
+        self.optionArguments = []
+        self.documentHash = None
+        self.idIndex = None         # Elements by id, for <use> (clone) elements
+        self.instanceTransform = None   # Transform of the clone being traversed, if any
+        self.instanceGeometry = {}  # Flattened paths within clones, in the cloned element's coordinates
+        self.buttonMonitor = None
+        self.recorder = None    # Set while compiling a plot into a motion program
         self.bPenIsUp = None  #Initial state of pen is neither up nor down, but _unknown_.
         self.virtualPenIsUp = False  #Keeps track of pen postion when stepping through plot before resuming
         self.ignoreLimits = False
@@ -212,8 +280,38 @@ class WCB( inkex.Effect ):
 
         self.LayerOverrideSpeed = False
         self.LayerOverridePenDownHeight = False
+        self.LayerOverrideAccel = False
         self.LayerPenDownPosition = -1
         self.LayerPenDownSpeed = -1
+        self.LayerAccelEnable = False
+
+        # Path ordering: paths are collected for each layer, then painted in a planned order.
+        self.pathOrder = ''         # Ordering settings in use ('' for document order)
+        self.pathOrderSettings = []
+        self.plannedPaths = []      # Subpaths collected from the current layer, as vertex lists
+        self.planEnd = ( wcb_conf.F_StartPos_X, wcb_conf.F_StartPos_Y )  # Planned brush position
+        self.planMoves = []         # Improvement moves made in ordering each layer
+        self.planMoves_Old = []     # ... as read from file, to repeat the same order when resuming
+        self.travelSaved = 0.0      # Brush-up travel saved by ordering (px)
+        self.travelBefore = 0.0
+        self.liftsSaved = 0         # Brush lifts saved by joining touching paths
+        self.subpathsClipped = 0    # Subpaths cut at the edges of the page
+        self.segmentsBefore = 0     # Segments in the paths, before and after simplification
+        self.segmentsAfter = 0
+
+        # Resume checkpoints: where in the document to pick up a paused plot, without
+        # traversing everything before it. See resumePoint().
+        self.traversalPosition = [] # Index of the node being traversed, at each level of recursion
+        self.seekPosition = None    # ... and of the checkpoint that a resumed plot is skipping ahead to
+        self.resumeCheckpoint = None    # Resume point read from the WCB data
+        self.pathResumePoint = None     # Resume point at the path being painted (document order)
+        self.layerResumePoint = None    # Resume point at the layer being painted (path ordering)
+        self.sCurrentLayerName = None
+
+        # Segment-exact resuming: how far along the path being painted the brush has got
+        self.subpathIndex = 0       # Subpath being painted, within the path
+        self.vertexIndex = 0        # Vertex being moved to, within the subpath
+        self.resumeSegment = None   # ( subpath, vertex ) to resume the path from, on reaching it
 
         #Values read from file:
         self.svgLayer_Old = int( 0 )
@@ -225,6 +323,14 @@ class WCB( inkex.Effect ):
         self.svgLastKnownPosY_Old = float( 0.0 )
         self.svgPausedPosX_Old = float( 0.0 )
         self.svgPausedPosY_Old = float( 0.0 )    
+        self.svgPathOrder_Old = ''
+        self.svgCheckpoint_Old = ''
+        self.svgDrawingHash_Old = ''
+        self.svgSegment_Old = ''
+        self.svgBrushColor_Old = int( -1 )
+        self.svgPaintDist_Old = float( 0.0 )
+        self.svgLayerSettings_Old = ''
+        self.svgProgramIndex_Old = int( 0 )
         
         #New values to write to file:
         self.svgLayer = int( 0 )
@@ -236,6 +342,14 @@ class WCB( inkex.Effect ):
         self.svgLastKnownPosY = float( 0.0 )
         self.svgPausedPosX = float( 0.0 )
         self.svgPausedPosY = float( 0.0 )    
+        self.svgPathOrder = ''
+        self.svgCheckpoint = ''
+        self.svgDrawingHash = ''
+        self.svgSegment = ''
+        self.svgBrushColor = int( -1 )
+        self.svgPaintDist = float( 0.0 )
+        self.svgLayerSettings = ''
+        self.svgProgramIndex = int( 0 )
         
         self.paintdist = 0.0
         self.ReInkingNow = False
@@ -265,95 +379,35 @@ class WCB( inkex.Effect ):
         # which elements have received a warning
         self.warnings = {}
 
+    def getoptions( self, args=sys.argv[1:] ):
+        self.optionArguments = list( args )    # As given, to pass on to a plotter daemon
+        inkex.Effect.getoptions( self, args )
+
     def effect( self ):
         '''Main entry point: check to see which tab is selected, and act accordingly.'''
 
-        self.svg = self.document.getroot()
-        self.CheckSVGforWCBData()
+        if self.plotInDaemon():
+            return
+        self.startDocument()
         useOldResumeData = True
 
-        skipSerial = False
-        if (self.options.tab == "Help"):
-            skipSerial = True
-        if (self.options.tab == "options"):
-            skipSerial = True        
-        if (self.options.tab == "timing"):
-            skipSerial = True
-        if (self.options.tab == "wcbModes"):
-            skipSerial = True
+        skipSerial = not self.usesSerialPort()
+        if (self.options.tab == "manual") and (self.options.manualType == "compile-plot"):
+            self.compilePlot()
         
         if skipSerial == False:
-            self.serialPort = ebb_serial.openPort()
-            if self.serialPort is None:
-                inkex.errormsg( gettext.gettext( "Failed to connect to WaterColorBot. :(" ) )
+            self.connect()
         
             if self.options.tab == "splash": 
-                self.LayersFoundToPlot = False
                 useOldResumeData = False
-                self.PrintFromLayersTab = False
-                self.plotCurrentLayer = True
-                if self.serialPort is not None:
-                    self.svgNodeCount = 0
-                    self.svgLastPath = 0
-                    unused_button = ebb_motion.QueryPRGButton(self.serialPort)    #Query if button pressed
-                    self.svgLayer = 12345;  # indicate (to resume routine) that we are plotting all layers.
-                    self.setPaintingMode()
-                    self.plotToWCB()
-                    
-                    if ( self.LayersFoundToPlot == False ):
-                        inkex.errormsg( gettext.gettext( 'There are not any numbered layers to paint. Please use the "Snap Colors to Layers" extension, read about layer names in the documentation, or switch to a painting mode (like pen/pencil) that does not require numbered layers.' ) )
-                    
+                self.plotAllLayers()
                 
             elif self.options.tab == "resume":
-                if self.serialPort is None:
-                    useOldResumeData = True
-                else:
-                    useOldResumeData = False
-                    self.setPaintingMode()
-                    unused_button = ebb_motion.QueryPRGButton(self.serialPort)    #Query if button pressed
-                    self.resumePlotSetup()
-                    if self.resumeMode:
-                        self.fX = self.svgPausedPosX_Old + wcb_conf.F_StartPos_X
-                        self.fY = self.svgPausedPosY_Old + wcb_conf.F_StartPos_Y
-                        self.resumeMode = False
-                        
-                        
-                        self.penUpRapidMove( self.fX, self.fY ) #Special pre-resume move
-                        
-                        self.resumeMode = True
-                        self.nodeCount = 0
-                        self.plotToWCB() 
-                        
-                    elif ( self.options.resumeType == "justGoHome" ):
-                        self.fX = wcb_conf.F_StartPos_X
-                        self.fY = wcb_conf.F_StartPos_Y 
-                        self.penUpRapidMove( self.fX, self.fY ) #Rapid pen-up movements
-        
-                        #New values to write to file:
-                        self.svgNodeCount = self.svgNodeCount_Old
-                        self.svgLastPath = self.svgLastPath_Old 
-                        self.svgLastPathNC = self.svgLastPathNC_Old 
-                        self.svgPausedPosX = self.svgPausedPosX_Old 
-                        self.svgPausedPosY = self.svgPausedPosY_Old
-                        self.svgLayer = self.svgLayer_Old 
-        
-                    else:
-                        inkex.errormsg( gettext.gettext( "There does not seem to be any in-progress plot to resume." ) )
+                useOldResumeData = self.resumePlot()
     
             elif self.options.tab == "layers":
                 useOldResumeData = False 
-                self.PrintFromLayersTab = True
-                self.plotCurrentLayer = False
-                self.LayersFoundToPlot = False
-                self.svgLastPath = 0
-                if self.serialPort is not None:
-                    self.setPaintingMode()
-                    unused_button = ebb_motion.QueryPRGButton(self.serialPort)    #Query if button pressed
-                    self.svgNodeCount = 0;
-                    self.svgLayer = self.options.layernumber
-                    self.plotToWCB()
-                    if ( self.LayersFoundToPlot == False ):
-                        inkex.errormsg( gettext.gettext( 'There are not any numbered layers to paint. Please use the "Snap Colors to Layers" extension, read about layer names in the documentation, or switch to a painting mode (like pen/pencil) that does not require numbered layers.' ) )
+                self.plotLayer( self.options.layernumber )
     
             elif self.options.tab == "setup":
                 self.setupCommand()
@@ -368,30 +422,249 @@ class WCB( inkex.Effect ):
                     return    
                 else:    
                     useOldResumeData = False 
-                    self.svgNodeCount = self.svgNodeCount_Old
-                    self.svgLastPath = self.svgLastPath_Old 
-                    self.svgLastPathNC = self.svgLastPathNC_Old 
-                    self.svgPausedPosX = self.svgPausedPosX_Old 
-                    self.svgPausedPosY = self.svgPausedPosY_Old
-                    self.svgLayer = self.svgLayer_Old 
+                    self.keepResumeData()
                     self.manualCommand()
 
+        self.finishDocument( useOldResumeData )
+
+    def usesSerialPort( self ):
+        '''False for the tabs and commands that do not need the WaterColorBot.'''
+        if self.options.tab in ( "Help", "options", "timing", "wcbModes" ):
+            return False
+        if (self.options.tab == "manual") and (self.options.manualType == "compile-plot"):
+            return False
+        return True
+
+    def plotInDaemon( self ):
+        '''
+        If the plotter daemon (wcb_daemon.py) is running, have it do what we were asked to,
+        with the serial port that it keeps open, and take the document back from it. Returns
+        False if there is no daemon to do it (or no need), so that it is to be done here.
+        '''
+        if ( not self.daemonSocket ) or self.options.dryRun or ( self.options.backend == "virtual" ):
+            return False
+        if not self.usesSerialPort():
+            return False
+        try:
+            result = wcb_daemon.submitJob( os.path.expanduser( self.daemonSocket ),
+                self.optionArguments, etree.tostring( self.document ) )
+        except ( IOError, OSError, ValueError ) as err:
+            inkex.errormsg( 'Lost contact with the plotter daemon: ' + str( err ) )
+            return True
+        if result is None:
+            return False
+        messages, document, self.daemonFinished = result
+        if messages:
+            inkex.errormsg( messages.rstrip( '\n' ) )
+        self.document = etree.ElementTree( etree.fromstring( document, parser=etree.XMLParser( huge_tree=True ) ) )
+        return True
+
+    def plotFinished( self ):
+        '''
+        After effect(): True if the plot (or command) ran to its end, on a WaterColorBot;
+        False if it was paused, or there was no WaterColorBot to plot on.
+        '''
+        if self.daemonFinished is not None:
+            return self.daemonFinished
+        return ( self.serialPort is not None ) and not self.bStopped
+
+    def startDocument( self ):
+        '''Read the WCB data (plot progress) from the document, and open the geometry cache.'''
+        self.svg = self.document.getroot()
+        self.CheckSVGforWCBData()
+        if wcb_conf.S_Geometry_Cache_File:
+            self.geometryCache = wcb_cache.GeometryCache( os.path.expanduser( wcb_conf.S_Geometry_Cache_File ),
+                wcb_conf.N_Geometry_Cache_Size )
+
+    def connect( self ):
+        '''Open the serial port (see openSerialPort()), and set up the button monitor and profiling.'''
+        self.serialPort = self.openSerialPort()
+        if self.serialPort is None:
+            inkex.errormsg( gettext.gettext( "Failed to connect to WaterColorBot. :(" ) )
+        else:
+            if self.estimator is None:
+                self.serialPort = wcb_motion.MotionPipeline( self.serialPort )  # Batch up moves, read "OK"s later
+            self.buttonMonitor = wcb_motion.ButtonMonitor( self.serialPort )
+            if self.options.profile:
+                self.startProfiling()
+
+    def plotAllLayers( self ):
+        '''Paint the whole document, as from the Paint tab.'''
+        self.LayersFoundToPlot = False
+        self.PrintFromLayersTab = False
+        self.plotCurrentLayer = True
+        if self.serialPort is not None:
+            self.svgNodeCount = 0
+            self.svgLastPath = 0
+            unused_button = ebb_motion.QueryPRGButton(self.serialPort)    #Query if button pressed
+            self.svgLayer = 12345;  # indicate (to resume routine) that we are plotting all layers.
+            self.setPaintingMode()
+            self.startJournal( resuming=False )
+            self.plotToWCB()
+            
+            if ( self.LayersFoundToPlot == False ):
+                inkex.errormsg( gettext.gettext( 'There are not any numbered layers to paint. Please use the "Snap Colors to Layers" extension, read about layer names in the documentation, or switch to a painting mode (like pen/pencil) that does not require numbered layers.' ) )
+
+    def resumePlot( self ):
+        '''
+        Resume a paused plot, or return home from it, according to the resumeType option.
+        Returns True if the saved plot state should be kept as it was.
+        '''
+        if self.serialPort is None:
+            return True
+        self.setPaintingMode()
+        unused_button = ebb_motion.QueryPRGButton(self.serialPort)    #Query if button pressed
+        if self.readJournal():
+            inkex.errormsg( 'Resuming from the plot journal, which is further along than the ' +
+                'plot data saved in this document.' )
+        self.resumePlotSetup()
+        if self.resumeMode:
+            self.fX = self.svgPausedPosX_Old + wcb_conf.F_StartPos_X
+            self.fY = self.svgPausedPosY_Old + wcb_conf.F_StartPos_Y
+            self.resumeMode = False
+            
+            
+            self.penUpRapidMove( self.fX, self.fY ) #Special pre-resume move
+            
+            self.resumeMode = True
+            self.nodeCount = 0
+            # Until the path that was paused in is finished, a pause saves the last path finished
+            # before it, and the checkpoint there:
+            self.svgLastPath = self.svgLastPath_Old
+            self.svgLastPathNC = self.svgLastPathNC_Old
+            self.svgCheckpoint = self.svgCheckpoint_Old
+            self.svgDrawingHash = self.svgDrawingHash_Old
+            self.startJournal( resuming=True )
+            self.plotToWCB() 
+            
+        elif ( self.options.resumeType == "justGoHome" ):
+            self.fX = wcb_conf.F_StartPos_X
+            self.fY = wcb_conf.F_StartPos_Y 
+            self.penUpRapidMove( self.fX, self.fY ) #Rapid pen-up movements
+
+            #New values to write to file:
+            self.keepResumeData()
+            self.journalCarriagePosition()
+
+        else:
+            inkex.errormsg( gettext.gettext( "There does not seem to be any in-progress plot to resume." ) )
+        return False
+
+    def plotLayer( self, layerNumber ):
+        '''Paint the layers whose names begin with [layerNumber], as from the Layers tab.'''
+        self.PrintFromLayersTab = True
+        self.plotCurrentLayer = False
+        self.LayersFoundToPlot = False
+        self.svgLastPath = 0
+        if self.serialPort is not None:
+            self.setPaintingMode()
+            unused_button = ebb_motion.QueryPRGButton(self.serialPort)    #Query if button pressed
+            self.svgNodeCount = 0;
+            self.svgLayer = layerNumber
+            self.startJournal( resuming=False )
+            self.plotToWCB()
+            if ( self.LayersFoundToPlot == False ):
+                inkex.errormsg( gettext.gettext( 'There are not any numbered layers to paint. Please use the "Snap Colors to Layers" extension, read about layer names in the documentation, or switch to a painting mode (like pen/pencil) that does not require numbered layers.' ) )
+
+    def keepResumeData( self ):
+        '''Keep the plot state read from the document, to write back unchanged (the position aside).'''
+        self.svgNodeCount = self.svgNodeCount_Old
+        self.svgLastPath = self.svgLastPath_Old 
+        self.svgLastPathNC = self.svgLastPathNC_Old 
+        self.svgPausedPosX = self.svgPausedPosX_Old 
+        self.svgPausedPosY = self.svgPausedPosY_Old
+        self.svgLayer = self.svgLayer_Old 
+        self.svgPathOrder = self.svgPathOrder_Old
+        self.svgCheckpoint = self.svgCheckpoint_Old
+        self.svgDrawingHash = self.svgDrawingHash_Old
+        self.svgSegment = self.svgSegment_Old
+        self.svgBrushColor = self.svgBrushColor_Old
+        self.svgPaintDist = self.svgPaintDist_Old
+        self.svgLayerSettings = self.svgLayerSettings_Old
+        self.svgProgramIndex = self.svgProgramIndex_Old
+
+    def finishDocument( self, useOldResumeData ):
+        '''
+        Write the plot state back into the document's WCB data (the state read from it,
+        if [useOldResumeData]), save the geometry cache, and close the serial port.
+        '''
+        if self.estimator is not None:
+            useOldResumeData = True    # A dry run leaves the saved plot state alone.
+
         if (useOldResumeData):    #Do not make any changes to data saved from SVG file.
-            self.svgNodeCount = self.svgNodeCount_Old
-            self.svgLastPath = self.svgLastPath_Old 
-            self.svgLastPathNC = self.svgLastPathNC_Old 
-            self.svgPausedPosX = self.svgPausedPosX_Old 
-            self.svgPausedPosY = self.svgPausedPosY_Old
-            self.svgLayer = self.svgLayer_Old                
+            self.keepResumeData()
             self.svgLastKnownPosX = self.svgLastKnownPosX_Old
             self.svgLastKnownPosY = self.svgLastKnownPosY_Old 
 
+        if self.svgDrawingHash is None:
+            self.svgDrawingHash = self.drawingHash()
         self.svgDataRead = False
         self.UpdateSVGWCBData( self.svg )
+        if self.geometryCache is not None:
+            try:
+                self.geometryCache.save()
+            except ( IOError, OSError ) as err:
+                inkex.errormsg( 'Unable to save geometry cache: ' + str( err ) )
+        self.disconnect()
+
+    def disconnect( self ):
+        '''Close the serial port, once the EBB has finished, and report any errors, estimates and timings.'''
         if self.serialPort is not None:
             ebb_motion.doTimedPause(self.serialPort, 10) #Pause a moment for underway commands to finish...
             ebb_serial.closePort(self.serialPort)    
+            if self.serialPort.errors:
+                badCommand, response = self.serialPort.errors[0]
+                inkex.errormsg( 'Unexpected response from EBB.\n    Command: ' + badCommand +
+                    '\n    Response: ' + response )
+            if self.virtualEBB is not None:
+                inkex.errormsg( self.virtualEBB.report() )
+        if self.profiler is not None:
+            self.reportProfile()
+        
+    def openSerialPort( self ):
+        '''
+        Connect to the EBB, or to a simulated one when using the "virtual" backend.
+        For a dry run, the simulated EBB is a PlotEstimator.
+        '''
+        if self.options.dryRun:
+            self.estimator = wcb_virtual.PlotEstimator()
+            self.virtualEBB = self.estimator
+            return self.estimator
+        if self.options.backend == "virtual":
+            self.virtualEBB = wcb_virtual.VirtualEBB()
+            return self.virtualEBB
+        return ebb_serial.openPort()
         
+    def startProfiling( self ):
+        '''Time the phases of the plot, by wrapping the methods that carry them out.'''
+        self.profiler = wcb_profile.Profiler()
+        for name, phase in ( ( 'recursivelyTraverseSvg', 'traversal' ),
+                ( 'plotPath', 'traversal' ),
+                ( 'flattenPath', 'flattening' ),
+                ( 'planPathOrder', 'path ordering' ),
+                ( 'plotLineAndTime', 'brush-down moves' ),
+                ( 'penUpRapidMove', 'brush-up moves' ),
+                ( 'penUp', 'servo' ),
+                ( 'penDown', 'servo' ),
+                ( 'checkPauseButton', 'pause button' ),
+                ( 'CleanBrush', 'wash' ),
+                ( 'PaintToolChange', 'paint change' ),
+                ( 'reInkBrush', 're-ink' ) ):
+            self.profiler.wrap( self, name, phase )
+        # Waits for the EBB: acknowledgements, queries, and motion queue flow control.
+        self.profiler.wrap( self.serialPort, 'readAck', 'serial acks' )
+        self.profiler.wrap( self.serialPort, 'query', 'serial queries' )
+        self.profiler.wrap( self.serialPort, 'throttle', 'motion queue waits' )
+
+    def reportProfile( self ):
+        if self.options.profileFile:
+            try:
+                self.profiler.save( os.path.expanduser( self.options.profileFile ) )
+            except IOError as err:
+                inkex.errormsg( 'Unable to save timing report: ' + str( err ) )
+        else:
+            inkex.errormsg( self.profiler.reportText() )
+
     def resumePlotSetup( self ):
         self.LayerFound = False
         if ( self.svgLayer_Old < 101 ) and ( self.svgLayer_Old >= 0 ):
@@ -409,6 +682,12 @@ class WCB( inkex.Effect ):
                 self.svgLayer = self.svgLayer_Old
                 if self.options.resumeType == "ResumeNow":
                     self.resumeMode = True
+                    # The brush is still loaded as it was when paused: no wash and re-ink needed,
+                    # unless a re-ink was due (or interrupted). A paint color of -1 (not saved)
+                    # makes the first path change paint, as at the start of a plot.
+                    self.BrushColor = self.svgBrushColor_Old
+                    self.paintdist = self.svgPaintDist_Old
+                    self.restoreLayerSettings( self.svgLayerSettings_Old )
                 if self.serialPort is None:
                     return
                 self.ServoSetup()
@@ -433,6 +712,14 @@ class WCB( inkex.Effect ):
             WCBlayer.set( 'lastknownposy', str( 0 ) )
             WCBlayer.set( 'pausedposx', str( 0 ) )       #The position of the carriage when "pause" was pressed.
             WCBlayer.set( 'pausedposy', str( 0 ) )
+            WCBlayer.set( 'pathorder', '' )            #Path ordering used by the paused plot
+            WCBlayer.set( 'checkpoint', '' )           #Where to resume, without traversing what came before
+            WCBlayer.set( 'drawinghash', '' )          #Hash of the drawing that the checkpoint applies to
+            WCBlayer.set( 'segment', '' )              #Subpath and vertex reached in the path paused in
+            WCBlayer.set( 'brushcolor', str( -1 ) )    #Paint on the brush when paused
+            WCBlayer.set( 'paintdist', str( 0 ) )      #Distance painted since the brush was last inked
+            WCBlayer.set( 'layersettings', '' )        #Pen-down height, speed and acceleration overrides in use
+            WCBlayer.set( 'programindex', str( 0 ) )   #Record to continue a paused motion program from
                         
     def recursiveWCBDataScan( self, aNodeList ):
         if ( not self.svgDataRead ):
@@ -449,6 +736,14 @@ class WCB( inkex.Effect ):
                         self.svgLastKnownPosY_Old = float( node.get( 'lastknownposy' ) ) 
                         self.svgPausedPosX_Old = float( node.get( 'pausedposx' ) )
                         self.svgPausedPosY_Old = float( node.get( 'pausedposy' ) ) 
+                        self.svgPathOrder_Old = node.get( 'pathorder', '' )
+                        self.svgCheckpoint_Old = node.get( 'checkpoint', '' )
+                        self.svgDrawingHash_Old = node.get( 'drawinghash', '' )
+                        self.svgSegment_Old = node.get( 'segment', '' )
+                        self.svgBrushColor_Old = int( node.get( 'brushcolor', '-1' ) )
+                        self.svgPaintDist_Old = float( node.get( 'paintdist', '0' ) )
+                        self.svgLayerSettings_Old = node.get( 'layersettings', '' )
+                        self.svgProgramIndex_Old = int( node.get( 'programindex', '0' ) )
                         self.svgDataRead = True
                     except:
                         pass
@@ -467,6 +762,14 @@ class WCB( inkex.Effect ):
                     node.set( 'lastknownposy', str( (self.svgLastKnownPosY ) ) )
                     node.set( 'pausedposx', str( (self.svgPausedPosX) ) )
                     node.set( 'pausedposy', str( (self.svgPausedPosY) ) )
+                    node.set( 'pathorder', self.svgPathOrder )
+                    node.set( 'checkpoint', self.svgCheckpoint )
+                    node.set( 'drawinghash', self.svgDrawingHash )
+                    node.set( 'segment', self.svgSegment )
+                    node.set( 'brushcolor', str( self.svgBrushColor ) )
+                    node.set( 'paintdist', str( self.svgPaintDist ) )
+                    node.set( 'layersettings', self.svgLayerSettings )
+                    node.set( 'programindex', str( self.svgProgramIndex ) )
                     
                     self.svgDataRead = True
                      
@@ -522,6 +825,15 @@ class WCB( inkex.Effect ):
             self.EnableMotors() #Set plotting resolution 
             self.CleanBrush()
             self.moveHome()     
+            self.journalCarriagePosition()
+
+        elif self.options.manualType == "stream-plot":
+            self.streamPlot()
+            self.journalCarriagePosition()
+
+        elif self.options.manualType == "resume-stream":
+            self.streamPlot( resume=True )
+            self.journalCarriagePosition()
 
         elif self.options.manualType == "version-check":
             strVersion = ebb_serial.query( self.serialPort, 'v\r' )
@@ -545,6 +857,8 @@ class WCB( inkex.Effect ):
                 self.fSpeed = self.options.penUpSpeed
                 
             self.EnableMotors() #Set plotting resolution 
+            if self.readJournal():    # Start from where a paused plot left the carriage
+                self.keepResumeData()
             self.fCurrX = self.svgLastKnownPosX_Old + wcb_conf.F_StartPos_X
             self.fCurrY = self.svgLastKnownPosY_Old + wcb_conf.F_StartPos_Y
             self.ignoreLimits = True
@@ -552,11 +866,152 @@ class WCB( inkex.Effect ):
             self.fX = self.fCurrX + nDeltaX * plot_utils.PX_PER_INCH
             self.fY = self.fCurrY + nDeltaY * plot_utils.PX_PER_INCH  
             self.plotLineAndTime(self.fX, self.fY ) 
+            self.journalCarriagePosition()
+
+
+
+    def programFileName( self ):
+        fileName = os.path.expanduser( self.options.programFile )
+        if not os.path.isabs( fileName ):
+            fileName = os.path.join( os.path.expanduser( '~' ), fileName )
+        return fileName
+
+    def compilePlot( self ):
+        '''
+        Plan the whole document, as when painting from the Paint tab, but record
+        the commands into a motion program file instead of sending them to the
+        WaterColorBot. No WaterColorBot needs to be connected.
+        '''
+        program = self.compileProgram()
+
+        try:
+            program.save( self.programFileName() )
+        except IOError as err:
+            inkex.errormsg( 'Unable to save motion program: ' + str( err ) )
+            return
+        commands, paths, reInks, motionTime = program.statistics()
+        inkex.errormsg( 'Saved a motion program of {0} commands ({1} paths, {2} re-inking trips, '
+            'about {3:.1f} minutes of motion) to {4}'.format( commands, paths, reInks,
+            motionTime / 60.0, self.programFileName() ) )
+
+    def compileProgram( self ):
+        '''The commands to paint the whole document, recorded as a MotionProgram.'''
+        program = wcb_program.MotionProgram()
+        self.recorder = wcb_program.ProgramRecorder( program )
+        self.serialPort = self.recorder
+        self.buttonMonitor = wcb_motion.ButtonMonitor( self.serialPort, threaded=False )
+        self.LayersFoundToPlot = False
+        self.PrintFromLayersTab = False
+        self.plotCurrentLayer = True
+        self.svgLayer = 12345
+        self.setPaintingMode()
+        self.plotToWCB()
+        program.stepsPerPx = self.stepsPerPx
+        self.serialPort = None
+        self.recorder = None
+        return program
+
+    def streamPlot( self, resume=False ):
+        '''
+        Paint a motion program saved earlier by compilePlot(). As with a normal plot,
+        the carriage must start in the home corner. If [resume], continue the program
+        from where it was paused instead.
+        '''
+        try:
+            program = wcb_program.MotionProgram.load( self.programFileName() )
+        except (IOError, ValueError) as err:
+            inkex.errormsg( 'Unable to read motion program: ' + str( err ) )
+            return
+        start = self.programStart( program, resume )
+        if start is not None:
+            self.streamProgram( program, start )
 
+    def programStart( self, program, resume ):
+        '''
+        The record of [program] to begin streaming with: 0, or if [resume], the one saved when
+        it was paused. None (after telling the user) if there is no paused program to resume.
+        '''
+        if not resume:
+            return 0
+        if ( self.svgProgramIndex_Old <= 0 ) or ( self.svgProgramIndex_Old >= len( program ) ) or \
+                ( program.stepsPerPx <= 0 ):
+            inkex.errormsg( 'There does not seem to be any paused motion program to resume.' )
+            return None
+        return self.svgProgramIndex_Old
+
+    def streamProgram( self, program, start=0 ):
+        '''
+        Send the commands of [program] (a MotionProgram) to the open serial port, beginning
+        with record [start]. Returns False if painting was paused before the end; the brush
+        is then raised, and the record to continue from is saved in the WCB data.
+        '''
+        if start > 0:
+            self.restoreProgramState( program, start )
+        self.buttonMonitor.start()
+        try:
+            index, unused_steps1, unused_steps2 = program.stream( self.serialPort, self.buttonMonitor, start )
+        finally:
+            self.buttonMonitor.stop()
+
+        unused_configuration, penDown, steps1, steps2 = program.stateAt( index )
+        if program.stepsPerPx > 0:
+            self.svgLastKnownPosX, self.svgLastKnownPosY = self.programPosition( program, steps1, steps2 )
+        if index < len( program ):
+            if penDown:
+                ebb_motion.sendPenUp( self.serialPort, self.options.penUpDelay )
+            self.svgProgramIndex = index
+            inkex.errormsg( 'Painting paused by button press, at command ' + str( index ) + 
+                ' of ' + str( len( program ) ) + '.' )
+            inkex.errormsg( 'Use "Resume painting compiled program file" to continue.' )
+            return False
+        self.svgProgramIndex = 0
+        return True
+
+    def programPosition( self, program, steps1, steps2 ):
+        '''The carriage position (from home) once [program] has moved the given steps.'''
+        if ( self.options.revMotor1 ):
+            steps1 = -steps1
+        if ( self.options.revMotor2 ):
+            steps2 = -steps2
+        return steps1 / program.stepsPerPx, steps2 / program.stepsPerPx
+
+    def restoreProgramState( self, program, start ):
+        '''
+        Before continuing [program] from record [start]: set up the servo and motors as the
+        program had them there, and bring the brush, raised, from where the carriage was
+        last known to be to where the program was paused. Lower it again if it was down.
+        '''
+        configuration, penDown, steps1, steps2 = program.stateAt( start )
+        self.EnableMotors()    # Speeds for the move
+        for cmd in configuration:
+            ebb_serial.command( self.serialPort, cmd )
+        ebb_motion.sendPenUp( self.serialPort, self.options.penUpDelay )
+        if program.stepsPerPx > 0:
+            self.stepsPerPx = program.stepsPerPx
+        pausedPosX, pausedPosY = self.programPosition( program, steps1, steps2 )
+        self.fSpeed = self.options.penUpSpeed
+        self.fCurrX = self.svgLastKnownPosX_Old + wcb_conf.F_StartPos_X
+        self.fCurrY = self.svgLastKnownPosY_Old + wcb_conf.F_StartPos_Y
+        buttonMonitor = self.buttonMonitor
+        self.buttonMonitor = None    # No pausing on the way: the program continues from there
+        try:
+            self.penUpRapidMove( pausedPosX + wcb_conf.F_StartPos_X, pausedPosY + wcb_conf.F_StartPos_Y )
+        finally:
+            self.buttonMonitor = buttonMonitor
+        if penDown:
+            ebb_motion.sendPenDown( self.serialPort, self.options.penDownDelay )
 
+    def beginPhase( self, name ):
+        if self.estimator is not None:
+            self.estimator.beginPhase( name )
+
+    def endPhase( self ):
+        if self.estimator is not None:
+            self.estimator.endPhase()
 
     def CleanBrush(self):  
         self.CleaningNow = True
+        self.beginPhase( 'wash' )
         self.EnableMotors() #Set plotting resolution  
         self.MoveToWater(0)
         self.PaintSwirl(wcb_conf.WashCycles, wcb_conf.WashDelta[0], wcb_conf.WashDelta[1])   
@@ -564,6 +1019,7 @@ class WCB( inkex.Effect ):
         self.PaintSwirl(wcb_conf.WashCycles, wcb_conf.WashDelta[0], wcb_conf.WashDelta[1])   
         self.MoveToWater(2)    
         self.PaintSwirl(wcb_conf.WashCycles, wcb_conf.WashDelta[0], wcb_conf.WashDelta[1])   
+        self.endPhase()
         self.CleaningNow = False
         self.EnableMotors() #Set plotting resolution  
 
@@ -623,6 +1079,7 @@ class WCB( inkex.Effect ):
 
     def PaintToolChange(self, color):   # Move Brush to certain paint color and ink the brush
         if (self.options.autoChange):
+            self.beginPhase( 'paint' )
 #            inkex.errormsg( 'About to clean brush at node#: ' + str( self.nodeCount ) + '.' )  
             self.CleanBrush()
 #            inkex.errormsg( 'Begin color change to color#: ' + str( color ) + '.' )  
@@ -635,11 +1092,13 @@ class WCB( inkex.Effect ):
                     self.MoveToWater(0)
                     self.PaintSwirl(1, wcb_conf.WaterDipDelta[0], wcb_conf.WaterDipDelta[1])
             self.paintdist = 0.0
+            self.endPhase()
 #            inkex.errormsg( 'Finished ink change at node#: ' + str( self.nodeCount ) + '.' )  
 
         else: # Cases with autochange off: 
             if (self.BrushColor < 0):  # if we have not previously inked the brush
                 self.BrushColor = 0
+                self.beginPhase( 'paint' )
                 
 #                inkex.errormsg( 'self.options.reInkEnable: ' + str( self.options.reInkEnable) + '.' )     
 #                inkex.errormsg( 'self.options.ReWetOnly: ' + str( self.options.ReWetOnly) + '.' )  
@@ -666,9 +1125,13 @@ class WCB( inkex.Effect ):
                 elif ((self.options.reInkEnable) and (self.options.ReWetOnly)): # if we are using only water
                     self.MoveToWater(0)        #water dip only
                     self.PaintSwirl(1, wcb_conf.WaterDipDelta[0], wcb_conf.WaterDipDelta[1])
+                self.endPhase()
 
     def reInkBrush(self):    
         self.ReInkingNow = True
+        self.beginPhase( 're-ink' )
+        if self.recorder is not None:
+            self.recorder.markReInk( True )
         
         #Redefine movement boundaries to include paint set & water
         returnToXmin = self.xBoundsMin
@@ -708,6 +1171,9 @@ class WCB( inkex.Effect ):
         self.EnableMotors() #Set plotting resolution back to normal after re-inking
         self.penDown() 
         self.paintdist = 0
+        self.endPhase()
+        if self.recorder is not None:
+            self.recorder.markReInk( False )
 
     def setPaintingMode(self):
         #Note: For manual mode, we use the existing options set. Otherwise, override:    
@@ -795,9 +1261,20 @@ class WCB( inkex.Effect ):
         self.penUp() 
         self.EnableMotors() #Set plotting resolution
 
+        # When resuming, paint in the same order as the paused plot did:
+        if self.resumeMode:
+            self.setPathOrder( self.svgPathOrder_Old )
+            self.seekCheckpoint()
+        else:
+            self.setPathOrder( '+'.join( setting for setting, enabled in (
+                ( 'order', self.options.reorder ), ( 'reverse', self.options.reversePaths ),
+                ( 'join', self.options.joinPaths ) ) if enabled ) )
+
+        self.buttonMonitor.start()
         try:
             # wrap everything in a try so we can for sure close the serial port 
             self.recursivelyTraverseSvg( self.svg, self.svg_transform )
+            self.plotPlannedPaths()
             self.penUp()   #Always end with pen-up
  
             # return to home after end of normal plot
@@ -819,12 +1296,159 @@ class WCB( inkex.Effect ):
                     self.svgLastKnownPosY = 0
                     self.svgPausedPosX = 0
                     self.svgPausedPosY = 0
+                    self.svgPathOrder = ''
+                    self.svgCheckpoint = ''
+                    self.svgDrawingHash = ''
+                    self.svgSegment = ''
+                    self.svgBrushColor = -1
+                    self.svgPaintDist = 0.0
+                    self.svgLayerSettings = ''
                     #Clear saved position data from the SVG file,
                     #  IF we have completed a normal plot from the splash, layer, or resume tabs.
+                    self.finishJournal()
 
         finally:
             # We may have had an exception and lost the serial port...
-            pass
+            self.buttonMonitor.stop()
+            self.closeJournal()
+
+        if ( ( 'order' in self.pathOrderSettings ) or ( 'reverse' in self.pathOrderSettings ) ) and \
+                ( self.travelBefore > 0 ):
+            inkex.errormsg( 'Path ordering saved {0:.1f} inches of brush-up travel ({1:.0f}%).'.format(
+                self.travelSaved / plot_utils.PX_PER_INCH, 100.0 * self.travelSaved / self.travelBefore ) )
+        if 'join' in self.pathOrderSettings:
+            inkex.errormsg( 'Joining touching paths saved {0} brush lifts.'.format( self.liftsSaved ) )
+        if self.subpathsClipped:
+            inkex.errormsg( '{0} paths extend beyond the page; the parts outside were not painted.'.format(
+                self.subpathsClipped ) )
+        if self.options.simplify and ( self.segmentsBefore > 0 ):
+            inkex.errormsg( 'Simplifying paths removed {0} of {1} segments ({2:.0f}%).'.format(
+                self.segmentsBefore - self.segmentsAfter, self.segmentsBefore,
+                100.0 * ( self.segmentsBefore - self.segmentsAfter ) / self.segmentsBefore ) )
+
+    def setPathOrder( self, pathOrder ):
+        '''
+        Turn on path ordering, given the settings string saved in the WCB data:
+        any of "order", "reverse" and "join", joined by "+" (as "order+join"), then optionally a colon and the number
+        of improvement moves made for each layer so far (as "order:12,0,5").
+        An empty string leaves the paths in document order and direction.
+        '''
+        settings, unused_sep, moves = pathOrder.partition( ':' )
+        self.pathOrder = settings
+        self.pathOrderSettings = settings.split( '+' )
+        self.planMoves_Old = [int( count ) for count in moves.split( ',' ) if count]
+        self.planMoves = []
+        self.svgPathOrder = settings
+
+    def doWePlotThisPath( self ):
+        '''
+        Called for each path-like element found. When paths are being collected for
+        ordering, they are counted later instead, in the order painted.
+        '''
+        if self.pathOrder:
+            return True
+        return self.countPath()
+
+    def countPath( self ):
+        '''
+        Count a path, for resuming. Returns False if the path is to be skipped.
+
+        If we're in resume mode AND self.pathcount < self.svgLastPath_Old, then this
+        path was *completely plotted* already; skip over it. If we're in resume mode
+        and self.pathcount = self.svgLastPath_Old, then this is the first *not completely*
+        plotted path: start here, and set self.nodeCount equal to self.svgLastPathNC_Old.
+        If the segment reached in that path was saved, painting picks up there (see
+        resumeAtSegment()); otherwise, the path is stepped through without painting
+        until self.nodeCount reaches self.nodeTarget.
+        '''
+        if not self.pathOrder:
+            self.pathResumePoint = self.resumePoint()
+        self.resumeSegment = None
+        if (self.resumeMode): 
+            if (self.pathcount < self.svgLastPath_Old ): 
+                self.pathcount += 1 
+                return False
+            elif (self.pathcount == self.svgLastPath_Old ): 
+                self.nodeCount =  self.svgLastPathNC_Old    #Nodecount after last completed path
+                self.resumeAtSegment()
+            else:
+                return False
+        self.pathcount += 1
+        return True
+
+    def resumeAtSegment( self ):
+        '''
+        Resume painting the path that was paused in, at the subpath and vertex that the
+        brush had reached. (The brush itself is as it was, from resumePlotSetup().)
+        '''
+        try:
+            subpath, vertex = [int( index ) for index in self.svgSegment_Old.split( ',' )]
+        except ValueError:
+            return    # Not saved: count off nodes instead
+        self.resumeSegment = ( subpath, vertex )
+        self.resumeMode = False
+
+    def planPathOrder( self, paths ):
+        '''
+        Choose the order in which to paint the collected [paths]. The order is repeated
+        exactly when resuming, by limiting the optimizer to the moves that it made before.
+        '''
+        layerIndex = len( self.planMoves )
+        reorder = 'order' in self.pathOrderSettings
+        reverse = 'reverse' in self.pathOrderSettings    # Paths are reversed or rotated in place
+        if layerIndex < len( self.planMoves_Old ):
+            order, moves, before, after = wcb_paths.orderPaths( paths, self.planEnd,
+                maxMoves=self.planMoves_Old[layerIndex], reorder=reorder, reverse=reverse )
+        else:
+            order, moves, before, after = wcb_paths.orderPaths( paths, self.planEnd,
+                budget=wcb_conf.F_Path_Order_Time, reorder=reorder, reverse=reverse )
+        self.planMoves.append( moves )
+        self.svgPathOrder = self.pathOrder + ':' + ','.join( str( count ) for count in self.planMoves )
+        self.travelBefore += before
+        self.travelSaved += before - after
+        if order:
+            self.planEnd = tuple( paths[order[-1]][-1] )
+        return order
+
+    def plotPlannedPaths( self ):
+        '''Paint the paths collected from the current layer, in a planned order.'''
+        paths = self.plannedPaths
+        self.plannedPaths = []
+        if ( not paths ) or self.bStopped:
+            return
+        order = self.planPathOrder( paths )
+        strokes = [paths[index] for index in order]
+        if 'join' in self.pathOrderSettings:
+            strokes = wcb_paths.joinPaths( strokes, wcb_conf.N_Join_Tolerance / self.stepsPerPx )
+            self.liftsSaved += len( order ) - len( strokes )
+
+        plotCurrentLayer = self.plotCurrentLayer
+        self.plotCurrentLayer = True    # The paths were collected from a layer that is being painted.
+        for stroke in strokes:
+            if self.bStopped:
+                break
+            if not self.countPath():
+                continue
+            self.subpathIndex = 0
+            self.vertexIndex = 0
+            if (self.BrushColor != self.LayerPaintColor) or (self.BrushColor < 0):
+                self.PaintToolChange(self.LayerPaintColor)
+            self.xBoundsMax = wcb_conf.N_PAGE_WIDTH
+            self.xBoundsMin = 0
+            self.yBoundsMax = wcb_conf.N_PAGE_HEIGHT
+            self.yBoundsMin = 0
+            start = 0
+            if self.resumeSegment is not None:
+                start = self.resumeSegment[1]
+            self.plotSubpath( stroke, start )
+            if ( not self.bStopped ):
+                self.svgLastPath = self.pathcount
+                self.svgLastPathNC = self.nodeCount
+                self.saveCheckpoint( self.layerResumePoint )
+                if self.recorder is not None:
+                    self.recorder.markPath( self.pathcount, self.nodeCount )
+        self.penUp()
+        self.plotCurrentLayer = plotCurrentLayer
 
     def recursivelyTraverseSvg( self, aNodeList,
             matCurrent=[[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]],
@@ -839,9 +1463,14 @@ class WCB( inkex.Effect ):
         handled include text.  Unhandled elements should be converted to
         paths in Inkscape.
         """
-        for node in aNodeList:
+        depth = len( self.traversalPosition )
+        self.traversalPosition.append( 0 )
+        for index, node in enumerate( aNodeList ):
             if self.bStopped:
-                return
+                break
+            self.traversalPosition[depth] = index
+            if ( self.seekPosition is not None ) and ( not self.seekNode( index, depth ) ):
+                continue    # Painted before the plot was paused
             # Ignore invisible nodes
             v = node.get( 'visibility', parent_visibility )
             if v == 'inherit':
@@ -850,7 +1479,7 @@ class WCB( inkex.Effect ):
                 pass
 
             # first apply the current matrix transform to this node's transform
-            matNew = simpletransform.composeTransform( matCurrent, simpletransform.parseTransform( node.get( "transform" ) ) )
+            matNew = wcb_geometry.composeTransform( matCurrent, wcb_geometry.parseTransform( node.get( "transform" ) ) )
 
             if (node.getparent() == self.svg):
                 #Handle special case of Top-level object found
@@ -876,9 +1505,14 @@ class WCB( inkex.Effect ):
 
                 self.penUp()
                 if ( node.get( inkex.addNS( 'groupmode', 'inkscape' ) ) == 'layer' ): 
+                    self.plotPlannedPaths()    # Finish the previous layer before changing settings
+                    if self.pathOrder:
+                        self.layerResumePoint = self.resumePoint()
                     self.sCurrentLayerName = node.get( inkex.addNS( 'label', 'inkscape' ) )
 #                    self.DoWePlotLayer( node.get( inkex.addNS( 'label', 'inkscape' ) ) )
                     self.DoWePlotLayer( self.sCurrentLayerName )
+                    if ( self.estimator is not None ) and self.plotCurrentLayer:
+                        self.estimator.setLayer( self.sCurrentLayerName )
 
 
                 self.recursivelyTraverseSvg( node, matNew, parent_visibility=v )            
@@ -886,10 +1520,11 @@ class WCB( inkex.Effect ):
             elif node.tag == inkex.addNS( 'use', 'svg' ) or node.tag == 'use':
 
                 # A <use> element refers to another SVG element via an xlink:href="#blah"
-                # attribute.  We will handle the element by doing an XPath search through
-                # the document, looking for the element with the matching id="blah"
-                # attribute.  We then recursively process that element after applying
-                # any necessary (x,y) translation.
+                # attribute.  We will handle the element by looking up the element with
+                # the matching id="blah" attribute in the id index.  We then recursively
+                # process that element after applying any necessary (x,y) translation.
+                # The element is processed as an instance: in its own coordinates, so
+                # that path geometry can be flattened once and reused by every clone.
                 #
                 # Notes:
                 #  1. We ignore the height and width attributes as they do not apply to
@@ -901,18 +1536,22 @@ class WCB( inkex.Effect ):
                 refid = node.get( inkex.addNS( 'href', 'xlink' ) )
                 if refid:
                     # [1:] to ignore leading '#' in reference
-                    path = '//*[@id="%s"]' % refid[1:]
-                    refnode = node.xpath( path )
+                    refnode = self.elementsById( refid[1:] )
                     if refnode:
                         x = float( node.get( 'x', '0' ) )
                         y = float( node.get( 'y', '0' ) )
                         # Note: the transform has already been applied
                         if ( x != 0 ) or (y != 0 ):
-                            matNew2 = simpletransform.composeTransform( matNew, simpletransform.parseTransform( 'translate(%f,%f)' % (x,y) ) )
+                            matNew2 = wcb_geometry.composeTransform( matNew, [[1.0, 0.0, x], [0.0, 1.0, y]] )
                         else:
                             matNew2 = matNew
                         v = node.get( 'visibility', v )
-                        self.recursivelyTraverseSvg( refnode, matNew2, parent_visibility=v )
+                        instanceTransform = self.instanceTransform
+                        self.instanceTransform = self.documentTransform( matNew2 )
+                        try:
+                            self.recursivelyTraverseSvg( refnode, [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]], parent_visibility=v )
+                        finally:
+                            self.instanceTransform = instanceTransform
                     else:
                         pass
                 else:
@@ -920,238 +1559,41 @@ class WCB( inkex.Effect ):
 
             elif node.tag == inkex.addNS( 'path', 'svg' ):
 
-                # if we're in resume mode AND self.pathcount < self.svgLastPath,
-                #    then skip over this path.
-                # if we're in resume mode and self.pathcount = self.svgLastPath,
-                #    then start here, and set self.nodeCount equal to self.svgLastPathNC
-                
-                doWePlotThisPath = False 
-                if (self.resumeMode): 
-                    if (self.pathcount < self.svgLastPath_Old ): 
-                        #This path was *completely plotted* already; skip.
-                        self.pathcount += 1 
-                    elif (self.pathcount == self.svgLastPath_Old ): 
-                        #this path is the first *not completely* plotted path:
-                        self.nodeCount =  self.svgLastPathNC_Old    #Nodecount after last completed path
-                        doWePlotThisPath = True 
-                else:
-                    doWePlotThisPath = True
-                if (doWePlotThisPath):
-                    self.pathcount += 1
+                if self.doWePlotThisPath():
                     self.plotPath( node, matNew )
                 
             elif node.tag == inkex.addNS( 'rect', 'svg' ) or node.tag == 'rect':
 
-                # Manually transform 
-                #    <rect x="X" y="Y" width="W" height="H"/> 
-                # into 
-                #    <path d="MX,Y lW,0 l0,H l-W,0 z"/> 
-                # I.e., explicitly draw three sides of the rectangle and the
-                # fourth side implicitly
+                # Paint the outline of the rectangle; rounded corners (rx, ry) are ignored.
 
-                 
-                # if we're in resume mode AND self.pathcount < self.svgLastPath,
-                #    then skip over this path.
-                # if we're in resume mode and self.pathcount = self.svgLastPath,
-                #    then start here, and set
-                # self.nodeCount equal to self.svgLastPathNC
-                
-                doWePlotThisPath = False 
-                if (self.resumeMode): 
-                    if (self.pathcount < self.svgLastPath_Old ): 
-                        #This path was *completely plotted* already; skip.
-                        self.pathcount += 1 
-                    elif (self.pathcount == self.svgLastPath_Old ): 
-                        #this path is the first *not completely* plotted path:
-                        self.nodeCount =  self.svgLastPathNC_Old    #Nodecount after last completed path
-                        doWePlotThisPath = True 
-                else:
-                    doWePlotThisPath = True
-                if (doWePlotThisPath):
-                    self.pathcount += 1
-                    # Create a path with the outline of the rectangle
-                    newpath = inkex.etree.Element( inkex.addNS( 'path', 'svg' ) )
-                    x = float( node.get( 'x' ) )
-                    y = float( node.get( 'y' ) )
-                    w = float( node.get( 'width' ) )
-                    h = float( node.get( 'height' ) )
-                    s = node.get( 'style' )
-                    if s:
-                        newpath.set( 'style', s )
-                    t = node.get( 'transform' )
-                    if t:
-                        newpath.set( 'transform', t )
-                    a = []
-                    a.append( ['M ', [x, y]] )
-                    a.append( [' l ', [w, 0]] )
-                    a.append( [' l ', [0, h]] )
-                    a.append( [' l ', [-w, 0]] )
-                    a.append( [' Z', []] )
-                    newpath.set( 'd', simplepath.formatPath( a ) )
-                    self.plotPath( newpath, matNew )
+                if self.doWePlotThisPath() and self.plotCurrentLayer:
+                    self.plotSubpaths( wcb_geometry.rectangle( float( node.get( 'x', '0' ) ),
+                        float( node.get( 'y', '0' ) ), float( node.get( 'width' ) ),
+                        float( node.get( 'height' ) ), self.documentTransform( matNew ) ) )
                     
             elif node.tag == inkex.addNS( 'line', 'svg' ) or node.tag == 'line':
 
-                # Convert
-                #
-                #   <line x1="X1" y1="Y1" x2="X2" y2="Y2/>
-                #
-                # to
-                #
-                #   <path d="MX1,Y1 LX2,Y2"/>
-
-                # if we're in resume mode AND self.pathcount < self.svgLastPath,
-                #    then skip over this path.
-                # if we're in resume mode and self.pathcount = self.svgLastPath,
-                #    then start here, and set
-                # self.nodeCount equal to self.svgLastPathNC
-
-                doWePlotThisPath = False 
-                if (self.resumeMode): 
-                    if (self.pathcount < self.svgLastPath_Old ): 
-                        #This path was *completely plotted* already; skip.
-                        self.pathcount += 1 
-                    elif (self.pathcount == self.svgLastPath_Old ): 
-                        #this path is the first *not completely* plotted path:
-                        self.nodeCount =  self.svgLastPathNC_Old    #Nodecount after last completed path
-                        doWePlotThisPath = True 
-                else:
-                    doWePlotThisPath = True
-                if (doWePlotThisPath):
-                    self.pathcount += 1
-                    # Create a path to contain the line
-                    newpath = inkex.etree.Element( inkex.addNS( 'path', 'svg' ) )
-                    x1 = float( node.get( 'x1' ) )
-                    y1 = float( node.get( 'y1' ) )
-                    x2 = float( node.get( 'x2' ) )
-                    y2 = float( node.get( 'y2' ) )
-                    s = node.get( 'style' )
-                    if s:
-                        newpath.set( 'style', s )
-                    t = node.get( 'transform' )
-                    if t:
-                        newpath.set( 'transform', t )
-                    a = []
-                    a.append( ['M ', [x1, y1]] )
-                    a.append( [' L ', [x2, y2]] )
-                    newpath.set( 'd', simplepath.formatPath( a ) )
-                    self.plotPath( newpath, matNew )
-                    
-
-            elif node.tag == inkex.addNS( 'polyline', 'svg' ) or node.tag == 'polyline':
+                if self.doWePlotThisPath() and self.plotCurrentLayer:
+                    self.plotSubpaths( wcb_geometry.line( float( node.get( 'x1', '0' ) ),
+                        float( node.get( 'y1', '0' ) ), float( node.get( 'x2', '0' ) ),
+                        float( node.get( 'y2', '0' ) ), self.documentTransform( matNew ) ) )
 
-                # Convert
-                #  <polyline points="x1,y1 x2,y2 x3,y3 [...]"/> 
-                # to 
-                #   <path d="Mx1,y1 Lx2,y2 Lx3,y3 [...]"/> 
-                # Note: we ignore polylines with no points
-
-                pl = node.get( 'points', '' ).strip()
-                if pl == '':
-                    pass
+            elif node.tag == inkex.addNS( 'polyline', 'svg' ) or node.tag == 'polyline' or \
+                node.tag == inkex.addNS( 'polygon', 'svg' ) or node.tag == 'polygon':
 
-                #if we're in resume mode AND self.pathcount < self.svgLastPath, then skip over this path.
-                #if we're in resume mode and self.pathcount = self.svgLastPath, then start here, and set
-                # self.nodeCount equal to self.svgLastPathNC
-                
-                doWePlotThisPath = False 
-                if (self.resumeMode): 
-                    if (self.pathcount < self.svgLastPath_Old ): 
-                        #This path was *completely plotted* already; skip.
-                        self.pathcount += 1 
-                    elif (self.pathcount == self.svgLastPath_Old ): 
-                        #this path is the first *not completely* plotted path:
-                        self.nodeCount =  self.svgLastPathNC_Old    #Nodecount after last completed path
-                        doWePlotThisPath = True 
-                else:
-                    doWePlotThisPath = True
-                if (doWePlotThisPath):
-                    self.pathcount += 1
-                    
-                    pa = pl.split()
-                    if not len( pa ):
-                        continue
-                    # Issue 29: pre 2.5.? versions of Python do not have
-                    #    "statement-1 if expression-1 else statement-2"
-                    # which came out of PEP 308, Conditional Expressions
-                    #d = "".join( ["M " + pa[i] if i == 0 else " L " + pa[i] for i in range( 0, len( pa ) )] )
-                    d = "M " + pa[0]
-                    for i in range( 1, len( pa ) ):
-                        d += " L " + pa[i]
-                    newpath = inkex.etree.Element( inkex.addNS( 'path', 'svg' ) )
-                    newpath.set( 'd', d );
-                    s = node.get( 'style' )
-                    if s:
-                        newpath.set( 'style', s )
-                    t = node.get( 'transform' )
-                    if t:
-                        newpath.set( 'transform', t )
-                    self.plotPath( newpath, matNew )
-
-            elif node.tag == inkex.addNS( 'polygon', 'svg' ) or node.tag == 'polygon':
-
-                # Convert 
-                #  <polygon points="x1,y1 x2,y2 x3,y3 [...]"/> 
-                # to 
-                #   <path d="Mx1,y1 Lx2,y2 Lx3,y3 [...] Z"/> 
-                # Note: we ignore polygons with no points
-
-                pl = node.get( 'points', '' ).strip()
-                if pl == '':
-                    pass
+                # A polygon is a polyline that returns to its first point.
+                # Note: we ignore polylines and polygons with no points
 
-                #if we're in resume mode AND self.pathcount < self.svgLastPath, then skip over this path.
-                #if we're in resume mode and self.pathcount = self.svgLastPath, then start here, and set
-                # self.nodeCount equal to self.svgLastPathNC
-
-                doWePlotThisPath = False 
-                if (self.resumeMode): 
-                    if (self.pathcount < self.svgLastPath_Old ): 
-                        #This path was *completely plotted* already; skip.
-                        self.pathcount += 1 
-                    elif (self.pathcount == self.svgLastPath_Old ): 
-                        #this path is the first *not completely* plotted path:
-                        self.nodeCount =  self.svgLastPathNC_Old    #Nodecount after last completed path
-                        doWePlotThisPath = True 
-                else:
-                    doWePlotThisPath = True
-                if (doWePlotThisPath):
-                    self.pathcount += 1
-                    
-                    pa = pl.split()
-                    if not len( pa ):
-                        continue
-                    # Issue 29: pre 2.5.? versions of Python do not have
-                    #    "statement-1 if expression-1 else statement-2"
-                    # which came out of PEP 308, Conditional Expressions
-                    #d = "".join( ["M " + pa[i] if i == 0 else " L " + pa[i] for i in range( 0, len( pa ) )] )
-                    d = "M " + pa[0]
-                    for i in range( 1, len( pa ) ):
-                        d += " L " + pa[i]
-                    d += " Z"
-                    newpath = inkex.etree.Element( inkex.addNS( 'path', 'svg' ) )
-                    newpath.set( 'd', d );
-                    s = node.get( 'style' )
-                    if s:
-                        newpath.set( 'style', s )
-                    t = node.get( 'transform' )
-                    if t:
-                        newpath.set( 'transform', t )
-                    self.plotPath( newpath, matNew )
+                if self.doWePlotThisPath() and self.plotCurrentLayer:
+                    closed = node.tag == inkex.addNS( 'polygon', 'svg' ) or node.tag == 'polygon'
+                    self.plotSubpaths( wcb_geometry.polyline(
+                        wcb_geometry.parsePoints( node.get( 'points', '' ) ), self.documentTransform( matNew ), closed ) )
                     
             elif node.tag == inkex.addNS( 'ellipse', 'svg' ) or \
                 node.tag == 'ellipse' or \
                 node.tag == inkex.addNS( 'circle', 'svg' ) or \
                 node.tag == 'circle':
 
-                    # Convert circles and ellipses to a path with two 180 degree arcs.
-                    # In general (an ellipse), we convert 
-                    #   <ellipse rx="RX" ry="RY" cx="X" cy="Y"/> 
-                    # to 
-                    #   <path d="MX1,CY A RX,RY 0 1 0 X2,CY A RX,RY 0 1 0 X1,CY"/> 
-                    # where 
-                    #   X1 = CX - RX
-                    #   X2 = CX + RX 
                     # Note: ellipses or circles with a radius attribute of value 0 are ignored
 
                     if node.tag == inkex.addNS( 'ellipse', 'svg' ) or node.tag == 'ellipse':
@@ -1160,46 +1602,11 @@ class WCB( inkex.Effect ):
                     else:
                         rx = float( node.get( 'r', '0' ) )
                         ry = rx
-                    if rx == 0 or ry == 0:
-                        pass
-
                     
-                    #if we're in resume mode AND self.pathcount < self.svgLastPath, then skip over this path.
-                    #if we're in resume mode and self.pathcount = self.svgLastPath, then start here, and set
-                    # self.nodeCount equal to self.svgLastPathNC
-                    
-                    doWePlotThisPath = False 
-                    if (self.resumeMode): 
-                        if (self.pathcount < self.svgLastPath_Old ): 
-                            #This path was *completely plotted* already; skip.
-                            self.pathcount += 1 
-                        elif (self.pathcount == self.svgLastPath_Old ): 
-                            #this path is the first *not completely* plotted path:
-                            self.nodeCount =  self.svgLastPathNC_Old    #Nodecount after last completed path
-                            doWePlotThisPath = True 
-                    else:
-                        doWePlotThisPath = True
-                    if (doWePlotThisPath):
-                        self.pathcount += 1
-                    
-                        cx = float( node.get( 'cx', '0' ) )
-                        cy = float( node.get( 'cy', '0' ) )
-                        x1 = cx - rx
-                        x2 = cx + rx
-                        d = 'M %f,%f ' % ( x1, cy ) + \
-                            'A %f,%f ' % ( rx, ry ) + \
-                            '0 1 0 %f,%f ' % ( x2, cy ) + \
-                            'A %f,%f ' % ( rx, ry ) + \
-                            '0 1 0 %f,%f' % ( x1, cy )
-                        newpath = inkex.etree.Element( inkex.addNS( 'path', 'svg' ) )
-                        newpath.set( 'd', d );
-                        s = node.get( 'style' )
-                        if s:
-                            newpath.set( 'style', s )
-                        t = node.get( 'transform' )
-                        if t:
-                            newpath.set( 'transform', t )
-                        self.plotPath( newpath, matNew )
+                    if self.doWePlotThisPath() and self.plotCurrentLayer:
+                        self.plotSubpaths( wcb_geometry.ellipse( float( node.get( 'cx', '0' ) ),
+                            float( node.get( 'cy', '0' ) ), rx, ry, self.documentTransform( matNew ),
+                            self.options.smoothness ) )
                         
                             
             elif node.tag == inkex.addNS( 'metadata', 'svg' ) or node.tag == 'metadata':
@@ -1270,8 +1677,222 @@ class WCB( inkex.Effect ):
                         '> object, please convert it to a path first.' ) )
                     self.warnings[str( node.tag )] = 1
                 pass
+        self.traversalPosition.pop()
+
+    def resumePoint( self ):
+        '''
+        The state needed to pick up the traversal at the current node, as if everything
+        before it had been traversed: its position (the index of the node and of each of
+        its ancestors, among their siblings), the path count so far, the number of layers
+        ordered so far and where the last one ended, and the current layer's name.
+        '''
+        return ( list( self.traversalPosition ), self.pathcount, len( self.planMoves ), self.planEnd,
+            self.sCurrentLayerName )
 
+    def saveCheckpoint( self, resumePoint ):
+        '''
+        Keep [resumePoint] as the checkpoint, on finishing a path, and record the progress
+        in the journal. The drawing is hashed when the WCB data is saved.
+        '''
+        self.svgCheckpoint = self.formatResumePoint( resumePoint )
+        self.svgDrawingHash = None
+        self.recordProgress( self.nodeCount, self.fCurrX - wcb_conf.F_StartPos_X,
+            self.fCurrY - wcb_conf.F_StartPos_Y, '0,0' )
+
+    def formatResumePoint( self, resumePoint ):
+        '''
+        A resume point as saved in the WCB data: position, path count, layers ordered and
+        where the last ended, and layer name, separated by colons (as "3.0.12:57:0:0.0,0.0:1 Blue").
+        '''
+        if resumePoint is None:
+            return ''
+        position, pathcount, planIndex, planEnd, layerName = resumePoint
+        fields = ['.'.join( str( index ) for index in position ), str( pathcount ), str( planIndex ),
+            '{0!r},{1!r}'.format( float( planEnd[0] ), float( planEnd[1] ) )]
+        if layerName is not None:
+            fields.append( layerName )
+        return ':'.join( fields )
+
+    def parseResumePoint( self, checkpoint ):
+        '''The resume point saved as [checkpoint] by formatResumePoint(), or None if there is none.'''
+        fields = checkpoint.split( ':', 4 )
+        if len( fields ) < 4:
+            return None
+        try:
+            position = [int( index ) for index in fields[0].split( '.' )]
+            planEnd = tuple( float( value ) for value in fields[3].split( ',' ) )
+            resumePoint = ( position, int( fields[1] ), int( fields[2] ), planEnd,
+                fields[4] if len( fields ) > 4 else None )
+        except ValueError:
+            return None
+        if len( planEnd ) != 2:
+            return None
+        return resumePoint
+
+    def drawingHash( self ):
+        '''
+        A hash of the drawing: the document, less the WCB data and Inkscape's view
+        settings. A checkpoint is only used with the drawing that it was saved for.
+        '''
+        if self.documentHash is not None:
+            return self.documentHash    # The drawing does not change while plotting
+        digest = hashlib.sha1()
+        for name in ( 'width', 'height', 'viewBox', 'preserveAspectRatio' ):
+            digest.update( '{0}={1};'.format( name, self.svg.get( name ) ).encode( 'utf-8' ) )
+        for node in self.svg:
+            if node.tag in ( 'WCB', inkex.addNS( 'WCB', 'svg' ), 'eggbot', inkex.addNS( 'eggbot', 'svg' ),
+                    inkex.addNS( 'namedview', 'sodipodi' ), inkex.addNS( 'metadata', 'svg' ) ):
+                continue
+            digest.update( etree.tostring( node ) )
+        self.documentHash = digest.hexdigest()[:16]
+        return self.documentHash
 
+    def journalFileName( self ):
+        return wcb_journal.journalFileName( wcb_conf.S_Journal_Dir, self.drawingHash() )
+
+    def startJournal( self, resuming ):
+        '''Start recording the plot's progress in its journal (see wcb_journal), if it is to have one.'''
+        if ( not wcb_conf.S_Journal_Dir ) or ( self.estimator is not None ):
+            return
+        journal = wcb_journal.PlotJournal( self.journalFileName(), self.drawingHash(),
+            wcb_conf.F_Journal_Sync_Interval )
+        try:
+            journal.start( resuming )
+        except ( IOError, OSError ) as err:
+            inkex.errormsg( 'Unable to start plot journal: ' + str( err ) )
+            return
+        self.journal = journal
+
+    def readJournal( self ):
+        '''
+        Take the paused plot's progress from its journal, if there is one and it is further
+        along than the WCB data (which is only kept if the document is saved). Returns True
+        if it did.
+        '''
+        if not wcb_conf.S_Journal_Dir:
+            return False
+        values = wcb_journal.readLastRecord( self.journalFileName(), self.drawingHash() )
+        if values is None:
+            return False
+        try:
+            layer = int( values['layer'] )
+            nodeCount = int( values['node'] )
+            lastPath = int( values['lastpath'] )
+            lastPathNC = int( values['lastpathnc'] )
+            lastKnownPos = ( float( values['lastknownposx'] ), float( values['lastknownposy'] ) )
+            pausedPos = ( float( values['pausedposx'] ), float( values['pausedposy'] ) )
+            pathOrder = str( values['pathorder'] )
+            checkpoint = str( values['checkpoint'] )
+            segment = str( values.get( 'segment', '' ) )
+            brushColor = int( values.get( 'brushcolor', -1 ) )
+            paintDist = float( values.get( 'paintdist', 0.0 ) )
+            layerSettings = str( values.get( 'layersettings', '' ) )
+        except ( KeyError, TypeError, ValueError ):
+            return False
+        if ( lastPath, nodeCount ) <= ( self.svgLastPath_Old, self.svgNodeCount_Old ):
+            return False    # The document is as recent, and knows of any move since (see journalCarriagePosition())
+        self.svgLayer_Old = layer
+        self.svgNodeCount_Old = nodeCount
+        self.svgLastPath_Old = lastPath
+        self.svgLastPathNC_Old = lastPathNC
+        self.svgLastKnownPosX_Old, self.svgLastKnownPosY_Old = lastKnownPos
+        self.svgPausedPosX_Old, self.svgPausedPosY_Old = pausedPos
+        self.svgPathOrder_Old = pathOrder
+        self.svgCheckpoint_Old = checkpoint
+        self.svgSegment_Old = segment
+        self.svgBrushColor_Old = brushColor
+        self.svgPaintDist_Old = paintDist
+        self.svgLayerSettings_Old = layerSettings
+        self.svgDrawingHash_Old = self.drawingHash()
+        return True
+
+    def recordProgress( self, nodeCount, pausedPosX, pausedPosY, segment, sync=False ):
+        '''
+        Append the values that the WCB data would have, if the plot were paused now
+        at [nodeCount], ([pausedPosX], [pausedPosY]) and [segment], to the journal.
+        '''
+        if self.journal is None:
+            return
+        try:
+            self.journal.record( { 'layer': self.svgLayer, 'node': nodeCount,
+                'lastpath': self.svgLastPath, 'lastpathnc': self.svgLastPathNC,
+                'lastknownposx': self.svgLastKnownPosX, 'lastknownposy': self.svgLastKnownPosY,
+                'pausedposx': pausedPosX, 'pausedposy': pausedPosY,
+                'pathorder': self.svgPathOrder, 'checkpoint': self.svgCheckpoint, 'segment': segment,
+                'brushcolor': self.BrushColor, 'paintdist': self.paintdist,
+                'layersettings': self.layerSettings() }, sync )
+        except ( IOError, OSError ) as err:
+            inkex.errormsg( 'Unable to write plot journal: ' + str( err ) )
+            self.journal = None
+
+    def journalCarriagePosition( self ):
+        '''
+        After the carriage has been moved outside of a plot (home, or by a manual command),
+        note where it is now in the journal of the paused plot, if there is one, so that
+        resuming from the journal does not start from where the plot left it.
+        '''
+        if ( not wcb_conf.S_Journal_Dir ) or ( self.estimator is not None ):
+            return
+        values = wcb_journal.readLastRecord( self.journalFileName(), self.drawingHash() )
+        if values is None:
+            return
+        values['lastknownposx'] = self.svgLastKnownPosX
+        values['lastknownposy'] = self.svgLastKnownPosY
+        journal = wcb_journal.PlotJournal( self.journalFileName(), self.drawingHash(),
+            wcb_conf.F_Journal_Sync_Interval )
+        try:
+            journal.start( resuming=True )
+            journal.record( values, sync=True )
+            journal.close()
+        except ( IOError, OSError ) as err:
+            inkex.errormsg( 'Unable to write plot journal: ' + str( err ) )
+
+    def closeJournal( self ):
+        if self.journal is None:
+            return
+        try:
+            self.journal.close()
+        except ( IOError, OSError ) as err:
+            inkex.errormsg( 'Unable to write plot journal: ' + str( err ) )
+        self.journal = None
+
+    def finishJournal( self ):
+        '''Delete the journal, once the plot is finished.'''
+        if self.journal is None:
+            return
+        try:
+            self.journal.remove()
+        except ( IOError, OSError ):
+            pass
+        self.journal = None
+
+    def seekCheckpoint( self ):
+        '''
+        When resuming, skip ahead to the saved checkpoint (if it is for this drawing), rather
+        than traversing every path before it. Without one, everything is traversed and the
+        paths already painted are counted off, as before.
+        '''
+        self.resumeCheckpoint = self.parseResumePoint( self.svgCheckpoint_Old )
+        if ( self.resumeCheckpoint is None ) or ( self.svgDrawingHash_Old != self.drawingHash() ):
+            return
+        self.seekPosition = self.resumeCheckpoint[0]
+
+    def seekNode( self, index, depth ):
+        '''
+        While skipping ahead to a checkpoint: should the node at [index], [depth] levels
+        down, be traversed? Those before the checkpoint (or its ancestors) are not.
+        '''
+        target = self.seekPosition[depth]
+        if index < target:
+            return False
+        if ( index > target ) or ( depth == len( self.seekPosition ) - 1 ):
+            # At the checkpoint (or past where it should have been): carry on from its state.
+            unused_position, self.pathcount, planIndex, self.planEnd, layerName = self.resumeCheckpoint
+            self.planMoves = self.planMoves_Old[:planIndex]
+            self.seekPosition = None
+            if layerName is not None:
+                self.DoWePlotLayer( layerName )
+        return True
 
     def DoWePlotLayer( self, strLayerName ):
         """
@@ -1290,7 +1911,8 @@ class WCB( inkex.Effect ):
         
         Secondary function: Parse characters following the layer number (if any) to see if
         there is a "+H" or "+S" escape code, that indicates that overrides the pen-down
-        height or speed for the given layer. We also check for the "%" leading character,
+        height or speed for the given layer. "+A1" or "+A0" turns planned acceleration
+        on or off for the layer. We also check for the "%" leading character,
         which indicates a layer that should be skipped.
         """
         #self.options.autoChange
@@ -1345,6 +1967,7 @@ class WCB( inkex.Effect ):
             #set default values before checking for any overrides:    
             self.LayerOverridePenDownHeight = False
             self.LayerOverrideSpeed = False
+            self.LayerOverrideAccel = False
             self.LayerPenDownPosition = -1
             self.LayerPenDownSpeed = -1
 
@@ -1354,7 +1977,7 @@ class WCB( inkex.Effect ):
             if MaxLength > stringPos + 2:
                 while stringPos <= MaxLength:    
                     EscapeSequence = CurrentLayerName[stringPos:stringPos+2].lower()
-                    if (EscapeSequence == "+h") or (EscapeSequence == "+s"):
+                    if (EscapeSequence == "+h") or (EscapeSequence == "+s") or (EscapeSequence == "+a"):
                         paramStart = stringPos + 2
                         stringPos = stringPos + 3
                         TempNumString = 'x'
@@ -1377,6 +2000,11 @@ class WCB( inkex.Effect ):
                                 if ((parameterInt > 0) and (parameterInt <= 100)):
                                     self.LayerOverrideSpeed = True
                                     self.LayerPenDownSpeed = parameterInt
+
+                            if (EscapeSequence == "+a"):
+                                if ((parameterInt == 0) or (parameterInt == 1)):
+                                    self.LayerOverrideAccel = True
+                                    self.LayerAccelEnable = (parameterInt == 1)
                                     
                         stringPos = paramStart + len(TempNumString)
                     else:
@@ -1390,78 +2018,236 @@ class WCB( inkex.Effect ):
 
 
 
+    def layerSettings( self ):
+        '''
+        The overrides parsed from the name of the layer being painted, as saved in the
+        WCB data: "height,speed,acceleration", each -1 if not overridden.
+        '''
+        accel = -1
+        if self.LayerOverrideAccel:
+            accel = int( self.LayerAccelEnable )
+        return '{0},{1},{2}'.format( self.LayerPenDownPosition, self.LayerPenDownSpeed, accel )
+
+    def restoreLayerSettings( self, text ):
+        '''
+        Put back the layer overrides saved by layerSettings(), so that the pen height and
+        speed are set for the layer from the start of a resumed plot. When the layer is
+        reached, DoWePlotLayer() finds them unchanged, and sets up nothing again.
+        '''
+        try:
+            height, speed, accel = [int( value ) for value in text.split( ',' )]
+        except ValueError:
+            return
+        self.LayerPenDownPosition = height
+        self.LayerOverridePenDownHeight = ( height >= 0 )
+        self.LayerPenDownSpeed = speed
+        self.LayerOverrideSpeed = ( speed >= 0 )
+        self.LayerOverrideAccel = ( accel >= 0 )
+        self.LayerAccelEnable = ( accel == 1 )
+
     def plotPath( self, path, matTransform ):
         '''
         Plot the path while applying the transformation defined
         by the matrix [matTransform].
         '''
-        # turn this path into a cubicsuperpath (list of beziers)...
+        if not self.plotCurrentLayer:
+            return
+        if self.instanceTransform is None:
+            self.plotSubpaths( self.flattenPath( path.get( 'd' ), matTransform ) )
+            return
 
+        # In a clone, [matTransform] is relative to the cloned element. Flatten the path in
+        # those coordinates, finely enough for the clone's scale, once for all clones that
+        # share the same scale; then just transform the vertices for each clone.
+        a, c, unused_e = self.instanceTransform[0]
+        b, d, unused_f = self.instanceTransform[1]
+        scale = wcb_geometry.maximumScale( a, b, c, d )
+        smoothness = self.options.smoothness
+        if scale > 0:
+            smoothness /= scale
         d = path.get( 'd' )
-        if len( simplepath.parsePath( d ) ) == 0:
+        key = ( d, tuple( matTransform[0] ) + tuple( matTransform[1] ), smoothness )
+        subpaths = self.instanceGeometry.get( key )
+        if subpaths is None:
+            subpaths = self.flattenPath( d, matTransform, smoothness )
+            self.instanceGeometry[key] = subpaths
+        self.plotSubpaths( [wcb_geometry.transformPoints( self.instanceTransform, vertices )
+            for vertices in subpaths] )
+
+    def documentTransform( self, matTransform ):
+        '''
+        [matTransform] as a transform of the document, for an element within a clone
+        (when it is relative to the cloned element) or not.
+        '''
+        if self.instanceTransform is None:
+            return matTransform
+        return wcb_geometry.composeTransform( self.instanceTransform, matTransform )
+
+    def elementsById( self, elementId ):
+        '''The elements with id [elementId], in document order, from an index made once per run.'''
+        if self.idIndex is None:
+            self.idIndex = {}
+            for element in self.svg.iter():
+                nodeId = element.get( 'id' ) if isinstance( element.tag, str ) else None
+                if nodeId is not None:
+                    self.idIndex.setdefault( nodeId, [] ).append( element )
+        return self.idIndex.get( elementId, [] )
+
+    def plotSubpaths( self, subpaths ):
+        '''
+        Paint a path, or any path-like element, given as a list of subpaths (each a
+        list of [x, y] vertices), or collect its subpaths for ordering.
+        '''
+        if not self.ignoreLimits:
+            subpaths = self.clipSubpaths( subpaths )
+        if not subpaths:
             return
+        if self.options.simplify:
+            subpaths = self.simplifySubpaths( subpaths )
 
-        if self.plotCurrentLayer:
-            if (self.BrushColor != self.LayerPaintColor) or (self.BrushColor < 0):
-                self.PaintToolChange(self.LayerPaintColor)
-                
-            # reset page bounds for plotting:
-            self.xBoundsMax = wcb_conf.N_PAGE_WIDTH
-            self.xBoundsMin = 0
-            self.yBoundsMax = wcb_conf.N_PAGE_HEIGHT
-            self.yBoundsMin = 0
-    
-            p = cubicsuperpath.parsePath( d )
-    
-            # ...and apply the transformation to each point
-            simpletransform.applyTransformToPath( matTransform, p )
+        if self.pathOrder:
+            self.plannedPaths.extend( subpaths )
+            return
 
-            # p is now a list of lists of cubic beziers [control pt1, control pt2, endpoint]
-            # where the start-point is the last point in the previous segment.
-            for sp in p:
+        self.subpathIndex = 0
+        self.vertexIndex = 0
+        if (self.BrushColor != self.LayerPaintColor) or (self.BrushColor < 0):
+            self.PaintToolChange(self.LayerPaintColor)
             
-                plot_utils.subdivideCubicPath( sp, self.options.smoothness )
-                nIndex = 0
-    
-                for csp in sp:
-    
-                    if self.bStopped:
-                        return
-    
-                    if self.plotCurrentLayer:
-                        if nIndex == 0:
-                            self.penUp()
-                            self.virtualPenIsUp = True
-                        elif nIndex == 1:
-                            self.penDown()
-                            self.virtualPenIsUp = False
-    
-                    nIndex += 1
-    
-                    self.fX = float( csp[1][0] )    # Set move destination
-                    self.fY = float( csp[1][1] )  
+        # reset page bounds for plotting:
+        self.xBoundsMax = wcb_conf.N_PAGE_WIDTH
+        self.xBoundsMin = 0
+        self.yBoundsMax = wcb_conf.N_PAGE_HEIGHT
+        self.yBoundsMin = 0
+
+        resumeSubpath, resumeVertex = self.resumeSegment or ( 0, 0 )
+        for index, vertices in enumerate( subpaths ):
+            if index < resumeSubpath:
+                self.nodeCount += len( vertices )    # Painted before the plot was paused
+                continue
+            self.subpathIndex = index
+            self.plotSubpath( vertices, resumeVertex if index == resumeSubpath else 0 )
+            if self.bStopped:
+                return
                     
+        if ( not self.bStopped ):    #an "index" for resuming plots quickly-- record last complete path
+            self.svgLastPath = self.pathcount #The number of the last path completed
+            self.svgLastPathNC = self.nodeCount #the node count after the last path was completed.            
+            self.saveCheckpoint( self.pathResumePoint )
+            if self.recorder is not None:
+                self.recorder.markPath( self.pathcount, self.nodeCount )
+
+    def clipSubpaths( self, subpaths ):
+        '''
+        Cut subpaths at the edges of the page, leaving out the parts beyond, rather
+        than painting them along the edge (as plotLineAndTime() would).
+        '''
+        clipped = []
+        for vertices in subpaths:
+            pieces = wcb_geometry.clipPolyline( vertices, 0, 0, wcb_conf.N_PAGE_WIDTH, wcb_conf.N_PAGE_HEIGHT )
+            if ( len( pieces ) != 1 ) or ( pieces[0] is not vertices ):
+                self.subpathsClipped += 1
+            clipped.extend( pieces )
+        return clipped
+
+    def simplifySubpaths( self, subpaths ):
+        '''
+        Leave out vertices that lie within wcb_conf.F_Simplify_Tolerance motor steps of the
+        straight line past them, at the present resolution: they would change the motor
+        moves by no more than that.
+        '''
+        tolerance = wcb_conf.F_Simplify_Tolerance / self.stepsPerPx
+        simplified = [wcb_paths.simplifyPath( vertices, tolerance ) for vertices in subpaths]
+        self.segmentsBefore += sum( len( vertices ) - 1 for vertices in subpaths )
+        self.segmentsAfter += sum( len( vertices ) - 1 for vertices in simplified )
+        return simplified
 
-                    if ( self.virtualPenIsUp ):        
-                        self.penUpRapidMove( self.fX, self.fY ) #Rapid pen-up movements
-                    else:
-                        self.plotLineAndTime( self.fX, self.fY ) #Draw a segment
+    def plotSubpath( self, vertices, start=0 ):
+        '''
+        Paint one subpath, given as a list of [x, y] vertices: move to the first, then paint.
+        When resuming, painting starts from vertex [start] instead; the vertices before it
+        are counted as nodes, as if painted.
+        '''
+        if start > 0:
+            self.nodeCount += start
+            vertices = vertices[start:]
 
-                        
-            if ( not self.bStopped ):    #an "index" for resuming plots quickly-- record last complete path
-                self.svgLastPath = self.pathcount #The number of the last path completed
-                self.svgLastPathNC = self.nodeCount #the node count after the last path was completed.            
-            
+        # With planned acceleration, find the speed (steps/s) at which to pass each vertex:
+        speeds = None
+        if self.paintAccelEnabled():
+            speeds = wcb_planner.junctionSpeeds( 
+                [( vertex[0] * self.stepsPerPx, vertex[1] * self.stepsPerPx ) for vertex in vertices],
+                self.BrushDownSpeed, self.BrushDownSpeed / wcb_conf.F_Paint_Accel_Factor,
+                wcb_conf.F_Junction_Deviation * self.stepsPerPx )
+        nIndex = 0
+
+        for vertex in vertices:
+
+            if self.bStopped:
+                return
+
+            if self.plotCurrentLayer:
+                if nIndex == 0:
+                    self.penUp()
+                    self.virtualPenIsUp = True
+                elif nIndex == 1:
+                    self.penDown()
+                    self.virtualPenIsUp = False
 
-    def plotLineAndTime( self, xDest, yDest ):
+            nIndex += 1
+            self.vertexIndex = start + nIndex - 1
+
+            self.fX = float( vertex[0] )    # Set move destination
+            self.fY = float( vertex[1] )  
+
+            if ( self.virtualPenIsUp ):        
+                self.penUpRapidMove( self.fX, self.fY ) #Rapid pen-up movements
+            elif ( speeds is not None ):
+                self.plotLineAndTime( self.fX, self.fY, speeds[nIndex - 2], speeds[nIndex - 1] )
+            else:
+                self.plotLineAndTime( self.fX, self.fY ) #Draw a segment
+
+    def flattenPath( self, d, matTransform, smoothness=None ):
+        '''
+        Parse path data [d], apply the transformation [matTransform], and subdivide
+        the curves into line segments, to [smoothness] (by default, the smoothness
+        option). Returns a list of subpaths, each a list of [x, y] vertices (the
+        points to plot); empty if [d] has no path data.
+        Results are kept in the geometry cache, if there is one.
+        '''
+        if smoothness is None:
+            smoothness = self.options.smoothness
+        key = None
+        if self.geometryCache is not None:
+            key = wcb_cache.cacheKey( d, matTransform, smoothness )
+            subpaths = self.geometryCache.get( key )
+            if subpaths is not None:
+                return subpaths
+
+        subpaths = []
+        simplePath = simplepath.parsePath( d )
+        if simplePath:
+            p = cubicsuperpath.CubicSuperPath( simplePath )    # turn this path into a cubicsuperpath (list of beziers)...
+            wcb_geometry.transformPath( matTransform, p )
+            for sp in p:
+                plot_utils.subdivideCubicPath( sp, smoothness )
+                subpaths.append( [csp[1] for csp in sp] )
+        if key is not None:
+            self.geometryCache.put( key, subpaths )
+        return subpaths
+
+    def plotLineAndTime( self, xDest, yDest, vStart=None, vEnd=None ):
         '''
         Send commands out the com port as a line segment (dx, dy) and a time (ms) the segment
         should take to implement.  
         Important note: Everything up to this point uses *pixel* scale. 
         Here, we convert from floating-point pixel scale to actual motor steps, w/ present DPI.
+        If entry and exit speeds (steps/s) are given, speed up and slow down between them,
+        as planned by wcb_planner.junctionSpeeds(); otherwise move at constant speed.
         '''
         
         maxSegmentDuration = 250.0  # Maximum time to spend painting a given segment
+        accelTimeSlice = 0.030      # (seconds): Length of each step in speed when accelerating
 
         if (self.ignoreLimits == False):
             if (xDest > self.xBoundsMax):    #Check machine size limit; truncate at edges
@@ -1495,36 +2281,28 @@ class WCB( inkex.Effect ):
             if self.resumeMode:
                 if ( self.nodeCount >= self.nodeTarget ):
                     self.resumeMode = False
-                    self.paintdist = 0
+                    if self.svgBrushColor_Old < 0:
+                        self.paintdist = 0    # Not saved; otherwise, as restored by resumePlotSetup()
 
                     if ( not self.virtualPenIsUp ):
                         self.penDown()
                         self.fSpeed = self.BrushDownSpeed
 
-            nTime =  10000.00 / self.fSpeed * plot_utils.distance( nDeltaX, nDeltaY )
-            nTime = int( math.ceil(nTime / 10.0))
+            if ( vStart is not None ) and ( vEnd is not None ):
+                moves = wcb_planner.sliceMove( nDeltaX, nDeltaY, vStart, vEnd, self.fSpeed,
+                    self.fSpeed / wcb_conf.F_Paint_Accel_Factor, accelTimeSlice, maxSegmentDuration )
+            else:
+                nTime =  10000.00 / self.fSpeed * plot_utils.distance( nDeltaX, nDeltaY )
+                nTime = int( math.ceil(nTime / 10.0))
+                moves = wcb_planner.constantSpeedMoves( nDeltaX, nDeltaY, nTime, maxSegmentDuration )
 
-            while ( ( abs( nDeltaX ) > 0 ) or ( abs( nDeltaY ) > 0 ) ):
+            for xd, yd, td in moves:
             
                 # Put re-inking *before* the movement here, so that we only do it if there's more painting. 
                 if (self.ReInkingNow == False):
                     if ((self.bPenIsUp == False) and (self.options.reInkEnable)):
                         if (self.paintdist > self.reInkDist):
                             self.reInkBrush() 
-            
-                xd = 0
-                yd = 0
-                                
-                if ( nTime > maxSegmentDuration ):
-                    xd = int( math.floor( ( maxSegmentDuration * nDeltaX ) / nTime ) )
-                    yd = int( math.floor( ( maxSegmentDuration * nDeltaY ) / nTime ) )
-                    td = int( maxSegmentDuration )
-                else:
-                    xd = nDeltaX
-                    yd = nDeltaY
-                    td = nTime
-                    if ( td < 1 ):
-                       td = 1        # don't allow zero-time moves.
 
                 if (not self.resumeMode) and (not self.bStopped):
                     if ( self.options.revMotor1 ):
@@ -1548,20 +2326,8 @@ class WCB( inkex.Effect ):
                     if (self.ReInkingNow == False):
                         if ((self.bPenIsUp == False) and (self.options.reInkEnable)):
                             self.paintdist += plot_utils.distance( xd, yd )
-                                            
-                nDeltaX -= xd
-                nDeltaY -= yd 
-                nTime -= td
-            strButton = ebb_motion.QueryPRGButton(self.serialPort)    #Query if button pressed    
-            if strButton[0] != '0':
-                self.svgNodeCount = self.nodeCount;
-                self.svgPausedPosX = self.fCurrX - wcb_conf.F_StartPos_X    #self.svgLastKnownPosX
-                self.svgPausedPosY = self.fCurrY - wcb_conf.F_StartPos_Y    #self.svgLastKnownPosY
-            
-                inkex.errormsg( 'Plot paused by button press after segment number ' + str( self.nodeCount ) + '.' )
-                inkex.errormsg( 'Use the "Resume" feature to continue.' )
-                self.bStopped = True
-                return
+
+            self.checkPauseButton( 'segment' )
                     
 
 
@@ -1619,93 +2385,11 @@ class WCB( inkex.Effect ):
                 if ( not self.virtualPenIsUp ):
                     self.penDown()    
 
-        # Declare arrays, all integers. 
-        # These are _normally_ 4-byte integers, but could (theoretically) be 2-byte integers on some systems.
-        #   if so, this could cause errors in rare cases (very large/long moves, etc.). 
-        # Set up an alert system, just in case!
-
-        durationArray = array('I') # unsigned integer for duration -- up to 65 seconds for a move if only 2 bytes.
-        distArray = array('f')    #float
-        destArray1 = array('i')    #signed integer
-        destArray2 = array('i')    #signed integer
-
-        if (destArray2.itemsize < 4):
-            self.warnDataSize = True
-
-        velocity = 0.0
-        timeElapsed = 0.0        
-        position = 0.0
-
-        # Speed _after_ acceleration interval:            
-        speedMax = accelRate * tAccel        
-        if ( speedMax > speedLimit ):
-            speedMax = speedLimit    # This move is longer than 2*tAccel; We will reach _full cruising speed_!
-            
-            intervals = int(math.floor(tAccel / timeSlice))    # Number of intervals each, during acceleration OR deceleration 
-            timePerInterval = tAccel / intervals            
-            #Add a center "cruising" speed interval if there is time for it only.
-            
-            velocityStepSize = speedMax/(intervals + 1.0)    
-            # For six time intervals of acceleration, first interval is at velocity (max/7)
-            # 6th (last) time interval is at 6*max/7
-            # after this interval, we are at full speed.
-            
-            for index in range(0, intervals):        #Calculate acceleration phase
-                velocity += velocityStepSize
-                timeElapsed += timePerInterval
-                position += velocity * timePerInterval
-                durationArray.append(int(round(timeElapsed * 1000.0)))
-                distArray.append(position)        #Estimated distance along direction of travel
-
-            coastingDistance = plotDistance - (2 * position)    
-            
-            if (coastingDistance > (timePerInterval * speedMax)):
-                # There is enough time for (at least) one interval at full cruising speed.
-                velocity = speedMax
-                cruisingTime = coastingDistance / velocity
-                timeElapsed += cruisingTime
-                durationArray.append(int(round(timeElapsed * 1000.0)))
-                position += velocity * cruisingTime
-                distArray.append(position)        #Estimated distance along direction of travel                
-#                inkex.errormsg( 'FullSpeed duration: ' + str( cruisingTime ) )                
-#                inkex.errormsg( 'FullSpeed distance: ' + str( velocity * cruisingTime ) )                
-
-            for index in range(0, intervals):        #Calculate deceleration phase
-                velocity -= velocityStepSize
-                timeElapsed += timePerInterval
-                position += velocity * timePerInterval
-                durationArray.append(int(round(timeElapsed * 1000.0)))
-                distArray.append(position)        #Estimated distance along direction of travel
-                
-        else:
-            # We will _not_ reach full cruising speed.
-            intervals = int(math.floor( 2 *    tAccel / timeSlice))    #TOTAL number of intervals, including acceleration and deceleration
-            if (intervals % 2 == 0):  # Even number of intervals:
-                intervals += 1    # Guarantee an odd number of intervals -- possibly a little shorter.
-                
-            timePerInterval = (2 * tAccel) / intervals
-
-            accelIntervals = int(math.ceil(intervals / 2.0))
-            velocityStepSize = speedMax / accelIntervals    
-
-            for index in range(0, accelIntervals):        #Calculate acceleration phase
-                velocity += velocityStepSize
-                timeElapsed += timePerInterval
-                position += velocity * timePerInterval
-                durationArray.append(int(round(timeElapsed * 1000.0)))
-                distArray.append(position)        #Estimated distance along direction of travel
-                
-            for index in range(0, intervals - accelIntervals):        #Calculate deceleration phase
-                velocity -= velocityStepSize
-                timeElapsed += timePerInterval
-                position += velocity * timePerInterval
-                durationArray.append(int(round(timeElapsed * 1000.0)))
-                distArray.append(position)        #Estimated distance along direction of travel
-
-        for index in range (0, len(distArray) ):
-            fractionalDistance = distArray[index] / position # Fractional position along the intended path
-            destArray1.append ( int(round( fractionalDistance * motorSteps1)))
-            destArray2.append ( int(round( fractionalDistance * motorSteps2)))
+        # Acceleration/cruise/deceleration profile, normalized to the move length. These are
+        # cached, so that the many similar-length travel moves in a plot share one profile.
+        durationArray, fractionArray = wcb_planner.rapidProfile( plotDistance, speedLimit, accelRate, timeSlice )
+        destArray1 = [int(round(fraction * motorSteps1)) for fraction in fractionArray]
+        destArray2 = [int(round(fraction * motorSteps2)) for fraction in fractionArray]
 
         prevMotor1 = 0
         prevMotor2 = 0
@@ -1744,11 +2428,10 @@ class WCB( inkex.Effect ):
                     else:
                         moveSteps2Copy = moveSteps2 
                     
+                    # No need to wait here: the serial pipeline only blocks once more than
+                    # wcb_conf.F_Motion_Lookahead seconds of motion are queued on the EBB.
                     ebb_motion.doXYMove( self.serialPort, moveSteps2Copy, moveSteps1Copy, moveTime )            
-                    if (moveTime > 15):
-                        if self.options.tab != "manual":
-                            time.sleep(float(moveTime - 10)/1000.0)  #pause before issuing next command
-                    else:
+                    if (moveTime <= 15):
                         self.warnShortMoves = True
 
                     self.fCurrX += xSteps / self.stepsPerPx   # Update current position
@@ -1757,15 +2440,38 @@ class WCB( inkex.Effect ):
                     self.svgLastKnownPosX = self.fCurrX -  wcb_conf.F_StartPos_X
                     self.svgLastKnownPosY = self.fCurrY -  wcb_conf.F_StartPos_Y
 
-        strButton = ebb_motion.QueryPRGButton(self.serialPort)    #Query if button pressed
-        if strButton[0] == '1': #button pressed
-            self.svgNodeCount = self.nodeCount;
+        self.checkPauseButton( 'node' )
+
+    def checkPauseButton( self, moveName ):
+        '''
+        Called after each completed move. The button monitor decides whether
+        to actually query the PRG button this time; if it has been pressed,
+        record where we stopped, so that the plot can be resumed from here.
+        '''
+        if ( self.buttonMonitor is None ) or self.bStopped:
+            return    # Already stopped (during a re-ink): keep the place recorded then
+        if self.buttonMonitor.check():
+            self.svgNodeCount = self.nodeCount
             self.svgPausedPosX = self.fCurrX - wcb_conf.F_StartPos_X    #self.svgLastKnownPosX
-            self.svgPausedPosY = self.fCurrY - wcb_conf.F_StartPos_Y    #self.svgLastKnownPosY            
-            inkex.errormsg( 'Plot paused by button press after node number ' + str( self.nodeCount ) + '.' )
-            inkex.errormsg( 'Use the "resume" feature to continue.' )
+            self.svgPausedPosY = self.fCurrY - wcb_conf.F_StartPos_Y    #self.svgLastKnownPosY
+            vertexReached = self.vertexIndex
+            if self.ReInkingNow:
+                vertexReached -= 1    # Paused on a trip to re-ink, part way to the vertex
+            self.svgSegment = '{0},{1}'.format( self.subpathIndex, max( vertexReached, 0 ) )
+            self.svgBrushColor = self.BrushColor
+            self.svgPaintDist = self.paintdist
+            self.svgLayerSettings = self.layerSettings()
+            self.recordProgress( self.svgNodeCount, self.svgPausedPosX, self.svgPausedPosY,
+                self.svgSegment, sync=True )
+            inkex.errormsg( 'Plot paused by button press after ' + moveName + ' number ' + str( self.nodeCount ) + '.' )
+            inkex.errormsg( 'Use the "Resume" feature to continue.' )
             self.bStopped = True
-            return
+
+    def paintAccelEnabled( self ):
+        # Planned acceleration for painting: per-layer "+A" setting if given, else the run option.
+        if (self.LayerOverrideAccel):
+            return self.LayerAccelEnable
+        return self.options.accelEnable
 
     def EnableMotors( self ):
         # Enable motors, set native motor resolution, and set speed scales.
@@ -1881,6 +2587,7 @@ class WCB( inkex.Effect ):
         else:
             return True
 
-e = WCB()
-#e.affect(output=False)
-e.affect()
+if __name__ == '__main__':
+    e = WCB()
+    #e.affect(output=False)
+    e.affect()
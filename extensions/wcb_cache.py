@@ -0,0 +1,207 @@
+# wcb_cache.py
+# Part of the WaterColorBot driver for Inkscape
+# https://github.com/oskay/wcb-ink/
+#
+# On-disk cache of flattened path geometry, kept between plots.
+#
+# Copyright 2020 Windell H. Oskay, Evil Mad Scientist Laboratories
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+'''
+Flattening a path (parsing its data, applying its transform, and dividing its
+curves into line segments) gives the same polylines every time, for the same
+path data, transform and smoothness. GeometryCache keeps those polylines in a
+file, so that a drawing that is plotted again (or resumed, or plotted one
+layer at a time) needs only the paths that have changed to be flattened.
+
+Entries are keyed by a hash of the path data, transform and smoothness, and
+are dropped least recently used first, to keep the file under a size limit.
+
+File format (little-endian): the header "<4sII" (magic, format version,
+entry count), then the entries, least recently used first. Each entry is a
+16-byte key and the header "<II" (number of polylines, number of vertices),
+then the vertex count of each polyline (32-bit unsigned integers), then the
+coordinates (x, y pairs, as doubles).
+'''
+
+import hashlib
+import os
+import struct
+import sys
+from array import array
+from collections import OrderedDict
+
+MAGIC = b'WCBG'
+VERSION = 1
+HEADER = '<4sII'
+ENTRY_HEADER = '<II'
+KEY_SIZE = 16
+
+
+def cacheKey( d, matTransform, smoothness ):
+    '''Key for the flattened form of path data [d] under [matTransform] at [smoothness].'''
+    text = '%r|%r|%r' % ( d, [[float( value ) for value in row] for row in matTransform], float( smoothness ) )
+    return hashlib.sha1( text.encode( 'utf-8' ) ).digest()[:KEY_SIZE]
+
+
+def arrayBytes( values ):
+    '''The contents of an array, as bytes.'''
+    try:
+        return values.tobytes()
+    except AttributeError:    # Python 2
+        return values.tostring()
+
+
+def extendFromBytes( values, data ):
+    '''Append the items in [data] (bytes) to the array [values].'''
+    try:
+        values.frombytes( data )
+    except AttributeError:    # Python 2
+        values.fromstring( data )
+
+
+def replaceFile( source, destination ):
+    '''Rename the file [source] to [destination], replacing any file there.'''
+    try:
+        os.replace( source, destination )
+    except AttributeError:    # Python 2: no os.replace()
+        try:
+            os.rename( source, destination )
+        except OSError:    # Windows will not rename over a file
+            os.remove( destination )
+            os.rename( source, destination )
+
+
+def pack( polylines ):
+    '''A list of polylines (lists of [x, y] vertices) as the bytes of a cache entry.'''
+    counts = array( 'I', [len( polyline ) for polyline in polylines] )
+    coordinates = array( 'd', [value for polyline in polylines for vertex in polyline for value in vertex[:2]] )
+    if sys.byteorder != 'little':
+        counts.byteswap()
+        coordinates.byteswap()
+    return struct.pack( ENTRY_HEADER, len( counts ), len( coordinates ) // 2 ) + \
+        arrayBytes( counts ) + arrayBytes( coordinates )
+
+
+def unpack( data ):
+    polylineCount, vertexCount = struct.unpack_from( ENTRY_HEADER, data )
+    offset = struct.calcsize( ENTRY_HEADER )
+    counts = array( 'I' )
+    extendFromBytes( counts, data[offset:offset + 4 * polylineCount] )
+    offset += 4 * polylineCount
+    coordinates = array( 'd' )
+    extendFromBytes( coordinates, data[offset:offset + 16 * vertexCount] )
+    if sys.byteorder != 'little':
+        counts.byteswap()
+        coordinates.byteswap()
+    polylines = []
+    index = 0
+    for count in counts:
+        polylines.append( [[coordinates[i], coordinates[i + 1]] for i in range( index, index + 2 * count, 2 )] )
+        index += 2 * count
+    return polylines
+
+
+def entrySize( data ):
+    '''Size in bytes of the entry that starts at the beginning of [data], key included.'''
+    polylineCount, vertexCount = struct.unpack_from( ENTRY_HEADER, data, KEY_SIZE )
+    return KEY_SIZE + struct.calcsize( ENTRY_HEADER ) + 4 * polylineCount + 16 * vertexCount
+
+
+class GeometryCache( object ):
+    '''
+    Flattened polylines, by cacheKey(). The file is read at the first lookup, and
+    written by save(), only if anything was added (the order of use, which decides
+    what is dropped first, is saved then too). Unreadable files are ignored.
+    '''
+
+    def __init__( self, fileName, maxSize ):
+        self.fileName = fileName
+        self.maxSize = maxSize
+        self.entries = None     # OrderedDict of key: packed polylines, least recently used first
+        self.size = 0
+        self.changed = False
+        self.hits = 0
+        self.misses = 0
+
+    def load( self ):
+        self.entries = OrderedDict()
+        self.size = 0
+        try:
+            with open( self.fileName, 'rb' ) as inFile:
+                data = inFile.read()
+        except ( IOError, OSError ):
+            return
+        try:
+            headerSize = struct.calcsize( HEADER )
+            magic, version, count = struct.unpack_from( HEADER, data )
+            if ( magic != MAGIC ) or ( version != VERSION ):
+                return
+            offset = headerSize
+            for _ in range( count ):
+                size = entrySize( data[offset:offset + KEY_SIZE + 8] )
+                if offset + size > len( data ):
+                    break    # Truncated file: keep what is complete
+                self.entries[data[offset:offset + KEY_SIZE]] = data[offset + KEY_SIZE:offset + size]
+                self.size += size
+                offset += size
+        except struct.error:
+            pass
+
+    def get( self, key ):
+        '''The polylines cached for [key], or None.'''
+        if self.entries is None:
+            self.load()
+        data = self.entries.get( key )
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.pop( key )
+        self.entries[key] = data    # Now the most recently used
+        return unpack( data )
+
+    def put( self, key, polylines ):
+        if self.entries is None:
+            self.load()
+        data = pack( polylines )
+        if key in self.entries:
+            self.size -= KEY_SIZE + len( self.entries.pop( key ) )
+        self.entries[key] = data
+        self.size += KEY_SIZE + len( data )
+        self.changed = True
+        while ( self.size > self.maxSize ) and self.entries:
+            oldKey, oldData = self.entries.popitem( last=False )
+            self.size -= KEY_SIZE + len( oldData )
+
+    def save( self ):
+        '''
+        Write the cache file, if anything was added. Written to a temporary file
+        first, so that an interrupted save leaves the old cache in place.
+        '''
+        if not self.changed:
+            return
+        directory = os.path.dirname( self.fileName )
+        if directory and not os.path.isdir( directory ):
+            os.makedirs( directory )
+        tempName = self.fileName + '.tmp'
+        with open( tempName, 'wb' ) as outFile:
+            outFile.write( struct.pack( HEADER, MAGIC, VERSION, len( self.entries ) ) )
+            for key, data in self.entries.items():
+                outFile.write( key )
+                outFile.write( data )
+        replaceFile( tempName, self.fileName )
+        self.changed = False
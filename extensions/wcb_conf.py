@@ -89,3 +89,137 @@ InkCycles = 1
 
 InkReCycles = 1
 InkReDelta = (53, 37)
+
+
+'''
+Serial Pipeline Details
+N_Pipeline_Depth: Maximum number of motion and servo commands that may be sent to the EBB 
+  before their "OK" replies have been read. Set to 0 to wait for each reply in turn.
+N_Pipeline_Batch: Number of commands to collect before writing them out together.
+N_Pipeline_Low_Water: Write collected commands right away if fewer than this many are 
+  still awaiting a reply, so that the EBB does not run out of moves while a batch fills.
+'''
+
+N_Pipeline_Depth = 4
+N_Pipeline_Batch = 4
+N_Pipeline_Low_Water = 2
+
+
+'''
+Pause Button Details
+N_Button_Poll_Time: Time (ms) between queries of the PRG (pause) button while plotting.
+N_Button_Poll_Nodes: Number of moves between queries of the PRG button. 
+  Either limit starts a query; set both to 0 to query after every move.
+B_Button_Poll_Thread: Query the button from a background thread, every N_Button_Poll_Time ms.
+'''
+
+N_Button_Poll_Time = 250
+N_Button_Poll_Nodes = 0
+B_Button_Poll_Thread = False
+
+
+'''
+Motion Queue Flow Control
+F_Motion_Lookahead: Time, in seconds, of motion that may be queued on the EBB ahead of 
+  the carriage. Sending only waits once this much is queued. Larger values give smoother 
+  motion; smaller values make the pause button respond sooner.
+B_Motion_Status_Query: After each wait, check (with QM) whether the EBB has already 
+  finished moving, to correct the estimate of queued motion.
+'''
+
+F_Motion_Lookahead = 0.5
+B_Motion_Status_Query = False
+
+
+'''
+Painting Acceleration (used when "acceleration while painting" is enabled)
+F_Paint_Accel_Factor: Time, in seconds, to reach full painting speed from a stop.
+F_Junction_Deviation: Cornering tolerance, in pixels. Speed through each corner is limited
+  as though the brush rounded it off by this distance; larger values corner faster.
+'''
+
+F_Paint_Accel_Factor = 0.2
+F_Junction_Deviation = 0.5
+
+
+'''
+N_Profile_Cache_Size: Number of pen-up (rapid move) speed profiles to keep for reuse.
+'''
+
+N_Profile_Cache_Size = 512
+
+
+'''
+N_Transform_Cache_Size: Number of parsed SVG transform attributes to keep for reuse.
+'''
+
+N_Transform_Cache_Size = 1024
+
+
+'''
+Virtual EBB (for running without a WaterColorBot; select with --backend=virtual)
+S_Serial_Backend: "ebb" to use the WaterColorBot over USB, or "virtual" for a simulated EBB.
+N_Virtual_Queue_Depth: Number of motion commands the simulated EBB holds, besides the one 
+  that it is executing, before it stops reading new commands.
+F_Virtual_Latency: Simulated USB round-trip time, in seconds.
+'''
+
+S_Serial_Backend = "ebb"
+N_Virtual_Queue_Depth = 1
+F_Virtual_Latency = 0.002
+
+
+'''
+Path Ordering (used when "reorder paths" is enabled)
+F_Path_Order_Time: Time limit, in seconds, for improving the order of the paths in each layer.
+N_Join_Tolerance: With "join touching paths" enabled, a path that starts within this distance
+  of where the previous one ended is painted without lifting the brush. In motor steps, at the
+  selected resolution.
+'''
+
+F_Path_Order_Time = 2.0
+N_Join_Tolerance = 2
+
+
+'''
+Path simplification (used when "simplify paths" is enabled)
+F_Simplify_Tolerance: Vertices are left out of a path where the simplified path passes within
+  this distance of them. In motor steps, at the selected resolution.
+'''
+
+F_Simplify_Tolerance = 0.5
+
+
+'''
+Geometry cache: flattened paths are kept on disk between plots, so that a drawing that is
+plotted again only has its changed paths flattened.
+S_Geometry_Cache_File: Cache file ("~" is the home directory), or "" to not use a cache.
+N_Geometry_Cache_Size: Largest size of the cache file, in bytes. The least recently used
+  paths are dropped first.
+'''
+
+S_Geometry_Cache_File = "~/.cache/wcb-ink/geometry.cache"
+N_Geometry_Cache_Size = 32 * 1024 * 1024
+
+
+'''
+Plot journal: progress is recorded as the plot goes, in a file kept apart from the document,
+so that a plot can be resumed even if the document was never saved (after a crash, say).
+S_Journal_Dir: Directory for journal files ("~" is the home directory), or "" to not keep one.
+F_Journal_Sync_Interval: Longest time, in seconds, between forcing the journal to disk. A
+  crash may lose the paths painted since; those are painted again on resuming.
+'''
+
+S_Journal_Dir = "~/.cache/wcb-ink/journal"
+F_Journal_Sync_Interval = 1.0
+
+
+'''
+Plotter daemon (wcb_daemon.py): a background process that keeps the serial port to the
+WaterColorBot open between plots, and carries them out one after another.
+S_Daemon_Socket: Unix socket on which the daemon takes plots ("~" is the home directory). When
+  a daemon is listening there, the extension sends each plot or manual command to it, instead
+  of opening the serial port itself; otherwise, it works as before. "" to never use a daemon.
+'''
+
+S_Daemon_Socket = "~/.cache/wcb-ink/wcbd.sock"
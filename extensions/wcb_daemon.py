@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+# wcb_daemon.py
+# Part of the WaterColorBot driver for Inkscape
+# https://github.com/oskay/wcb-ink/
+#
+# Plotter daemon: keeps the serial port open, and plots jobs sent to it.
+#
+# Copyright 2020 Windell H. Oskay, Evil Mad Scientist Laboratories
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+'''
+Each time that the extension is applied, it finds and opens the serial port
+to the WaterColorBot (ebb_serial.openPort() tries each likely port in turn),
+sets up the servo and motors, and closes the port again when done. That takes
+seconds, which is most of the time taken by a manual command or a short plot.
+
+PlotDaemon is a background process that opens the port once, and keeps it
+open. It takes jobs on a Unix socket (wcb_conf.S_Daemon_Socket): each is the
+extension's options and the document, exactly as Inkscape gives them to the
+extension. The daemon carries the jobs out one after another, in the order
+that they arrive, and sends back each document with its new plot state, and
+any messages for the user. When the daemon is running, wcb.py sends its work
+there (see submitJob()), and otherwise does it all itself, as before.
+
+The port keeps a machine state between jobs (see wcb_motion.MotionPipeline):
+the servo and motor settings last sent, so that the same settings are not
+sent again. It is forgotten, and the port opened again, if the EBB stops
+answering or a command fails.
+
+Messages (little-endian): the header "<II" (JSON length, data length), a
+JSON object, then data: for a job, the SVG document.
+
+    python wcb_daemon.py [--socket FILE] [--backend serial|virtual]
+'''
+
+import argparse
+import io
+import json
+import os
+import socket
+import struct
+import sys
+import threading
+import traceback
+
+try:
+    import queue
+except ImportError:    # Python 2
+    import Queue as queue
+
+from lxml import etree
+
+from plot_utils_import import from_dependency_import # plotink
+ebb_serial = from_dependency_import('plotink.ebb_serial')
+inkex = from_dependency_import('ink_extensions.inkex')
+
+import wcb_conf
+import wcb_virtual
+
+VERSION = 1
+HEADER = '<II'
+
+
+def receiveExactly( connection, size ):
+    data = b''
+    while len( data ) < size:
+        chunk = connection.recv( min( size - len( data ), 65536 ) )
+        if not chunk:
+            raise IOError( 'Connection closed' )
+        data += chunk
+    return data
+
+
+def sendMessage( connection, values, data=b'' ):
+    text = json.dumps( values ).encode( 'utf-8' )
+    connection.sendall( struct.pack( HEADER, len( text ), len( data ) ) + text + data )
+
+
+def receiveMessage( connection ):
+    '''The values (a dict) and data of the next message. Raises IOError if the connection closes.'''
+    textSize, dataSize = struct.unpack( HEADER, receiveExactly( connection, struct.calcsize( HEADER ) ) )
+    values = json.loads( receiveExactly( connection, textSize ).decode( 'utf-8' ) )
+    return values, receiveExactly( connection, dataSize )
+
+
+def submitJob( socketName, arguments, document ):
+    '''
+    Have the daemon listening at [socketName] carry out a job: the extension's command-line
+    [arguments] (less the file name), on [document] (SVG, as bytes). Waits until it is done,
+    and returns the messages for the user, the resulting document, and whether the job ran
+    to its end (see WCB.plotFinished()). Returns None if no daemon is listening; raises
+    IOError if the job was sent but no answer came back.
+    '''
+    if ( not hasattr( socket, 'AF_UNIX' ) ) or ( not os.path.exists( socketName ) ):
+        return None
+    connection = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+    try:
+        try:
+            connection.connect( socketName )
+        except socket.error:
+            return None    # Left over from a daemon that has stopped
+        sendMessage( connection, { 'version': VERSION, 'arguments': list( arguments ) }, document )
+        values, result = receiveMessage( connection )
+    finally:
+        connection.close()
+    return values.get( 'messages', '' ), result, bool( values.get( 'finished', False ) )
+
+
+class SharedPort( object ):
+    '''
+    The daemon's serial port, lent to each job in turn. Closing it leaves it open, and
+    its machine state is kept from one job to the next.
+    '''
+
+    def __init__( self, port ):
+        self.port = port
+        self.machineState = {}
+
+    def __getattr__( self, name ):
+        return getattr( self.port, name )
+
+    def close( self ):
+        pass
+
+
+class PlotDaemon( object ):
+    '''
+    Serves jobs on the Unix socket [socketName], with the serial port from [openPort]
+    (by default, ebb_serial.openPort()).
+    '''
+
+    def __init__( self, socketName, openPort=None ):
+        self.socketName = socketName
+        self.openPort = openPort or ebb_serial.openPort
+        self.port = None
+        self.jobs = queue.Queue()
+
+    def serve( self ):
+        '''Take jobs until interrupted.'''
+        if submitJob( self.socketName, [], b'' ) is not None:
+            raise IOError( 'A plotter daemon is already listening at ' + self.socketName )
+        if os.path.exists( self.socketName ):
+            os.remove( self.socketName )    # Left over from a daemon that has stopped
+        directory = os.path.dirname( self.socketName )
+        if directory and not os.path.isdir( directory ):
+            os.makedirs( directory )
+
+        server = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+        try:
+            server.bind( self.socketName )
+            os.chmod( self.socketName, 0o600 )    # Only this user may plot
+            server.listen( 8 )
+            worker = threading.Thread( target=self.work )
+            worker.daemon = True
+            worker.start()
+            while True:
+                connection, unused_address = server.accept()
+                handler = threading.Thread( target=self.handle, args=( connection, ) )
+                handler.daemon = True
+                handler.start()
+        finally:
+            server.close()
+            os.remove( self.socketName )
+            self.closePort()
+
+    def handle( self, connection ):
+        '''Receive a job, queue it, and send back the result once it is done.'''
+        try:
+            values, document = receiveMessage( connection )
+            if not document:
+                sendMessage( connection, { 'messages': '' } )    # Only checking for a daemon
+                return
+            if values.get( 'version' ) != VERSION:
+                sendMessage( connection, { 'messages': 'The plotter daemon is a different version from '
+                    'this extension; please restart it.\n' }, document )
+                return
+            job = { 'arguments': values.get( 'arguments', [] ), 'document': document,
+                'done': threading.Event() }
+            self.jobs.put( job )
+            job['done'].wait()
+            sendMessage( connection, { 'messages': job['messages'], 'finished': job['finished'] },
+                job['result'] )
+        except ( IOError, ValueError, struct.error ):
+            pass    # The client has gone
+        finally:
+            connection.close()
+
+    def work( self ):
+        while True:
+            job = self.jobs.get()
+            try:
+                job['messages'], job['result'], job['finished'] = self.runJob( job['arguments'], job['document'] )
+            finally:
+                job['done'].set()
+
+    def runJob( self, arguments, document ):
+        '''
+        Carry out one job, as the extension would. Returns the messages for the user, the
+        resulting document (the original, if it could not be carried out), and whether the
+        job ran to its end.
+        '''
+        import wcb_engine    # Not at the top: it imports wcb, which imports this module.
+
+        messages = io.StringIO() if sys.version_info >= (3,) else io.BytesIO()
+        stderr = sys.stderr
+        sys.stderr = messages    # Where inkex.errormsg() writes
+        result = document
+        finished = False
+        try:
+            effect = wcb_engine.EngineWCB( self.sharedPort )
+            effect.getoptions( arguments )
+            effect.document = etree.ElementTree( etree.fromstring( document,
+                parser=etree.XMLParser( huge_tree=True ) ) )
+            effect.effect()
+            result = etree.tostring( effect.document )
+            finished = effect.plotFinished()
+            if getattr( effect.serialPort, 'errors', None ):
+                self.forgetState()
+        except ( Exception, SystemExit ):    # Including bad options, which argparse exits on
+            inkex.errormsg( 'The plotter daemon was unable to finish this job:\n' + traceback.format_exc() )
+            self.closePort()    # Unknown state: start afresh with the next job
+        finally:
+            sys.stderr = stderr
+        return messages.getvalue(), result, finished
+
+    def sharedPort( self ):
+        '''The open serial port, opened now if need be; None if the EBB cannot be found.'''
+        if self.port is not None:
+            if ebb_serial.query( self.port.port, 'V\r' ):
+                return self.port
+            self.closePort()    # No answer: unplugged, or turned off and on
+        port = self.openPort()
+        if port is None:
+            return None
+        self.port = SharedPort( port )
+        return self.port
+
+    def forgetState( self ):
+        if self.port is not None:
+            self.port.machineState.clear()
+
+    def closePort( self ):
+        if self.port is not None:
+            ebb_serial.closePort( self.port.port )
+            self.port = None
+
+
+def main():
+    parser = argparse.ArgumentParser( description='Keep the serial port to the WaterColorBot open, '
+        'and carry out the plots sent by the Inkscape extension.' )
+    parser.add_argument( '--socket', default=wcb_conf.S_Daemon_Socket,
+        help='Unix socket to take plots on (default: %(default)s)' )
+    parser.add_argument( '--backend', choices=( 'serial', 'virtual' ), default='serial',
+        help='Plot with the WaterColorBot, or with a simulated one' )
+    args = parser.parse_args()
+    if not hasattr( socket, 'AF_UNIX' ):
+        sys.stderr.write( 'The plotter daemon needs Unix sockets, which this system does not have.\n' )
+        return 1
+    openPort = None
+    if args.backend == 'virtual':
+        openPort = wcb_virtual.VirtualEBB
+    daemon = PlotDaemon( os.path.expanduser( args.socket ), openPort )
+    try:
+        daemon.serve()
+    except KeyboardInterrupt:
+        pass
+    except ( IOError, OSError ) as err:
+        sys.stderr.write( str( err ) + '\n' )
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit( main() )
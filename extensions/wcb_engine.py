@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# wcb_engine.py
+# Part of the WaterColorBot driver for Inkscape
+# https://github.com/oskay/wcb-ink/
+#
+# Plotting without Inkscape: a Python interface, and a command-line tool.
+#
+# Copyright 2020 Windell H. Oskay, Evil Mad Scientist Laboratories
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+'''
+PlotEngine paints SVG drawings with a WaterColorBot from Python, without
+Inkscape. It drives the same WCB plotter as the Inkscape extension does;
+there, WCB.effect() only picks the operation for the dialog tab in use.
+
+    engine = wcb_engine.PlotEngine( { 'paintMode': 'wc', 'penDownSpeed': 75 } )
+    engine.load( 'drawing.svg' )
+    finished = engine.plot()        # Or plot( layer=2 ); resume() after a pause
+    engine.save( 'drawing.svg' )    # With the plot state, for resuming
+
+Settings are the options of the Inkscape dialog (see wcb.inx), by name, with
+the same defaults. Each operation starts from a fresh WCB, with the plot state
+saved in the document (and the plot journal), as when run from Inkscape.
+
+A plot can also be split into its plan and its execution: compile() plans the
+document into a MotionProgram, with no WaterColorBot connected, and stream()
+sends a program (compiled now, or loaded from a file) to one.
+
+Run as a script, this module is a command-line tool:
+
+    python wcb_engine.py plot drawing.svg --set paintMode=wc --output drawing.svg
+    python wcb_engine.py resume drawing.svg --output drawing.svg
+    python wcb_engine.py compile drawing.svg --program drawing.wcbp
+    python wcb_engine.py stream drawing.svg --program drawing.wcbp --output drawing.svg
+    python wcb_engine.py stream drawing.svg --program drawing.wcbp --resume --output drawing.svg
+
+Messages for the user go to standard error, as from the extension.
+'''
+
+import argparse
+import sys
+
+from lxml import etree
+
+import wcb
+import wcb_program
+
+
+def settingArguments( settings ):
+    '''Command-line arguments for WCB, from a dict of option names and values.'''
+    arguments = []
+    for name, value in sorted( settings.items() ):
+        if isinstance( value, bool ):
+            value = 'true' if value else 'false'
+        arguments.append( '--{0}={1}'.format( name, value ) )
+    return arguments
+
+
+class EngineWCB( wcb.WCB ):
+    '''
+    WCB, with its serial port (optionally) from a given function. It only sends its work
+    to a plotter daemon (see wcb_daemon.py) if [useDaemon], and no port is given.
+    '''
+
+    def __init__( self, openPort=None, useDaemon=False ):
+        wcb.WCB.__init__( self )
+        self.portOpener = openPort
+        if ( openPort is not None ) or not useDaemon:
+            self.daemonSocket = ''    # Plot here, not in a plotter daemon
+
+    def openSerialPort( self ):
+        if self.portOpener is None:
+            return wcb.WCB.openSerialPort( self )
+        return self.portOpener()
+
+
+class PlotEngine( object ):
+    '''
+    Plots documents with the given [settings] (a dict of WCB option values). The
+    serial port is opened as set by the backend and dryRun options, unless [openPort]
+    is given: a function returning the port (or stand-in) to use, opened anew for
+    each operation. With [useDaemon], plots and commands are sent to the plotter
+    daemon instead, when one is running (streaming a program never is).
+    '''
+
+    def __init__( self, settings=None, openPort=None, useDaemon=False ):
+        self.arguments = settingArguments( settings or {} )
+        self.openPort = openPort
+        self.useDaemon = useDaemon
+        self.document = None
+        self.lastPlot = None    # The EngineWCB of the latest operation
+
+    def load( self, fileName ):
+        '''Read the SVG document to plot. Raises IOError or etree.XMLSyntaxError if it cannot.'''
+        self.document = etree.parse( fileName, parser=etree.XMLParser( huge_tree=True ) )
+
+    def save( self, fileName ):
+        '''Write the document, with the plot state of the latest operation.'''
+        self.document.write( fileName, encoding='utf-8', xml_declaration=True )
+
+    def newPlot( self, tab, arguments=() ):
+        effect = EngineWCB( self.openPort, self.useDaemon )
+        effect.getoptions( self.arguments + ['--tab=' + tab] + list( arguments ) )
+        effect.document = self.document
+        self.lastPlot = effect
+        return effect
+
+    def run( self, tab, arguments=() ):
+        '''
+        Carry out the operation of an extension tab, as WCB.effect() does. Returns True if
+        the plot ran to its end; False if it was paused, or could not start.
+        '''
+        effect = self.newPlot( tab, arguments )
+        effect.effect()
+        self.document = effect.document    # A new document, if it was plotted in the daemon
+        return effect.plotFinished()
+
+    def plot( self, layer=None ):
+        '''Paint the whole document, or only the layers numbered [layer].'''
+        if layer is None:
+            return self.run( 'splash' )
+        return self.run( 'layers', ['--layernumber={0}'.format( layer )] )
+
+    def resume( self ):
+        '''Continue a paused plot.'''
+        return self.run( 'resume', ['--resumeType=ResumeNow'] )
+
+    def returnHome( self ):
+        '''Bring the carriage home after a pause, keeping the plot state for resuming later.'''
+        return self.run( 'resume', ['--resumeType=justGoHome'] )
+
+    def compile( self ):
+        '''Plan the whole document, returning the commands to paint it as a MotionProgram.'''
+        effect = self.newPlot( 'manual', ['--manualType=compile-plot'] )
+        effect.startDocument()
+        program = effect.compileProgram()
+        effect.finishDocument( True )
+        return program
+
+    def stream( self, program, resume=False ):
+        '''
+        Send a MotionProgram to the WaterColorBot, which must start in the home corner; or, if
+        [resume], continue it from where it was paused. Where it was paused is kept in the
+        document, if one has been loaded (and can then be saved).
+        Returns True if the whole program was sent; False if it was paused, or could not start.
+        '''
+        effect = self.newPlot( 'manual', ['--manualType=' + ( 'resume-stream' if resume else 'stream-plot' )] )
+        if self.document is not None:
+            effect.startDocument()
+            effect.keepResumeData()
+        start = effect.programStart( program, resume )
+        if start is None:
+            return False
+        effect.connect()
+        finished = False
+        if effect.serialPort is not None:
+            finished = effect.streamProgram( program, start )
+        if self.document is not None:
+            effect.finishDocument( effect.serialPort is None )
+        else:
+            effect.disconnect()
+        return finished
+
+
+def main( argv=None ):
+    parser = argparse.ArgumentParser( description='Paint SVG drawings with a WaterColorBot, without Inkscape.' )
+    parser.add_argument( 'command', choices=( 'plot', 'resume', 'home', 'compile', 'stream' ),
+        help='plot: paint the drawing; resume: continue a paused plot; home: return home after '
+        'a pause; compile: plan the drawing into a motion program file; stream: paint a motion program' )
+    parser.add_argument( 'file', nargs='?', help='SVG drawing (optional for stream, which keeps its place '
+        'there when paused)' )
+    parser.add_argument( '-s', '--set', action='append', default=[], metavar='NAME=VALUE',
+        help='Set an option of the Inkscape dialog, such as paintMode=wc or penDownSpeed=75' )
+    parser.add_argument( '-l', '--layer', type=int, help='Paint only the layers with this number' )
+    parser.add_argument( '-o', '--output', help='Save the drawing, with the plot state, to this file' )
+    parser.add_argument( '-p', '--program', help='Motion program file, for compile and stream' )
+    parser.add_argument( '-d', '--daemon', action='store_true',
+        help='Plot with the plotter daemon (wcb_daemon.py), if one is running' )
+    parser.add_argument( '-r', '--resume', action='store_true',
+        help='stream: continue the program from where it was paused, as saved in the SVG file' )
+    args = parser.parse_args( argv )
+
+    settings = {}
+    for setting in args.set:
+        name, equals, value = setting.partition( '=' )
+        if not equals:
+            parser.error( 'settings are given as NAME=VALUE: ' + setting )
+        settings[name] = value
+    engine = PlotEngine( settings, useDaemon=args.daemon )
+
+    if not args.file:
+        if args.command != 'stream':
+            parser.error( args.command + ' needs an SVG file' )
+        if args.resume:
+            parser.error( 'stream --resume needs the SVG file that the paused stream was saved to' )
+    else:
+        try:
+            engine.load( args.file )
+        except ( IOError, etree.XMLSyntaxError ) as err:
+            sys.stderr.write( 'Unable to read {0}: {1}\n'.format( args.file, err ) )
+            return 1
+
+    finished = True
+    if args.command == 'stream':
+        if not args.program:
+            parser.error( 'stream needs a --program file' )
+        try:
+            program = wcb_program.MotionProgram.load( args.program )
+        except ( IOError, ValueError ) as err:
+            sys.stderr.write( 'Unable to read motion program: {0}\n'.format( err ) )
+            return 1
+        finished = engine.stream( program, args.resume )
+    elif args.command == 'plot':
+        finished = engine.plot( args.layer )
+    elif args.command == 'resume':
+        finished = engine.resume()
+    elif args.command == 'home':
+        finished = engine.returnHome()
+    else:
+        if not args.program:
+            parser.error( 'compile needs a --program file' )
+        program = engine.compile()
+        try:
+            program.save( args.program )
+        except IOError as err:
+            sys.stderr.write( 'Unable to save motion program: {0}\n'.format( err ) )
+            return 1
+        commands, paths, reInks, motionTime = program.statistics()
+        sys.stderr.write( 'Saved a motion program of {0} commands ({1} paths, {2} re-inking trips, '
+            'about {3:.1f} minutes of motion) to {4}\n'.format( commands, paths, reInks,
+            motionTime / 60.0, args.program ) )
+
+    if args.output and ( engine.document is not None ):
+        engine.save( args.output )
+    return 0 if finished else 1
+
+
+if __name__ == '__main__':
+    sys.exit( main() )
@@ -0,0 +1,229 @@
+# wcb_geometry.py
+# Part of the WaterColorBot driver for Inkscape
+# https://github.com/oskay/wcb-ink/
+#
+# Polylines for the SVG basic shapes: rect, line, polyline, polygon, circle
+# and ellipse.
+#
+# Copyright 2020 Windell H. Oskay, Evil Mad Scientist Laboratories
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+'''
+Each function here takes the attributes of a basic shape and a transform
+(a 2x3 matrix, as from simpletransform), and returns the shape as painted:
+a list of subpaths, each a list of transformed [x, y] vertices, the same as
+WCB.flattenPath() returns for a path. The shapes go straight to points,
+without writing and then parsing path data.
+
+Shapes made of straight lines need no subdivision. Ellipses (and circles)
+are made of four quarter-circle Bezier curves, subdivided to [smoothness]
+as for paths.
+
+Transforms: parseTransform() remembers the transform attributes that it has
+parsed, since drawings tend to repeat the same few; composeTransform() skips
+the arithmetic when either transform is the identity; and transformPath()
+applies a transform to a whole path at once. The matrices that these return
+may be shared, and must not be changed.
+
+clipPolyline() cuts a polyline at the edges of a rectangle (the page), so
+that the parts outside can be left out instead of painted along the edge.
+'''
+
+import math
+import re
+
+try:
+    from functools import lru_cache
+except ImportError:    # Python 2: no transform cache
+    def lru_cache( maxsize ):
+        return lambda function: function
+
+from plot_utils_import import from_dependency_import # plotink
+plot_utils = from_dependency_import('plotink.plot_utils')
+simpletransform = from_dependency_import('ink_extensions.simpletransform')
+
+import wcb_conf
+
+NUMBER = re.compile( r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?' )
+
+# Distance from each end of a quarter-circle Bezier curve to its control point, for radius 1
+QUARTER_ARC = 4.0 * math.tan( math.pi / 8.0 ) / 3.0
+
+IDENTITY = [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]]
+
+
+@lru_cache( maxsize=wcb_conf.N_Transform_Cache_Size )
+def parseTransform( text ):
+    '''The matrix for an SVG transform attribute (the identity, if empty or None).'''
+    if not text:
+        return IDENTITY
+    return simpletransform.parseTransform( text, [row[:] for row in IDENTITY] )
+
+
+def composeTransform( matFirst, matSecond ):
+    '''The transform [matFirst] applied after [matSecond], as simpletransform.composeTransform().'''
+    if matSecond is IDENTITY or matSecond == IDENTITY:
+        return matFirst
+    if matFirst is IDENTITY or matFirst == IDENTITY:
+        return matSecond
+    return simpletransform.composeTransform( matFirst, matSecond )
+
+
+def transformPath( matTransform, csp ):
+    '''
+    Apply [matTransform] to every point of the cubicsuperpath [csp], in place. Does
+    the same as simpletransform.applyTransformToPath(), in a single pass with the
+    matrix unpacked, and nothing at all for the identity.
+    '''
+    if matTransform is IDENTITY or matTransform == IDENTITY:
+        return
+    ( a, c, e ), ( b, d, f ) = matTransform
+    for subpath in csp:
+        for node in subpath:
+            for point in node:
+                x = point[0]
+                y = point[1]
+                point[0] = a * x + c * y + e
+                point[1] = b * x + d * y + f
+
+
+def transformPoints( matTransform, points ):
+    '''[points] ([x, y] pairs), transformed by [matTransform], as a new list.'''
+    ( a, c, e ), ( b, d, f ) = matTransform
+    return [[a * x + c * y + e, b * x + d * y + f] for x, y in points]
+
+
+def maximumScale( a, b, c, d ):
+    '''
+    The most that the linear map [[a, c], [b, d]] stretches any distance (its largest
+    singular value).
+    '''
+    sumSq = a * a + b * b + c * c + d * d
+    det = a * d - b * c
+    return math.sqrt( 0.5 * ( sumSq + math.sqrt( max( sumSq * sumSq - 4.0 * det * det, 0.0 ) ) ) )
+
+
+def parsePoints( text ):
+    '''
+    The points of a polyline or polygon "points" attribute. Coordinates may be
+    separated by commas, white space or both; an odd coordinate at the end is
+    ignored, as in SVG.
+    '''
+    values = [float( value ) for value in NUMBER.findall( text or '' )]
+    return [[values[i], values[i + 1]] for i in range( 0, len( values ) - 1, 2 )]
+
+
+def rectangle( x, y, width, height, matTransform ):
+    '''The outline of a rectangle, from its top-left corner, clockwise (on the page).'''
+    return [transformPoints( matTransform,
+        [( x, y ), ( x + width, y ), ( x + width, y + height ), ( x, y + height ), ( x, y )] )]
+
+
+def line( x1, y1, x2, y2, matTransform ):
+    return [transformPoints( matTransform, [( x1, y1 ), ( x2, y2 )] )]
+
+
+def polyline( points, matTransform, closed=False ):
+    '''A polyline (or, if [closed], a polygon) through [points]; empty if there are none.'''
+    if not points:
+        return []
+    if closed:
+        points = points + [points[0]]
+    return [transformPoints( matTransform, points )]
+
+
+def ellipse( cx, cy, rx, ry, matTransform, smoothness ):
+    '''
+    An ellipse, from its leftmost point, counterclockwise (on the page). Empty if
+    either radius is zero.
+    '''
+    if ( rx == 0 ) or ( ry == 0 ):
+        return []
+    # Each node is [control point before, vertex, control point after]:
+    csp = []
+    for quarter in range( 5 ):
+        angle = math.pi * ( 1.0 - 0.5 * quarter )
+        cos = math.cos( angle )
+        sin = math.sin( angle )
+        vertex = ( cx + rx * cos, cy + ry * sin )
+        tangent = ( rx * sin * QUARTER_ARC, -ry * cos * QUARTER_ARC )    # Direction of travel
+        csp.append( transformPoints( matTransform, [
+            ( vertex[0] - tangent[0], vertex[1] - tangent[1] ),
+            vertex,
+            ( vertex[0] + tangent[0], vertex[1] + tangent[1] )] ) )
+    csp[0][0] = csp[0][1][:]
+    csp[-1][1] = csp[0][1][:]    # Close exactly, whatever the rounding
+    csp[-1][2] = csp[-1][1][:]
+    plot_utils.subdivideCubicPath( csp, smoothness )
+    return [[node[1] for node in csp]]
+
+
+def clipSegment( x0, y0, x1, y1, xMin, yMin, xMax, yMax ):
+    '''
+    Liang-Barsky clipping of the segment from (x0, y0) to (x1, y1) to a rectangle.
+    Returns the parameters (t0, t1), 0 <= t0 <= t1 <= 1, of the part inside, or None.
+    '''
+    dx = x1 - x0
+    dy = y1 - y0
+    t0 = 0.0
+    t1 = 1.0
+    for p, q in ( ( -dx, x0 - xMin ), ( dx, xMax - x0 ), ( -dy, y0 - yMin ), ( dy, yMax - y0 ) ):
+        if p == 0:
+            if q < 0:
+                return None    # Parallel to this edge, and outside it
+        else:
+            r = q / p
+            if p < 0:
+                if r > t1:
+                    return None
+                if r > t0:
+                    t0 = r
+            else:
+                if r < t0:
+                    return None
+                if r < t1:
+                    t1 = r
+    return t0, t1
+
+
+def clipPolyline( vertices, xMin, yMin, xMax, yMax ):
+    '''
+    The parts of the polyline [vertices] inside the rectangle, as a list of polylines:
+    [vertices] itself if it is all inside, an empty list if none of it is.
+    '''
+    xs = [vertex[0] for vertex in vertices]
+    ys = [vertex[1] for vertex in vertices]
+    if ( min( xs ) >= xMin ) and ( max( xs ) <= xMax ) and ( min( ys ) >= yMin ) and ( max( ys ) <= yMax ):
+        return [vertices]
+    pieces = []
+    piece = None    # The piece being built, while inside
+    for index in range( len( vertices ) - 1 ):
+        x0, y0 = vertices[index][0], vertices[index][1]
+        x1, y1 = vertices[index + 1][0], vertices[index + 1][1]
+        inside = clipSegment( x0, y0, x1, y1, xMin, yMin, xMax, yMax )
+        if inside is None:
+            piece = None
+            continue
+        t0, t1 = inside
+        if ( piece is None ) or ( t0 > 0 ):
+            piece = [vertices[index] if t0 == 0 else [x0 + t0 * ( x1 - x0 ), y0 + t0 * ( y1 - y0 )]]
+            pieces.append( piece )
+        if t1 == 1:
+            piece.append( vertices[index + 1] )
+        else:
+            piece.append( [x0 + t1 * ( x1 - x0 ), y0 + t1 * ( y1 - y0 )] )
+            piece = None
+    return pieces
@@ -0,0 +1,166 @@
+# wcb_journal.py
+# Part of the WaterColorBot driver for Inkscape
+# https://github.com/oskay/wcb-ink/
+#
+# Append-only journal of plot progress, for resuming after a crash.
+#
+# Copyright 2020 Windell H. Oskay, Evil Mad Scientist Laboratories
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+'''
+The progress of a plot is saved in the document's WCB data only when the
+plot stops, and only kept if the document is then saved. PlotJournal also
+records it as the plot goes, at each finished path, in a file of its own:
+if Inkscape crashes, the USB connection drops, or the power fails, the plot
+can still be resumed from the last record that reached the disk.
+
+Records are appended, and the file is forced to disk (fsync) at most every
+wcb_conf.F_Journal_Sync_Interval seconds, and when the plot is paused, so
+that the journal costs little while painting. There is one journal for each
+drawing, named for wcb.WCB.drawingHash(), since Inkscape gives extensions a
+temporary copy of the document, not the document itself.
+
+File format: text, one line each. First the header "WCBJ <version> <drawing
+hash>", then the records: each a CRC-32 of its JSON text (8 hexadecimal
+digits), a space, then a JSON object of the values saved in the WCB data.
+A line cut short by a crash fails its check, and is ignored with any after it.
+'''
+
+import json
+import os
+import time
+import zlib
+
+MAGIC = 'WCBJ'
+VERSION = 1
+
+
+def journalFileName( directory, drawingHash ):
+    return os.path.join( os.path.expanduser( directory ), drawingHash + '.wcbj' )
+
+
+def encodeRecord( values ):
+    text = json.dumps( values, sort_keys=True )
+    return '%08x %s\n' % ( zlib.crc32( text.encode( 'utf-8' ) ) & 0xffffffff, text )
+
+
+def decodeRecord( line ):
+    '''The values of a journal record, or None if [line] is not a whole, valid record.'''
+    if not line.endswith( '\n' ):
+        return None
+    checksum, unused_sep, text = line.rstrip( '\n' ).partition( ' ' )
+    try:
+        if int( checksum, 16 ) != zlib.crc32( text.encode( 'utf-8' ) ) & 0xffffffff:
+            return None
+        values = json.loads( text )
+    except ValueError:
+        return None
+    if not isinstance( values, dict ):
+        return None
+    return values
+
+
+def scanJournal( fileName, drawingHash ):
+    '''
+    The last valid record in the journal [fileName], if it is for the drawing
+    [drawingHash], and the length in bytes of the journal up to the end of that
+    record. (None, 0) if there is no such journal; (None, length) if it has no records.
+    '''
+    try:
+        with open( fileName, 'rb' ) as inFile:
+            lines = inFile.readlines()
+    except ( IOError, OSError ):
+        return None, 0
+    if ( not lines ) or ( lines[0].decode( 'utf-8', 'replace' ).split() != [MAGIC, str( VERSION ), drawingHash] ):
+        return None, 0
+    last = None
+    length = len( lines[0] )
+    for line in lines[1:]:
+        values = decodeRecord( line.decode( 'utf-8', 'replace' ) )
+        if values is None:
+            break    # Cut short by a crash
+        last = values
+        length += len( line )
+    return last, length
+
+
+def readLastRecord( fileName, drawingHash ):
+    '''The last valid record in the journal [fileName] for the drawing [drawingHash], or None.'''
+    return scanJournal( fileName, drawingHash )[0]
+
+
+class PlotJournal( object ):
+    '''
+    Journal of one plot (or of a plot and its resumptions), in [fileName]. Opened
+    with start(); record() appends, and sync() forces what was appended to disk.
+    '''
+
+    def __init__( self, fileName, drawingHash, syncInterval ):
+        self.fileName = fileName
+        self.drawingHash = drawingHash
+        self.syncInterval = syncInterval
+        self.outFile = None
+        self.lastSync = 0.0
+        self.unsynced = False
+
+    def start( self, resuming ):
+        '''
+        Open the journal: a new one (replacing any other for the drawing), or, if
+        [resuming], the existing one, to continue after its last valid record.
+        '''
+        directory = os.path.dirname( self.fileName )
+        if directory and not os.path.isdir( directory ):
+            os.makedirs( directory )
+        length = 0
+        if resuming:
+            unused_last, length = scanJournal( self.fileName, self.drawingHash )
+        if length > 0:
+            self.outFile = open( self.fileName, 'r+b' )
+            self.outFile.truncate( length )    # Drop any record cut short by a crash
+            self.outFile.seek( length )
+        else:
+            self.outFile = open( self.fileName, 'wb' )
+            self.outFile.write( ( '%s %d %s\n' % ( MAGIC, VERSION, self.drawingHash ) ).encode( 'utf-8' ) )
+            self.unsynced = True
+            self.sync()
+        self.lastSync = time.time()
+
+    def record( self, values, sync=False ):
+        '''Append a record of [values]; force it to disk if [sync], or if it is time to.'''
+        self.outFile.write( encodeRecord( values ).encode( 'utf-8' ) )
+        self.unsynced = True
+        if sync or ( time.time() - self.lastSync >= self.syncInterval ):
+            self.sync()
+
+    def sync( self ):
+        if self.unsynced:
+            self.outFile.flush()
+            os.fsync( self.outFile.fileno() )
+            self.unsynced = False
+        self.lastSync = time.time()
+
+    def close( self ):
+        if self.outFile is not None:
+            self.sync()
+            self.outFile.close()
+            self.outFile = None
+
+    def remove( self ):
+        '''Close and delete the journal, once the plot is finished.'''
+        if self.outFile is not None:
+            self.outFile.close()
+            self.outFile = None
+        os.remove( self.fileName )
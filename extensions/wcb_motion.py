@@ -0,0 +1,362 @@
+# wcb_motion.py
+# Part of the WaterColorBot driver for Inkscape
+# https://github.com/oskay/wcb-ink/
+#
+# Serial motion streaming for the WaterColorBot.
+#
+# Copyright 2020 Windell H. Oskay, Evil Mad Scientist Laboratories
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+import threading
+import time
+from collections import deque
+
+import wcb_conf
+
+# Commands that the EBB answers with a single "OK" line, and that can
+# therefore be sent ahead of their acknowledgement. Anything else is a
+# query, and must wait until the stream of acknowledgements has caught up.
+PIPELINED_COMMANDS = ( 'SM', 'XM', 'SP', 'TP', 'SC', 'EM', 'SE', 'S2' )
+
+# Commands that only configure the EBB (servo settings, motor enable and
+# resolution): sending one again with the same values changes nothing.
+CONFIGURATION_COMMANDS = ( 'SC', 'EM' )
+
+
+def commandName( cmd ):
+    '''Return the upper-case command mnemonic of an EBB command string.'''
+    return cmd.split( ',' )[0].strip().upper()
+
+
+def motionTime( cmd ):
+    '''
+    Time (ms) that a command keeps the EBB motion queue busy: the duration
+    of an SM or XM move, or the delay given with an SP or TP pen command.
+    '''
+    fields = cmd.strip().split( ',' )
+    name = fields[0].upper()
+    try:
+        if name in ( 'SM', 'XM' ):
+            return int( fields[1] )
+        if ( name == 'SP' ) and ( len( fields ) > 2 ):
+            return int( fields[2] )
+        if ( name == 'TP' ) and ( len( fields ) > 1 ):
+            return int( fields[1] )
+    except ValueError:
+        pass
+    return 0
+
+
+class MotionPipeline( object ):
+    '''
+    Wrapper around the serial port object returned by ebb_serial.openPort().
+
+    It can be handed to ebb_serial and ebb_motion in place of the port.
+    Commands that only return "OK" are buffered and written out in batches,
+    and their acknowledgements are read back later, whenever they arrive.
+    ebb_serial.command() is given a local "OK" right away, so a stream of
+    short SM moves no longer pays a full USB round trip per move.
+
+    Any other command (i.e., a query) first writes out the buffer and reads
+    every outstanding acknowledgement, then goes straight through to the port.
+    A depth of 0 turns pipelining off entirely.
+
+    query() performs a complete query under a lock, and is safe to call from
+    a second thread (see ButtonMonitor) while moves are being streamed.
+
+    Flow control: the pipeline keeps a running estimate of how much motion
+    time has been handed to the EBB and not yet executed. A new move only
+    blocks (sleeps) once more than the lookahead window is queued, so moves
+    run back to back instead of being paced by the host. Optionally, a QM
+    query is used after each wait to correct the estimate.
+
+    Time is read from [clock] (default: the time module). A simulated EBB
+    (see wcb_virtual.py) that has a clock of its own provides it instead.
+
+    A port that stays open from one plot to the next (see wcb_daemon.py) may
+    keep a machineState dict, of the configuration commands in effect on the
+    EBB. Configuration commands that would change nothing are then not sent.
+    '''
+
+    def __init__( self, port, depth=None, batch=None, lookahead=None, statusQueries=None, clock=None ):
+        self.port = port
+        if clock is None:
+            clock = getattr( port, 'clock', time )
+        self.clock = clock
+        if depth is None:
+            depth = wcb_conf.N_Pipeline_Depth
+        if batch is None:
+            batch = wcb_conf.N_Pipeline_Batch
+        if lookahead is None:
+            lookahead = wcb_conf.F_Motion_Lookahead
+        if statusQueries is None:
+            statusQueries = wcb_conf.B_Motion_Status_Query
+        self.depth = depth        # Max. number of written commands awaiting "OK"
+        self.batch = max( 1, batch )
+        self.pending = []         # Commands buffered, not yet written
+        self.outstanding = deque()  # Commands written, awaiting "OK"
+        self.localAcks = 0        # "OK" lines owed to ebb_serial.command()
+        self.errors = []          # (command, response) pairs that did not return "OK"
+        self.commandCount = 0
+        self.writeCount = 0
+        self.lock = threading.RLock()
+        self.machineState = getattr( port, 'machineState', None )
+        self.skipCount = 0            # Configuration commands not sent, as already in effect
+        self.lookahead = lookahead    # seconds
+        self.statusQueries = statusQueries
+        self.motionEnd = 0.0          # Estimated time at which written motion will be finished
+        self.throttleTime = 0.0       # Total time spent waiting for the EBB to catch up
+
+    def __getattr__( self, name ):
+        return getattr( self.port, name )
+
+    def write( self, data ):
+        if isinstance( data, bytes ):
+            cmd = data.decode( 'ascii' )
+        else:
+            cmd = data
+        with self.lock:
+            if ( self.depth > 0 ) and ( commandName( cmd ) in PIPELINED_COMMANDS ):
+                if self.alreadySet( cmd ):
+                    self.localAcks = 1
+                    self.skipCount += 1
+                    return len( data )
+                self.pending.append( cmd )
+                self.localAcks = 1
+                self.commandCount += 1
+                self.collectAcks()
+                if ( len( self.pending ) >= self.batch ) or \
+                        ( len( self.outstanding ) < wcb_conf.N_Pipeline_Low_Water ) or \
+                        ( self.queuedTime() < self.lookahead / 2.0 ):
+                    self.writePending()
+                while len( self.outstanding ) > self.depth:
+                    self.readAck()
+            else:
+                self.flush()
+                self.localAcks = 0
+                self.port.write( data )
+                self.addMotion( cmd )
+                self.commandCount += 1
+                self.writeCount += 1
+        self.throttle()
+        return len( data )
+
+    def alreadySet( self, cmd ):
+        '''
+        True if [cmd] is a configuration command that the machine state shows to be in
+        effect already. Otherwise, records in the machine state what [cmd] sets.
+        '''
+        if self.machineState is None:
+            return False
+        fields = [field.strip().upper() for field in cmd.strip().split( ',' )]
+        if fields[0] not in CONFIGURATION_COMMANDS:
+            return False
+        if fields[0] == 'SC':
+            setting = tuple( fields[:2] )    # Each SC parameter is a setting of its own
+            value = fields[2:]
+        else:
+            setting = ( fields[0], )
+            value = fields[1:]
+        if self.machineState.get( setting ) == value:
+            return True
+        self.machineState[setting] = value
+        return False
+
+    def readline( self ):
+        if self.localAcks > 0:
+            self.localAcks -= 1
+            return b'OK\r\n'
+        return self.port.readline()
+
+    def flush( self ):
+        '''Write any buffered commands, and wait for every outstanding "OK".'''
+        with self.lock:
+            self.writePending()
+            while self.outstanding:
+                self.readAck()
+
+    def query( self, cmd ):
+        '''
+        Send a query and return its reply, as ebb_serial.query() does.
+        The whole exchange happens under the lock.
+        '''
+        with self.lock:
+            self.flush()
+            self.port.write( cmd.encode( 'ascii' ) )
+            self.commandCount += 1
+            self.writeCount += 1
+            response = self.readResponse()
+            if commandName( cmd ) not in ( 'A', 'I', 'MR', 'PI', 'QM', 'QG', 'V' ):
+                self.readResponse()    # Extra "OK" line after the data requested
+        return response
+
+    def readResponse( self ):
+        response = self.port.readline()
+        nRetryCount = 0
+        while len( response ) == 0 and nRetryCount < 100:
+            response = self.port.readline()
+            nRetryCount += 1
+        if isinstance( response, bytes ):
+            response = response.decode( 'ascii', 'replace' )
+        return response
+
+    def queuedTime( self ):
+        '''Estimated motion time (s) written to the EBB and not yet executed.'''
+        return max( 0.0, self.motionEnd - self.clock.time() )
+
+    def addMotion( self, cmd ):
+        now = self.clock.time()
+        if self.motionEnd < now:
+            self.motionEnd = now    # The EBB has been idle; start the new motion from now.
+        self.motionEnd += motionTime( cmd ) / 1000.0
+
+    def throttle( self ):
+        '''Wait while more than the lookahead window of motion is queued on the EBB.'''
+        excess = self.queuedTime() - self.lookahead
+        if excess <= 0:
+            return
+        with self.lock:
+            self.writePending()    # Everything up to here goes out before we wait.
+        self.clock.sleep( excess )
+        self.throttleTime += excess
+        if self.statusQueries:
+            self.syncMotionStatus()
+
+    def syncMotionStatus( self ):
+        '''
+        Ask the EBB (QM) whether it is still moving. If it reports that all
+        motion is finished, the queued time estimate was pessimistic; reset it.
+        '''
+        response = self.query( 'QM\r' )
+        fields = response.strip().split( ',' )
+        if ( len( fields ) > 1 ) and ( fields[0] == 'QM' ) and \
+                all( field.strip() == '0' for field in fields[1:] ):
+            self.motionEnd = self.clock.time()
+
+    def close( self ):
+        try:
+            self.flush()
+        finally:
+            self.port.close()
+
+    def writePending( self ):
+        if self.pending:
+            self.port.write( ''.join( self.pending ).encode( 'ascii' ) )
+            for cmd in self.pending:
+                self.addMotion( cmd )
+            self.outstanding.extend( self.pending )
+            self.pending = []
+            self.writeCount += 1
+
+    def waiting( self ):
+        '''Number of bytes received from the EBB and not yet read.'''
+        try:
+            return self.port.in_waiting
+        except AttributeError:
+            return self.port.inWaiting()    # pyserial 2.x
+
+    def collectAcks( self ):
+        '''Read any acknowledgements that have already arrived, without blocking.'''
+        while self.outstanding and self.waiting() > 0:
+            self.readAck()
+
+    def readAck( self ):
+        cmd = self.outstanding.popleft()
+        response = self.readResponse()
+        if not response.strip().startswith( 'OK' ):
+            self.errors.append( ( cmd.strip(), response.strip() ) )
+
+
+class ButtonMonitor( object ):
+    '''
+    Decides when to query the PRG (pause) button, so that a QB round trip is
+    not added to every move.
+
+    By default the button is queried from check() once N_Button_Poll_Time ms
+    have passed, or once N_Button_Poll_Nodes moves have been made, since the
+    last query. If both are 0, it is queried after every move.
+
+    With threaded=True, a background thread queries the button every
+    N_Button_Poll_Time ms instead, and check() just reads the result. Either
+    way, the caller learns of a press only through check(), at a move
+    boundary, so that the pause bookkeeping stays exact. The QB command
+    latches presses, so a press between queries is never missed.
+    '''
+
+    def __init__( self, pipeline, interval=None, nodes=None, threaded=None ):
+        self.pipeline = pipeline
+        if interval is None:
+            interval = wcb_conf.N_Button_Poll_Time
+        if nodes is None:
+            nodes = wcb_conf.N_Button_Poll_Nodes
+        if threaded is None:
+            threaded = wcb_conf.B_Button_Poll_Thread
+        self.interval = interval / 1000.0
+        self.nodes = nodes
+        self.threaded = threaded
+        self.clock = getattr( pipeline, 'clock', time )
+        self.lastPoll = self.clock.time()
+        self.nodesSincePoll = 0
+        self.queryCount = 0
+        self.pressed = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def start( self ):
+        '''Start the background thread, if one is configured.'''
+        if self.threaded and ( self.thread is None ):
+            self.stopping.clear()
+            self.thread = threading.Thread( target=self.pollLoop )
+            self.thread.daemon = True
+            self.thread.start()
+
+    def stop( self ):
+        if self.thread is not None:
+            self.stopping.set()
+            self.thread.join()
+            self.thread = None
+
+    def pollLoop( self ):
+        interval = self.interval
+        if interval <= 0:
+            interval = 0.25
+        while not self.stopping.wait( interval ):
+            if self.query():
+                return
+
+    def query( self ):
+        self.queryCount += 1
+        strButton = self.pipeline.query( 'QB\r' )
+        if strButton[:1] == '1':
+            self.pressed.set()
+        return self.pressed.is_set()
+
+    def check( self ):
+        '''Call once after each move. Returns True if the button has been pressed.'''
+        if self.thread is not None:
+            return self.pressed.is_set()
+        self.nodesSincePoll += 1
+        now = self.clock.time()
+        if ( self.interval <= 0 ) and ( self.nodes <= 0 ):
+            due = True
+        else:
+            due = ( ( self.nodes > 0 ) and ( self.nodesSincePoll >= self.nodes ) ) or \
+                ( ( self.interval > 0 ) and ( now - self.lastPoll >= self.interval ) )
+        if not due:
+            return self.pressed.is_set()
+        self.nodesSincePoll = 0
+        self.lastPoll = now
+        return self.query()
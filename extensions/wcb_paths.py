@@ -0,0 +1,509 @@
+# wcb_paths.py
+# Part of the WaterColorBot driver for Inkscape
+# https://github.com/oskay/wcb-ink/
+#
+# Path ordering, to reduce the distance travelled with the brush up, and
+# path simplification, to drop vertices that do not change the painted path.
+#
+# Copyright 2020 Windell H. Oskay, Evil Mad Scientist Laboratories
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+'''
+Each path here is a list of (x, y) vertices, painted from first to last. The
+brush-up travel of a sequence of paths is the sum of the distances from the
+end of each path to the start of the next, beginning from an origin point.
+
+orderPaths() finds a short sequence in two steps: a greedy nearest-neighbour
+tour (the next path is always the one that starts nearest to where the brush
+is), then improvement moves until no move helps or the time budget runs out:
+
+ - Or-opt: move a run of 1 to 3 consecutive paths to a better place in the
+   sequence, next to a path that ends near where the run starts.
+ - 2-opt: reverse the order of a short run of paths (each path is still
+   painted in its own direction).
+
+If paths may be reversed, a path can be painted from either end, and a closed
+loop (one that ends where it starts) from any of its vertices. The greedy tour
+then goes to the nearest end or loop vertex, 2-opt also reverses each path in
+the run, and a last pass picks the entry point of each path for the brush
+positions before and after it. Reversed paths are changed in place.
+
+simplifyPath() removes vertices that lie within a tolerance of the line between
+their neighbours (Ramer-Douglas-Peucker).
+
+joinPaths() chains paths that end where the next one in the sequence starts,
+so that they are painted as one stroke, without lifting the brush between.
+
+The result depends only on the paths and on the number of improvement moves
+made. That number is returned, so that the same order can be computed again
+later (say, to resume a paused plot), by passing it back as maxMoves.
+'''
+
+import math
+import time
+
+N_NEIGHBORS = 8         # Candidate positions considered for each Or-opt move
+N_OR_OPT_RUN = 3        # Longest run of paths moved by one Or-opt move
+N_TWO_OPT_WINDOW = 24   # Longest run of paths reversed by one 2-opt move
+F_LOOP_TOLERANCE = 0.01 # A path that ends this close (px) to its start is a closed loop
+EPSILON = 1e-9
+
+
+def distance( p, q ):
+    return math.hypot( q[0] - p[0], q[1] - p[1] )
+
+
+def travel( paths, order, origin ):
+    '''Brush-up distance to paint [paths] in the sequence [order], starting at [origin].'''
+    total = 0.0
+    position = origin
+    for index in order:
+        total += distance( position, paths[index][0] )
+        position = paths[index][-1]
+    return total
+
+
+def isLoop( path ):
+    return ( len( path ) > 2 ) and ( distance( path[0], path[-1] ) <= F_LOOP_TOLERANCE )
+
+
+def entryPoints( path ):
+    '''Indices of the vertices at which a reversible path may be entered.'''
+    if isLoop( path ):
+        return range( len( path ) - 1 )
+    if len( path ) > 1:
+        return ( 0, len( path ) - 1 )
+    return ( 0, )
+
+
+def enterAt( path, index ):
+    '''[path], entered at vertex [index]: reversed if open, rotated if a closed loop.'''
+    if index == 0:
+        return path
+    if isLoop( path ):
+        return path[index:-1] + path[:index] + [path[index]]
+    return path[::-1]
+
+
+class GridIndex( object ):
+    '''
+    Uniform grid of points, for nearest-neighbour queries. Each point has a
+    key; points can be removed again, as paths are used up.
+    '''
+
+    def __init__( self, points, keys=None ):
+        self.cells = {}
+        self.count = 0
+        self.xMin = self.xMax = self.yMin = self.yMax = None
+        if not points:
+            self.cellSize = 1.0
+            return
+        xs = [p[0] for p in points]
+        ys = [p[1] for p in points]
+        area = max( max( xs ) - min( xs ), 1.0 ) * max( max( ys ) - min( ys ), 1.0 )
+        self.cellSize = max( math.sqrt( 2.0 * area / len( points ) ), 1e-6 )   # About 2 points per cell
+        if keys is None:
+            keys = range( len( points ) )
+        for key, point in zip( keys, points ):
+            self.insert( key, point )
+
+    def cell( self, point ):
+        return ( int( math.floor( point[0] / self.cellSize ) ), int( math.floor( point[1] / self.cellSize ) ) )
+
+    def insert( self, key, point ):
+        cx, cy = self.cell( point )
+        self.cells.setdefault( ( cx, cy ), [] ).append( ( key, point ) )
+        self.count += 1
+        if self.xMin is None:
+            self.xMin = self.xMax = cx
+            self.yMin = self.yMax = cy
+        else:
+            self.xMin = min( self.xMin, cx )
+            self.xMax = max( self.xMax, cx )
+            self.yMin = min( self.yMin, cy )
+            self.yMax = max( self.yMax, cy )
+
+    def remove( self, key, point ):
+        cell = self.cell( point )
+        entries = self.cells[cell]
+        for index, entry in enumerate( entries ):
+            if entry[0] == key:
+                del entries[index]
+                break
+        if not entries:
+            del self.cells[cell]
+        self.count -= 1
+
+    def nearest( self, point, k=1, exclude=None ):
+        '''
+        Return up to [k] (distance, key, point) tuples for the indexed points
+        nearest to [point], closest first, skipping keys in [exclude].
+        '''
+        found = []
+        if self.count == 0:
+            return found
+        cx, cy = self.cell( point )
+        maxRing = max( cx - self.xMin, self.xMax - cx, cy - self.yMin, self.yMax - cy )
+        ring = 0
+        while ring <= maxRing:
+            # Every point in this ring, or beyond, is at least this far away:
+            if ( len( found ) >= k ) and ( found[k - 1][0] <= ( ring - 1 ) * self.cellSize ):
+                break
+            for cell in ringCells( cx, cy, ring ):
+                for key, candidate in self.cells.get( cell, () ):
+                    if exclude is not None and key in exclude:
+                        continue
+                    found.append( ( distance( point, candidate ), key, candidate ) )
+            found.sort( key=lambda entry: ( entry[0], entry[1] ) )
+            del found[k:]
+            ring += 1
+        return found
+
+
+def ringCells( cx, cy, ring ):
+    '''Grid cells at Chebyshev distance [ring] from cell (cx, cy).'''
+    if ring == 0:
+        return [( cx, cy )]
+    cells = []
+    for x in range( cx - ring, cx + ring + 1 ):
+        cells.append( ( x, cy - ring ) )
+        cells.append( ( x, cy + ring ) )
+    for y in range( cy - ring + 1, cy + ring ):
+        cells.append( ( cx - ring, y ) )
+        cells.append( ( cx + ring, y ) )
+    return cells
+
+
+def nearestNeighborOrder( paths, origin, reverse=False ):
+    '''
+    Greedy tour: always go next to the unpainted path that starts nearest the brush.
+    If [reverse], enter each path at its nearest end or loop vertex, in place.
+    '''
+    if not reverse:
+        index = GridIndex( [path[0] for path in paths] )
+    else:
+        points = []
+        keys = []
+        for key, path in enumerate( paths ):
+            for vertex in entryPoints( path ):
+                points.append( path[vertex] )
+                keys.append( ( key, vertex ) )
+        index = GridIndex( points, keys )
+    order = []
+    position = origin
+    while index.count:
+        unused_distance, key, point = index.nearest( position )[0]
+        if reverse:
+            key, vertex = key
+            for other in entryPoints( paths[key] ):
+                index.remove( ( key, other ), paths[key][other] )
+            paths[key] = enterAt( paths[key], vertex )
+        else:
+            index.remove( key, point )
+        order.append( key )
+        position = paths[key][-1]
+    return order
+
+
+def orientPaths( paths, order, origin ):
+    '''
+    For each path of the sequence [order] in turn, pick the end or loop vertex to
+    enter it at, to shorten the travel to it and on to the next path. In place.
+    '''
+    position = origin
+    for place, key in enumerate( order ):
+        path = paths[key]
+        following = None
+        if place + 1 < len( order ):
+            following = paths[order[place + 1]][0]
+        loop = isLoop( path )
+        best = None
+        for vertex in entryPoints( path ):
+            if loop:
+                exitPoint = path[vertex]
+            else:
+                exitPoint = path[-1] if vertex == 0 else path[0]
+            cost = distance( position, path[vertex] )
+            if following is not None:
+                cost += distance( exitPoint, following )
+            if ( best is None ) or ( cost < best[0] - EPSILON ):
+                best = ( cost, vertex )
+        paths[key] = enterAt( path, best[1] )
+        position = paths[key][-1]
+
+
+class OrderImprover( object ):
+    '''
+    Or-opt and 2-opt moves over a path sequence, applied one at a time. If [reverse],
+    2-opt moves reverse the paths in the run too; see flipped.
+    '''
+
+    def __init__( self, paths, order, origin, reverse=False ):
+        self.starts = [path[0] for path in paths]
+        self.ends = [path[-1] for path in paths]
+        self.order = order
+        self.origin = origin
+        self.reverse = reverse
+        self.flipped = [False] * len( paths )    # Paths to be painted end to start
+        self.position = [0] * len( paths )
+        self.renumber( 0, len( order ) )
+        self.endIndex = GridIndex( self.ends )
+
+    def renumber( self, first, last ):
+        order = self.order
+        for index in range( first, last ):
+            self.position[order[index]] = index
+
+    def endBefore( self, index ):
+        '''Brush position before painting the path at [index] of the sequence.'''
+        if index == 0:
+            return self.origin
+        return self.ends[self.order[index - 1]]
+
+    def link( self, point, index ):
+        '''Travel from [point] to the start of the path at [index], if there is one.'''
+        if index >= len( self.order ):
+            return 0.0
+        return distance( point, self.starts[self.order[index]] )
+
+    def tryOrOpt( self, first, length ):
+        '''Move the run order[first:first + length] next to a path that ends near its start.'''
+        order = self.order
+        last = first + length - 1
+        if last >= len( order ):
+            return False
+        run = order[first:last + 1]
+        runStart = self.starts[run[0]]
+        runEnd = self.ends[run[-1]]
+        before = self.endBefore( first )
+        removeGain = distance( before, runStart ) + self.link( runEnd, last + 1 ) - self.link( before, last + 1 )
+
+        best = None
+        for unused_distance, key, point in self.endIndex.nearest( runStart, N_NEIGHBORS + length, run ):
+            target = self.position[key]
+            if target == first - 1:
+                continue    # Already there
+            addCost = distance( point, runStart ) + self.link( runEnd, target + 1 ) - self.link( point, target + 1 )
+            gain = removeGain - addCost
+            if gain > EPSILON and ( best is None or gain > best[0] ):
+                best = ( gain, target )
+        if best is None:
+            return False
+
+        target = best[1]
+        del order[first:last + 1]
+        if target > first:
+            target -= length
+        order[target + 1:target + 1] = run
+        self.renumber( min( first, target + 1 ), max( first + length, target + 1 + length ) )
+        return True
+
+    def flip( self, key ):
+        start = self.starts[key]
+        end = self.ends[key]
+        self.starts[key] = end
+        self.ends[key] = start
+        self.flipped[key] = not self.flipped[key]
+        if distance( start, end ) > 0:
+            self.endIndex.remove( key, end )
+            self.endIndex.insert( key, start )
+
+    def tryTwoOpt( self, first ):
+        '''Reverse the order of the run order[first:last + 1], for the best [last] nearby.'''
+        order = self.order
+        ends = self.ends
+        starts = self.starts
+        before = self.endBefore( first )
+        if self.reverse:
+            return self.tryReversingTwoOpt( first, before )
+        oldInside = 0.0    # Travel within the run, in its present order
+        newInside = 0.0    # ... and reversed
+        best = None
+        for last in range( first + 1, min( len( order ), first + N_TWO_OPT_WINDOW ) ):
+            oldInside += distance( ends[order[last - 1]], starts[order[last]] )
+            newInside += distance( ends[order[last]], starts[order[last - 1]] )
+            oldCost = distance( before, starts[order[first]] ) + oldInside + self.link( ends[order[last]], last + 1 )
+            newCost = distance( before, starts[order[last]] ) + newInside + self.link( ends[order[first]], last + 1 )
+            gain = oldCost - newCost
+            if gain > EPSILON and ( best is None or gain > best[0] ):
+                best = ( gain, last )
+        if best is None:
+            return False
+        last = best[1]
+        order[first:last + 1] = order[first:last + 1][::-1]
+        self.renumber( first, last + 1 )
+        return True
+
+    def tryReversingTwoOpt( self, first, before ):
+        '''
+        Reverse the run order[first:last + 1], and each path in it. The travel within
+        the run is unchanged, so only the two links at its ends need to be compared.
+        Candidates for [last] are the paths nearby in the sequence, and those that end
+        near the brush position [before].
+        '''
+        order = self.order
+        candidates = set( range( first + 1, min( len( order ), first + N_TWO_OPT_WINDOW ) ) )
+        for unused_distance, key, unused_point in self.endIndex.nearest( before, N_NEIGHBORS ):
+            if self.position[key] > first:
+                candidates.add( self.position[key] )
+        firstStart = self.starts[order[first]]
+        best = None
+        for last in sorted( candidates ):
+            lastEnd = self.ends[order[last]]
+            oldCost = distance( before, firstStart ) + self.link( lastEnd, last + 1 )
+            newCost = distance( before, lastEnd ) + self.link( firstStart, last + 1 )
+            gain = oldCost - newCost
+            if gain > EPSILON and ( best is None or gain > best[0] ):
+                best = ( gain, last )
+        if best is None:
+            return False
+        last = best[1]
+        order[first:last + 1] = order[first:last + 1][::-1]
+        self.renumber( first, last + 1 )
+        for key in order[first:last + 1]:
+            self.flip( key )
+        return True
+
+
+def improveOrder( paths, order, origin, deadline=None, maxMoves=None, reverse=False ):
+    '''
+    Improve the sequence [order] in place, until no move helps, until time.time()
+    passes [deadline], or until [maxMoves] moves have been made. Returns the number
+    of moves made. If [reverse], paths may be reversed too (in place).
+    '''
+    moves = 0
+    if len( order ) < 3:
+        return moves
+    improver = OrderImprover( paths, order, origin, reverse )
+    improved = True
+    while improved:
+        improved = False
+        for first in range( len( order ) ):
+            if ( ( maxMoves is not None ) and ( moves >= maxMoves ) ) or \
+                    ( ( deadline is not None ) and ( time.time() > deadline ) ):
+                improved = False
+                break
+            for length in range( 1, N_OR_OPT_RUN + 1 ):
+                if improver.tryOrOpt( first, length ):
+                    moves += 1
+                    improved = True
+                    break
+            else:
+                if improver.tryTwoOpt( first ):
+                    moves += 1
+                    improved = True
+    for key, flipped in enumerate( improver.flipped ):
+        if flipped:
+            paths[key] = paths[key][::-1]
+    return moves
+
+
+def orderPaths( paths, origin, budget=None, maxMoves=None, reorder=True, reverse=False ):
+    '''
+    Find a sequence in which to paint [paths], starting from [origin], that keeps
+    brush-up travel short. Improvement stops after [budget] seconds, if given, or
+    after [maxMoves] moves, if given. If not [reorder], keep the document order.
+    If [reverse], paths may be reversed, and closed loops rotated, in place.
+
+    Returns (order, moves, travel before, travel after), where the travel before
+    is that of the original (document) order.
+    '''
+    original = list( range( len( paths ) ) )
+    before = travel( paths, original, origin )
+    if ( maxMoves is not None ) and ( maxMoves < 0 ):
+        return original, maxMoves, before, before
+    if not reorder:
+        if reverse:
+            orientPaths( paths, original, origin )
+        return original, 0, before, travel( paths, original, origin )
+    if ( len( paths ) < 2 ) and not reverse:
+        return original, 0, before, before
+    deadline = None
+    if budget is not None:
+        deadline = time.time() + budget
+    documentPaths = list( paths )
+    order = nearestNeighborOrder( paths, origin, reverse )
+    moves = improveOrder( paths, order, origin, deadline, maxMoves, reverse )
+    if reverse:
+        orientPaths( paths, order, origin )
+    after = travel( paths, order, origin )
+    if after > before:
+        # Rare, but possible with a tight budget: keep the document order. Mark
+        # this with a negative move count, so that replaying it gives the same.
+        paths[:] = documentPaths
+        return original, -1, before, before
+    return order, moves, before, after
+
+
+def joinPaths( paths, tolerance ):
+    '''
+    Chain each path of the sequence [paths] that starts within [tolerance] of where
+    the one before it ends onto that one, to be painted without lifting the brush.
+    Returns the list of strokes; [paths] itself is not changed.
+    '''
+    strokes = []
+    joined = False      # Whether strokes[-1] is a copy, that can be extended
+    for path in paths:
+        if strokes and ( distance( strokes[-1][-1], path[0] ) <= tolerance ):
+            if not joined:
+                strokes[-1] = list( strokes[-1] )
+                joined = True
+            strokes[-1].extend( path )
+        else:
+            strokes.append( path )
+            joined = False
+    return strokes
+
+
+def simplifyPath( path, tolerance ):
+    '''
+    [path] without the vertices that can be left out while keeping every removed
+    vertex within [tolerance] of the simplified path. The first and last vertices
+    are always kept. Returns [path] itself if no vertex is removed.
+    '''
+    if len( path ) < 3:
+        return path
+    keep = [False] * len( path )
+    keep[0] = keep[-1] = True
+    toleranceSq = tolerance * tolerance
+    spans = [( 0, len( path ) - 1 )]
+    while spans:
+        first, last = spans.pop()
+        x0, y0 = path[first][0], path[first][1]
+        dx = path[last][0] - x0
+        dy = path[last][1] - y0
+        lengthSq = dx * dx + dy * dy
+        farthest = None
+        farthestSq = toleranceSq
+        for index in range( first + 1, last ):
+            px = path[index][0] - x0
+            py = path[index][1] - y0
+            if lengthSq > 0:
+                t = ( px * dx + py * dy ) / lengthSq
+                t = min( max( t, 0.0 ), 1.0 )    # Distance to the segment, not the infinite line
+                px -= t * dx
+                py -= t * dy
+            distanceSq = px * px + py * py
+            if distanceSq > farthestSq:
+                farthest = index
+                farthestSq = distanceSq
+        if farthest is not None:
+            keep[farthest] = True
+            spans.append( ( first, farthest ) )
+            spans.append( ( farthest, last ) )
+    if all( keep ):
+        return path
+    return [vertex for vertex, kept in zip( path, keep ) if kept]
@@ -0,0 +1,327 @@
+# wcb_planner.py
+# Part of the WaterColorBot driver for Inkscape
+# https://github.com/oskay/wcb-ink/
+#
+# Lookahead acceleration planning for pen-down (painting) motion.
+#
+# Copyright 2020 Windell H. Oskay, Evil Mad Scientist Laboratories
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+'''
+All distances here are in motor steps, speeds in steps/s, accelerations in
+steps/s^2, and times in seconds unless noted otherwise.
+
+junctionSpeeds() takes a polyline (one flattened subpath) and finds the
+highest speed at which the brush may pass through each vertex: limited by
+the corner angle ("junction deviation", as in grbl), by the top speed, and
+by how fast we can speed up or slow down along the segments on either side.
+The first and last vertices are at rest.
+
+sliceMove() then turns one segment, with its entry and exit speeds, into a
+list of constant-speed SM moves that approximate a trapezoidal profile.
+
+rapidProfile() gives the (cached) trapezoid profile used for pen-up moves.
+'''
+
+import math
+
+try:
+    from functools import lru_cache
+except ImportError:    # Python 2: no profile cache
+    def lru_cache( maxsize ):
+        return lambda function: function
+
+import wcb_conf
+
+
+def junctionLimit( u_in, u_out, vMax, accel, deviation ):
+    '''
+    Maximum speed through the corner between unit vectors u_in and u_out.
+    deviation is the distance (steps) by which the path may be thought to
+    round the corner: larger values allow faster cornering.
+    '''
+    cosTheta = -( u_in[0] * u_out[0] + u_in[1] * u_out[1] )
+    if cosTheta > 0.999999:     # Full reversal
+        return 0.0
+    if cosTheta < -0.999999:    # Straight through
+        return vMax
+    sinHalfTheta = math.sqrt( 0.5 * ( 1.0 - cosTheta ) )
+    vSquared = accel * deviation * sinHalfTheta / ( 1.0 - sinHalfTheta )
+    return min( vMax, math.sqrt( vSquared ) )
+
+
+def junctionSpeeds( points, vMax, accel, deviation ):
+    '''
+    Return a list of speeds, one per point of the polyline [points],
+    giving the speed at which to pass through that vertex.
+    '''
+    count = len( points )
+    speeds = [0.0] * count
+    if count < 3:
+        return speeds
+
+    lengths = []
+    units = []
+    for i in range( count - 1 ):
+        dx = points[i + 1][0] - points[i][0]
+        dy = points[i + 1][1] - points[i][1]
+        length = math.sqrt( dx * dx + dy * dy )
+        lengths.append( length )
+        if length > 0:
+            units.append( ( dx / length, dy / length ) )
+        else:
+            units.append( None )
+
+    # Corner limits. A zero-length segment carries the direction of the
+    # segment before it, so that duplicated points do not force a stop.
+    # The passes below then carry the limit of the next real corner back to it.
+    lastUnit = units[0]
+    for i in range( 1, count - 1 ):
+        u_out = units[i]
+        if ( lastUnit is None ) or ( u_out is None ):
+            speeds[i] = vMax
+        else:
+            speeds[i] = junctionLimit( lastUnit, u_out, vMax, accel, deviation )
+        if u_out is not None:
+            lastUnit = u_out
+
+    # Backward pass: make sure that we can always slow down in time.
+    for i in range( count - 2, 0, -1 ):
+        reachable = math.sqrt( speeds[i + 1] ** 2 + 2.0 * accel * lengths[i] )
+        if speeds[i] > reachable:
+            speeds[i] = reachable
+
+    # Forward pass: make sure that we can reach each speed in time.
+    for i in range( 1, count ):
+        reachable = math.sqrt( speeds[i - 1] ** 2 + 2.0 * accel * lengths[i - 1] )
+        if speeds[i] > reachable:
+            speeds[i] = reachable
+
+    speeds[-1] = 0.0
+    return speeds
+
+
+def segmentProfile( length, vStart, vEnd, vMax, accel, timeSlice ):
+    '''
+    Break a segment of the given length into pieces of (distance, duration)
+    that speed up from vStart, cruise at (up to) vMax, and slow down to vEnd.
+    Acceleration and deceleration are split into pieces of about timeSlice.
+    '''
+    if length <= 0:
+        return []
+    vStart = min( vStart, vMax )
+    vEnd = min( vEnd, vMax )
+
+    dAccel = ( vMax * vMax - vStart * vStart ) / ( 2.0 * accel )
+    dDecel = ( vMax * vMax - vEnd * vEnd ) / ( 2.0 * accel )
+    if dAccel + dDecel <= length:
+        vPeak = vMax
+    else:
+        vPeak = math.sqrt( ( 2.0 * accel * length + vStart * vStart + vEnd * vEnd ) / 2.0 )
+        if vPeak < max( vStart, vEnd ):
+            # Entry and exit speeds cannot both be met (rounding of the step
+            # positions); fall back to a single linear ramp.
+            return [( length, 2.0 * length / max( vStart + vEnd, 1.0 ) )]
+        dAccel = ( vPeak * vPeak - vStart * vStart ) / ( 2.0 * accel )
+        dDecel = length - dAccel
+    dCruise = max( 0.0, length - dAccel - dDecel )
+
+    pieces = []
+    pieces.extend( rampPieces( vStart, vPeak, accel, timeSlice ) )
+    if dCruise > 0:
+        pieces.append( ( dCruise, dCruise / vPeak ) )
+    pieces.extend( rampPieces( vPeak, vEnd, accel, timeSlice ) )
+    return pieces
+
+
+def rampPieces( vFrom, vTo, accel, timeSlice ):
+    '''Constant-acceleration ramp between two speeds, as (distance, duration) pieces.'''
+    rampTime = abs( vTo - vFrom ) / accel
+    if rampTime <= 0:
+        return []
+    intervals = max( 1, int( math.ceil( rampTime / timeSlice ) ) )
+    dt = rampTime / intervals
+    dv = ( vTo - vFrom ) / intervals
+    pieces = []
+    velocity = vFrom
+    for _ in range( intervals ):
+        pieces.append( ( ( velocity + dv / 2.0 ) * dt, dt ) )
+        velocity += dv
+    return pieces
+
+
+def sliceMove( nDeltaX, nDeltaY, vStart, vEnd, vMax, accel, timeSlice, maxDuration ):
+    '''
+    Return a list of (xSteps, ySteps, time_ms) moves for a straight move of
+    (nDeltaX, nDeltaY) steps, following segmentProfile(). Step counts are
+    rounded along the way so that they add up to the full move exactly, and
+    no single move lasts longer than maxDuration ms.
+    '''
+    length = math.sqrt( nDeltaX * nDeltaX + nDeltaY * nDeltaY )
+    pieces = segmentProfile( length, vStart, vEnd, vMax, accel, timeSlice )
+
+    moves = []
+    travelled = 0.0
+    xDone = 0
+    yDone = 0
+    timeDebt = 0.0    # Rounding error in move times, in ms
+    for distance, duration in pieces:
+        splits = max( 1, int( math.ceil( duration * 1000.0 / maxDuration ) ) )
+        for _ in range( splits ):
+            travelled += distance / splits
+            fraction = min( 1.0, travelled / length )
+            xTarget = int( round( fraction * nDeltaX ) )
+            yTarget = int( round( fraction * nDeltaY ) )
+            exactTime = duration * 1000.0 / splits + timeDebt
+            td = max( 1, int( round( exactTime ) ) )
+            timeDebt = exactTime - td
+            if ( xTarget != xDone ) or ( yTarget != yDone ):
+                moves.append( ( xTarget - xDone, yTarget - yDone, td ) )
+                xDone = xTarget
+                yDone = yTarget
+            else:
+                timeDebt += td    # No steps in this piece; carry its time forward.
+    if ( xDone != nDeltaX ) or ( yDone != nDeltaY ):
+        moves.append( ( nDeltaX - xDone, nDeltaY - yDone, max( 1, int( round( timeDebt ) ) ) ) )
+    return moves
+
+
+def constantSpeedMoves( nDeltaX, nDeltaY, nTime, maxDuration ):
+    '''
+    Return a list of (xSteps, ySteps, time_ms) moves for a straight move of
+    (nDeltaX, nDeltaY) steps taking nTime ms at constant speed, broken into
+    moves that last no longer than maxDuration ms.
+    '''
+    moves = []
+    while ( ( abs( nDeltaX ) > 0 ) or ( abs( nDeltaY ) > 0 ) ):
+        if ( nTime > maxDuration ):
+            xd = int( math.floor( ( maxDuration * nDeltaX ) / nTime ) )
+            yd = int( math.floor( ( maxDuration * nDeltaY ) / nTime ) )
+            td = int( maxDuration )
+        else:
+            xd = nDeltaX
+            yd = nDeltaY
+            td = nTime
+            if ( td < 1 ):
+                td = 1        # don't allow zero-time moves.
+        moves.append( ( xd, yd, td ) )
+        nDeltaX -= xd
+        nDeltaY -= yd
+        nTime -= td
+    return moves
+
+
+def rapidProfile( plotDistance, speedLimit, accelRate, timeSlice ):
+    '''
+    Trapezoid profile for a pen-up rapid move of plotDistance steps: speed up
+    at accelRate, cruise at speedLimit if there is room, and slow down again.
+
+    Returns two tuples: the elapsed time (ms) at the end of each interval, and
+    the fraction of the move completed by then. Multiply the fractions by the
+    step counts of each axis to get the destinations.
+
+    Profiles are cached. The distance is first rounded up to a bin of at most
+    1/64 of its length, so that the many travel moves of similar length in a
+    plot share a profile. (Rounding up keeps the actual speed at or below the
+    speed limit: the same profile then covers a slightly shorter distance.)
+    '''
+    quantum = 1.0
+    if plotDistance > 64.0:
+        quantum = 2.0 ** math.floor( math.log( plotDistance / 64.0, 2 ) )
+    distanceKey = quantum * math.ceil( plotDistance / quantum )
+    return cachedRapidProfile( distanceKey, speedLimit, accelRate, timeSlice )
+
+
+@lru_cache( maxsize=wcb_conf.N_Profile_Cache_Size )
+def cachedRapidProfile( plotDistance, speedLimit, accelRate, timeSlice ):
+    durationArray = []
+    distArray = []
+
+    velocity = 0.0
+    timeElapsed = 0.0
+    position = 0.0
+
+    # Choose top speed by _estimating_ what it would be if we had continuous acceleration
+    #    Set (plotDistance/2) equal to (1/2) * a * (tAccel)^2 , and solve for t_accel:
+    #    Then, t_accel = sqrt( plotDistance / a)
+    tAccel = math.sqrt( plotDistance / accelRate )   #time interval for acceleration or deceleration
+
+    # Speed _after_ acceleration interval:
+    speedMax = accelRate * tAccel
+    if ( speedMax > speedLimit ):
+        speedMax = speedLimit    # This move is longer than 2*tAccel; We will reach _full cruising speed_!
+
+        intervals = int(math.floor(tAccel / timeSlice))    # Number of intervals each, during acceleration OR deceleration
+        timePerInterval = tAccel / intervals
+        #Add a center "cruising" speed interval if there is time for it only.
+
+        velocityStepSize = speedMax/(intervals + 1.0)
+        # For six time intervals of acceleration, first interval is at velocity (max/7)
+        # 6th (last) time interval is at 6*max/7
+        # after this interval, we are at full speed.
+
+        for index in range(0, intervals):        #Calculate acceleration phase
+            velocity += velocityStepSize
+            timeElapsed += timePerInterval
+            position += velocity * timePerInterval
+            durationArray.append(int(round(timeElapsed * 1000.0)))
+            distArray.append(position)        #Estimated distance along direction of travel
+
+        coastingDistance = plotDistance - (2 * position)
+
+        if (coastingDistance > (timePerInterval * speedMax)):
+            # There is enough time for (at least) one interval at full cruising speed.
+            velocity = speedMax
+            cruisingTime = coastingDistance / velocity
+            timeElapsed += cruisingTime
+            durationArray.append(int(round(timeElapsed * 1000.0)))
+            position += velocity * cruisingTime
+            distArray.append(position)        #Estimated distance along direction of travel
+
+        for index in range(0, intervals):        #Calculate deceleration phase
+            velocity -= velocityStepSize
+            timeElapsed += timePerInterval
+            position += velocity * timePerInterval
+            durationArray.append(int(round(timeElapsed * 1000.0)))
+            distArray.append(position)        #Estimated distance along direction of travel
+
+    else:
+        # We will _not_ reach full cruising speed.
+        intervals = int(math.floor( 2 * tAccel / timeSlice))    #TOTAL number of intervals, including acceleration and deceleration
+        if (intervals % 2 == 0):  # Even number of intervals:
+            intervals += 1    # Guarantee an odd number of intervals -- possibly a little shorter.
+
+        timePerInterval = (2 * tAccel) / intervals
+
+        accelIntervals = int(math.ceil(intervals / 2.0))
+        velocityStepSize = speedMax / accelIntervals
+
+        for index in range(0, accelIntervals):        #Calculate acceleration phase
+            velocity += velocityStepSize
+            timeElapsed += timePerInterval
+            position += velocity * timePerInterval
+            durationArray.append(int(round(timeElapsed * 1000.0)))
+            distArray.append(position)        #Estimated distance along direction of travel
+
+        for index in range(0, intervals - accelIntervals):        #Calculate deceleration phase
+            velocity -= velocityStepSize
+            timeElapsed += timePerInterval
+            position += velocity * timePerInterval
+            durationArray.append(int(round(timeElapsed * 1000.0)))
+            distArray.append(position)        #Estimated distance along direction of travel
+
+    # Fractional position along the intended path:
+    return tuple( durationArray ), tuple( [distance / position for distance in distArray] )
@@ -0,0 +1,124 @@
+# wcb_profile.py
+# Part of the WaterColorBot driver for Inkscape
+# https://github.com/oskay/wcb-ink/
+#
+# Timing of the phases of a plot, for finding out where the time goes.
+#
+# Copyright 2020 Windell H. Oskay, Evil Mad Scientist Laboratories
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+'''
+A Profiler times calls to the methods that it wraps, grouped into named
+phases. For each phase, it keeps the number of calls, the total time spent
+in them, the "self" time (total time, less any time spent in other wrapped
+phases called from within), the longest call, and a histogram of call
+durations. Only the outermost of nested calls in one phase is timed, so that
+a recursive method's time is counted once.
+
+Wrapping replaces the method on that one object only, so there is no cost
+at all unless profiling is turned on.
+'''
+
+import json
+import time
+
+# Upper limits (ms) of the histogram bins. A last bin holds anything longer.
+HISTOGRAM_LIMITS = ( 0.1, 1, 10, 100, 1000 )
+
+
+class PhaseStats( object ):
+
+    def __init__( self ):
+        self.count = 0
+        self.total = 0.0
+        self.selfTime = 0.0
+        self.longest = 0.0
+        self.histogram = [0] * ( len( HISTOGRAM_LIMITS ) + 1 )
+
+    def add( self, elapsed, selfTime ):
+        self.count += 1
+        self.total += elapsed
+        self.selfTime += selfTime
+        if elapsed > self.longest:
+            self.longest = elapsed
+        ms = elapsed * 1000.0
+        for index, limit in enumerate( HISTOGRAM_LIMITS ):
+            if ms < limit:
+                self.histogram[index] += 1
+                break
+        else:
+            self.histogram[-1] += 1
+
+    def summary( self ):
+        labels = ['<%gms' % limit for limit in HISTOGRAM_LIMITS] + ['>=%gms' % HISTOGRAM_LIMITS[-1]]
+        return {
+            'count': self.count,
+            'total_s': round( self.total, 6 ),
+            'self_s': round( self.selfTime, 6 ),
+            'max_ms': round( self.longest * 1000.0, 3 ),
+            'histogram': dict( ( label, count ) for label, count in zip( labels, self.histogram ) if count ),
+        }
+
+
+class Profiler( object ):
+
+    def __init__( self ):
+        self.phases = {}
+        self.stack = []       # [start time, time in nested phases] for each active call
+        self.active = set()   # Phases with a call being timed
+        self.started = time.time()
+
+    def wrap( self, owner, name, phase ):
+        '''
+        Time each call of method [name] of object [owner] as part of [phase]. Calls made
+        from within the same phase (as by a recursive method) are not counted separately.
+        '''
+        method = getattr( owner, name, None )
+        if method is None:
+            return
+        stats = self.phases.setdefault( phase, PhaseStats() )
+        stack = self.stack
+        active = self.active
+
+        def timed( *args, **kwargs ):
+            if phase in active:
+                return method( *args, **kwargs )    # Timed as part of the outermost call in the phase
+            frame = [time.time(), 0.0]
+            stack.append( frame )
+            active.add( phase )
+            try:
+                return method( *args, **kwargs )
+            finally:
+                active.discard( phase )
+                stack.pop()
+                elapsed = time.time() - frame[0]
+                stats.add( elapsed, elapsed - frame[1] )
+                if stack:
+                    stack[-1][1] += elapsed
+
+        setattr( owner, name, timed )
+
+    def report( self ):
+        '''The collected timings, as a dictionary that can be saved as JSON.'''
+        phases = dict( ( phase, stats.summary() ) for phase, stats in self.phases.items() if stats.count )
+        return { 'wall_s': round( time.time() - self.started, 6 ), 'phases': phases }
+
+    def reportText( self ):
+        return json.dumps( self.report(), sort_keys=True, separators=( ',', ':' ) )
+
+    def save( self, fileName ):
+        with open( fileName, 'w' ) as outFile:
+            json.dump( self.report(), outFile, sort_keys=True, indent=1 )
@@ -0,0 +1,257 @@
+# wcb_program.py
+# Part of the WaterColorBot driver for Inkscape
+# https://github.com/oskay/wcb-ink/
+#
+# Compiled motion programs: plan a plot once, paint it many times.
+#
+# Copyright 2020 Windell H. Oskay, Evil Mad Scientist Laboratories
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+'''
+A MotionProgram is the complete list of EBB commands for a plot, kept in a
+flat array of 32-bit integers: four per record (opcode and three arguments).
+Besides commands, it holds markers that are not sent to the EBB: the end of
+each painted path (with the path and node counts used for resuming), and the
+start and end of each re-inking trip.
+
+To compile a plot, WCB plots into a ProgramRecorder instead of a serial port.
+The recorder answers queries the way an idle EBB would, and records every
+command. MotionProgram.stream() later replays the commands to a real port,
+without any of the SVG parsing or planning that produced them.
+
+File format (little-endian): the header "<4sIIId" (magic, format version,
+record count, string count, steps per pixel), the records, and then any
+commands that have no opcode of their own, as ASCII text, one per line.
+'''
+
+import struct
+import sys
+from array import array
+from collections import deque
+
+import wcb_cache
+import wcb_motion
+
+from plot_utils_import import from_dependency_import # plotink
+ebb_serial = from_dependency_import('plotink.ebb_serial')
+
+MAGIC = b'WCBP'
+VERSION = 1
+HEADER = '<4sIIId'
+
+OP_SM = 1       # duration (ms), steps (axis 1), steps (axis 2)
+OP_SP = 2       # state, delay (ms)
+OP_SC = 3       # parameter, value
+OP_EM = 4       # enable/resolution (motor 1), (motor 2)
+OP_RAW = 5      # index into the string table
+OP_PATH = 16    # Marker: path count, node count after the path was completed
+OP_REINK = 17   # Marker: 1 at the start of a re-inking trip, 0 at its end
+
+QUERY_REPLIES = {
+    'QB': [b'0\r\n', b'OK\r\n'],     # Button not pressed
+    'QP': [b'1\r\n', b'OK\r\n'],     # Pen is up
+    'QM': [b'QM,0,0,0,0\r\n'],       # Not moving
+    'V': [b'EBBv13_and_above (motion program recorder)\r\n'],
+}
+
+
+class MotionProgram( object ):
+
+    def __init__( self, stepsPerPx=0.0 ):
+        self.records = array( 'i' )
+        self.strings = []
+        self.stepsPerPx = stepsPerPx
+
+    def __len__( self ):
+        return len( self.records ) // 4
+
+    def append( self, op, a=0, b=0, c=0 ):
+        self.records.extend( ( op, a, b, c ) )
+
+    def addCommand( self, cmd ):
+        '''Parse an EBB command string, and add it as a record.'''
+        fields = cmd.strip().split( ',' )
+        name = fields[0].upper()
+        try:
+            args = [int( field ) for field in fields[1:]]
+        except ValueError:
+            args = None
+        if args is not None:
+            if ( name == 'SM' ) and ( len( args ) == 3 ):
+                self.append( OP_SM, *args )
+                return
+            if ( name == 'SP' ) and ( len( args ) == 2 ):
+                self.append( OP_SP, *args )
+                return
+            if ( name in ( 'SC', 'EM' ) ) and ( len( args ) == 2 ):
+                self.append( OP_SC if name == 'SC' else OP_EM, *args )
+                return
+        self.strings.append( cmd.strip() )
+        self.append( OP_RAW, len( self.strings ) - 1 )
+
+    def command( self, index ):
+        '''The EBB command string for record [index], or None for a marker.'''
+        op, a, b, c = self.records[4 * index:4 * index + 4]
+        if op == OP_SM:
+            return 'SM,%d,%d,%d\r' % ( a, b, c )
+        if op == OP_SP:
+            return 'SP,%d,%d\r' % ( a, b )
+        if op == OP_SC:
+            return 'SC,%d,%d\r' % ( a, b )
+        if op == OP_EM:
+            return 'EM,%d,%d\r' % ( a, b )
+        if op == OP_RAW:
+            return self.strings[a] + '\r'
+        return None
+
+    def statistics( self ):
+        '''Return (commands, paths, re-ink trips, motion time in seconds).'''
+        commands = 0
+        paths = 0
+        reInks = 0
+        motionTime = 0
+        records = self.records
+        for index in range( 0, len( records ), 4 ):
+            op = records[index]
+            if op == OP_PATH:
+                paths += 1
+            elif op == OP_REINK:
+                if records[index + 1]:
+                    reInks += 1
+            else:
+                commands += 1
+                if op == OP_SM:
+                    motionTime += records[index + 1]
+                elif op == OP_SP:
+                    motionTime += records[index + 2]
+        return commands, paths, reInks, motionTime / 1000.0
+
+    def save( self, fileName ):
+        records = array( 'i', self.records )
+        if sys.byteorder != 'little':
+            records.byteswap()
+        with open( fileName, 'wb' ) as outFile:
+            outFile.write( struct.pack( HEADER, MAGIC, VERSION, len( self ),
+                len( self.strings ), self.stepsPerPx ) )
+            outFile.write( wcb_cache.arrayBytes( records ) )
+            for line in self.strings:
+                outFile.write( line.encode( 'ascii' ) + b'\n' )
+
+    @classmethod
+    def load( cls, fileName ):
+        with open( fileName, 'rb' ) as inFile:
+            data = inFile.read()
+        headerSize = struct.calcsize( HEADER )
+        magic, version, count, stringCount, stepsPerPx = struct.unpack( HEADER, data[:headerSize] )
+        if ( magic != MAGIC ) or ( version != VERSION ):
+            raise ValueError( 'Not a WaterColorBot motion program: ' + fileName )
+        program = cls( stepsPerPx )
+        recordEnd = headerSize + 16 * count
+        wcb_cache.extendFromBytes( program.records, data[headerSize:recordEnd] )
+        if sys.byteorder != 'little':
+            program.records.byteswap()
+        if stringCount:
+            program.strings = data[recordEnd:].decode( 'ascii' ).split( '\n' )[:stringCount]
+        return program
+
+    def stateAt( self, index ):
+        '''
+        The state of the EBB just before record [index] is sent: the configuration
+        commands (SC and EM) sent until then, in order; whether the pen is down; and
+        the steps moved on each axis since the start of the program.
+        '''
+        configuration = []
+        penDown = False
+        steps1 = 0
+        steps2 = 0
+        records = self.records
+        for position in range( 0, 4 * min( index, len( self ) ), 4 ):
+            op = records[position]
+            if op == OP_SM:
+                steps1 += records[position + 2]
+                steps2 += records[position + 3]
+            elif op == OP_SP:
+                penDown = ( records[position + 1] == 0 )
+            elif op in ( OP_SC, OP_EM ):
+                configuration.append( self.command( position // 4 ) )
+        return configuration, penDown, steps1, steps2
+
+    def stream( self, port, buttonMonitor=None, start=0 ):
+        '''
+        Send the program to the EBB, beginning with record [start].
+        If the pause button is pressed, stop at the end of the current path,
+        leaving the pen as it is (see stateAt()).
+        Returns (index of the next record to send, steps moved on each axis).
+        '''
+        steps1 = 0
+        steps2 = 0
+        for index in range( start, len( self ) ):
+            cmd = self.command( index )
+            if cmd is not None:
+                ebb_serial.command( port, cmd )
+                if self.records[4 * index] == OP_SM:
+                    steps1 += self.records[4 * index + 2]
+                    steps2 += self.records[4 * index + 3]
+            elif ( self.records[4 * index] == OP_PATH ) and ( buttonMonitor is not None ):
+                if buttonMonitor.check():
+                    return index + 1, steps1, steps2
+        return len( self ), steps1, steps2
+
+
+class ProgramRecorder( object ):
+    '''
+    Stand-in for the serial port while compiling: records each command into
+    a MotionProgram, and answers queries as an idle EBB would.
+    '''
+
+    def __init__( self, program ):
+        self.program = program
+        self.responses = deque()
+        self.errors = []
+
+    def write( self, data ):
+        cmd = data.decode( 'ascii' )
+        name = wcb_motion.commandName( cmd )
+        if name in QUERY_REPLIES:
+            self.responses.extend( QUERY_REPLIES[name] )
+        else:
+            self.program.addCommand( cmd )
+            self.responses.append( b'OK\r\n' )
+        return len( data )
+
+    def readline( self ):
+        if self.responses:
+            return self.responses.popleft()
+        return b''
+
+    @property
+    def in_waiting( self ):
+        return sum( len( response ) for response in self.responses )
+
+    def query( self, cmd ):
+        self.write( cmd.encode( 'ascii' ) )
+        response = self.readline().decode( 'ascii' )
+        self.responses.clear()
+        return response
+
+    def markPath( self, pathCount, nodeCount ):
+        self.program.append( OP_PATH, pathCount, nodeCount )
+
+    def markReInk( self, starting ):
+        self.program.append( OP_REINK, int( starting ) )
+
+    def close( self ):
+        pass
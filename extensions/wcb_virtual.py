@@ -0,0 +1,311 @@
+# wcb_virtual.py
+# Part of the WaterColorBot driver for Inkscape
+# https://github.com/oskay/wcb-ink/
+#
+# A simulated EBB, for running the driver without a WaterColorBot.
+#
+# Copyright 2020 Windell H. Oskay, Evil Mad Scientist Laboratories
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+'''
+VirtualEBB can be used anywhere a serial port from ebb_serial.openPort() is
+expected. It accepts the commands that the driver sends (SM, SP, SC, EM and
+the QB, QP, QM and V queries) and keeps track of what a real EBB would do
+with them, in simulated time:
+
+ - Each motion command (SM, or SP with a delay) runs after the previous one.
+ - The EBB holds only a few motion commands (N_Virtual_Queue_Depth) besides
+   the one that it is executing. Once that is full, it stops reading until a
+   slot frees up, and its "OK" replies are delayed to match.
+ - Every reply takes F_Virtual_Latency to come back to the host.
+
+Nothing actually waits: the host side reads its time from VirtualEBB.clock,
+which jumps ahead whenever the host would have been blocked. MotionPipeline
+picks up this clock automatically, so a full plot (washing and re-inking
+included) runs as fast as the host can plan it, and report() then gives the
+plot time, distances and command counts that it would have taken.
+'''
+
+import math
+from collections import Counter, deque
+
+import wcb_conf
+import wcb_motion
+
+
+class VirtualClock( object ):
+    '''Stand-in for the time module: time() and sleep(), in simulated seconds.'''
+
+    def __init__( self ):
+        self.now = 0.0
+
+    def time( self ):
+        return self.now
+
+    def sleep( self, seconds ):
+        if seconds > 0:
+            self.now += seconds
+
+    def advance( self, when ):
+        '''Move the clock forward to time [when], if that is in the future.'''
+        if when > self.now:
+            self.now = when
+
+
+class VirtualEBB( object ):
+
+    def __init__( self, queueDepth=None, latency=None, pressAfter=None ):
+        if queueDepth is None:
+            queueDepth = wcb_conf.N_Virtual_Queue_Depth
+        if latency is None:
+            latency = wcb_conf.F_Virtual_Latency
+        self.clock = VirtualClock()
+        self.queueDepth = queueDepth
+        self.latency = latency
+        self.pressAfter = pressAfter  # Report a button press at this QB query (for testing pauses)
+        self.partial = ''
+        self.responses = deque()      # (time at which it can be read, reply)
+        self.queue = deque()          # Finish times of the motion commands held by the EBB
+        self.ebbTime = 0.0            # Time at which the EBB has finished reading all commands so far
+        self.motionEnd = 0.0          # Time at which all queued motion is finished
+        self.penUp = True
+        self.motorsEnabled = False
+        self.stepsPerInch = wcb_conf.F_DPI_16X
+        self.position = [0, 0]        # Motor steps, relative to the position at start
+        self.servo = {}               # SC parameters, as last set
+        self.commandCounts = Counter()
+        self.buttonQueries = 0
+        self.penLifts = 0
+        self.penDownDistance = 0.0    # inches
+        self.penUpDistance = 0.0      # inches
+        self.penDownTime = 0.0        # seconds of SM motion
+        self.penUpTime = 0.0
+        self.servoTime = 0.0          # seconds of SP delays
+        self.hostWaitTime = 0.0       # Time the host spent waiting for a reply
+        self.errors = []              # (command, reply) for commands that were not understood
+
+    def write( self, data ):
+        self.partial += data.decode( 'ascii' )
+        while '\r' in self.partial:
+            cmd, self.partial = self.partial.split( '\r', 1 )
+            self.execute( cmd.strip() )
+        return len( data )
+
+    def readline( self ):
+        if not self.responses:
+            return b''
+        ready, reply = self.responses.popleft()
+        if ready > self.clock.now:
+            self.hostWaitTime += ready - self.clock.now
+            self.clock.advance( ready )
+        return reply
+
+    @property
+    def in_waiting( self ):
+        now = self.clock.now
+        return sum( len( reply ) for ready, reply in self.responses if ready <= now )
+
+    def query( self, cmd ):
+        '''Send a query and return its reply, as MotionPipeline.query() does.'''
+        self.write( cmd.encode( 'ascii' ) )
+        response = self.readline().decode( 'ascii' )
+        if wcb_motion.commandName( cmd ) not in ( 'QM', 'V' ):
+            self.readline()    # Extra "OK" line after the data requested
+        return response
+
+    def close( self ):
+        pass
+
+    def execute( self, cmd ):
+        self.ebbTime = max( self.ebbTime, self.clock.now )
+        name = wcb_motion.commandName( cmd )
+        self.commandCounts[name] += 1
+        fields = cmd.split( ',' )
+        try:
+            args = [int( field ) for field in fields[1:]]
+        except ValueError:
+            self.reply( '!8 Err: Invalid parameter' )
+            self.errors.append( ( cmd, '!8 Err: Invalid parameter' ) )
+            return
+
+        if name == 'SM' and len( args ) >= 2:
+            duration = args[0] / 1000.0
+            steps1 = args[1]
+            steps2 = args[2] if len( args ) > 2 else 0
+            self.position[0] += steps1
+            self.position[1] += steps2
+            self.addMove( duration, math.hypot( steps1, steps2 ) / self.stepsPerInch )
+            self.addMotion( duration )
+            self.reply( 'OK' )
+        elif name == 'SP' and len( args ) >= 1:
+            penUp = ( args[0] == 1 )
+            if penUp and not self.penUp:
+                self.penLifts += 1
+            self.penUp = penUp
+            delay = args[1] / 1000.0 if len( args ) > 1 else 0.0
+            self.addServoDelay( delay )
+            self.addMotion( delay )
+            self.reply( 'OK' )
+        elif name == 'SC' and len( args ) >= 2:
+            self.servo[args[0]] = args[1]
+            self.reply( 'OK' )
+        elif name == 'EM' and len( args ) >= 1:
+            self.motorsEnabled = ( args[0] != 0 )
+            if 1 <= args[0] <= 5:
+                self.stepsPerInch = wcb_conf.F_DPI_16X / 2 ** ( args[0] - 1 )
+            self.reply( 'OK' )
+        elif name == 'QB':
+            self.buttonQueries += 1
+            pressed = ( self.pressAfter is not None ) and ( self.buttonQueries == self.pressAfter )
+            self.reply( '1' if pressed else '0' )
+            self.reply( 'OK' )
+        elif name == 'QP':
+            self.reply( '1' if self.penUp else '0' )
+            self.reply( 'OK' )
+        elif name == 'QM':
+            moving = 1 if self.motionEnd > self.ebbTime else 0
+            self.reply( 'QM,%d,%d,%d,%d' % ( moving, moving, moving, moving ) )
+        elif name == 'V':
+            self.reply( 'EBBv13_and_above EB Firmware Version 2.8.1 (virtual)' )
+        else:
+            self.reply( '!8 Err: Unknown command' )
+            self.errors.append( ( cmd, '!8 Err: Unknown command' ) )
+
+    def addMove( self, duration, distance ):
+        '''Account for an SM move of [distance] inches.'''
+        if self.penUp:
+            self.penUpDistance += distance
+            self.penUpTime += duration
+        else:
+            self.penDownDistance += distance
+            self.penDownTime += duration
+
+    def addServoDelay( self, delay ):
+        self.servoTime += delay
+
+    def addMotion( self, duration ):
+        '''Queue a motion command, first waiting (in simulated time) for room in the queue.'''
+        queue = self.queue
+        while queue and queue[0] <= self.ebbTime:
+            queue.popleft()
+        if len( queue ) > self.queueDepth:
+            self.ebbTime = queue[len( queue ) - self.queueDepth - 1]
+            while queue and queue[0] <= self.ebbTime:
+                queue.popleft()
+        self.motionEnd = max( self.motionEnd, self.ebbTime ) + duration
+        queue.append( self.motionEnd )
+
+    def reply( self, text ):
+        self.responses.append( ( self.ebbTime + self.latency, ( text + '\r\n' ).encode( 'ascii' ) ) )
+
+    def plotTime( self ):
+        '''Simulated time (s) from the start until all motion is finished.'''
+        return max( self.motionEnd, self.clock.now )
+
+    def report( self ):
+        counts = ', '.join( '%s: %d' % ( name, count ) for name, count in sorted( self.commandCounts.items() ) )
+        lines = [
+            'Virtual EBB: simulated plot time %.1f s.' % self.plotTime(),
+            '  Brush down: %.1f in. (%.1f s); brush up: %.1f in. (%.1f s); servo delays: %.1f s.' % (
+                self.penDownDistance, self.penDownTime, self.penUpDistance, self.penUpTime, self.servoTime ),
+            '  Brush lifts: %d. Host waited %.1f s for replies.' % ( self.penLifts, self.hostWaitTime ),
+            '  Commands: ' + counts,
+            ]
+        if self.errors:
+            lines.append( '  Commands not understood: %d (first: %s)' % ( len( self.errors ), self.errors[0][0] ) )
+        return '\n'.join( lines )
+
+
+class PlotEstimator( VirtualEBB ):
+    '''
+    Virtual EBB for dry runs. Besides the totals kept by VirtualEBB, it sorts
+    the time and distance into the phases of the plot that the driver marks
+    with beginPhase() and endPhase() (washing, loading paint, re-inking),
+    and keeps separate totals for each layer, as marked by setLayer().
+    Moves outside of any phase count as brush-down or brush-up painting, and
+    pen-lift delays outside of any phase as servo time.
+
+    There is no USB latency, and the driver does not wrap it in a
+    MotionPipeline, so that estimates stay fast on large documents.
+    '''
+
+    CATEGORIES = ( 'brush down', 'brush up', 'servo', 'wash', 'paint', 're-ink' )
+
+    def __init__( self ):
+        VirtualEBB.__init__( self, latency=0.0 )
+        self.phases = []
+        self.phaseCounts = Counter()
+        self.layer = None
+        self.layers = []               # Layer names, in the order first painted
+        self.times = {}                # (layer, category): seconds
+        self.distances = {}            # (layer, category): inches
+
+    def beginPhase( self, name ):
+        self.phases.append( name )
+        self.phaseCounts[name] += 1
+
+    def endPhase( self ):
+        self.phases.pop()
+
+    def setLayer( self, name ):
+        self.layer = name
+
+    def category( self, moving ):
+        if self.phases:
+            return self.phases[-1]
+        if not moving:
+            return 'servo'
+        return 'brush up' if self.penUp else 'brush down'
+
+    def tally( self, category, duration, distance ):
+        if self.layer not in self.layers:
+            self.layers.append( self.layer )
+        key = ( self.layer, category )
+        self.times[key] = self.times.get( key, 0.0 ) + duration
+        self.distances[key] = self.distances.get( key, 0.0 ) + distance
+
+    def addMove( self, duration, distance ):
+        VirtualEBB.addMove( self, duration, distance )
+        self.tally( self.category( True ), duration, distance )
+
+    def addServoDelay( self, delay ):
+        VirtualEBB.addServoDelay( self, delay )
+        self.tally( self.category( False ), delay, 0.0 )
+
+    def total( self, category, layer=None, table=None ):
+        if table is None:
+            table = self.times
+        return sum( value for ( keyLayer, keyCategory ), value in table.items()
+            if keyCategory == category and ( layer is None or keyLayer == layer ) )
+
+    def report( self ):
+        def minutes( seconds ):
+            return '%d:%04.1f' % ( seconds // 60, seconds % 60 )
+
+        lines = [ 'Dry run: estimated painting time %s (min:s).' % minutes( self.plotTime() ) ]
+        lines.append( '  ' + ', '.join( '%s %s' % ( category, minutes( self.total( category ) ) )
+            for category in self.CATEGORIES ) )
+        lines.append( '  Travel: %.1f in. with the brush down, %.1f in. with the brush up.' % (
+            self.penDownDistance, self.penUpDistance ) )
+        lines.append( '  Brush washes: %d, paint changes: %d, re-inking trips: %d, brush lifts: %d.' % (
+            self.phaseCounts['wash'], self.phaseCounts['paint'], self.phaseCounts['re-ink'], self.penLifts ) )
+        for layer in self.layers:
+            if layer is None:
+                continue
+            layerTime = sum( self.total( category, layer ) for category in self.CATEGORIES )
+            lines.append( '  Layer "%s": %s; painted %.1f in. in %s.' % ( layer, minutes( layerTime ),
+                self.total( 'brush down', layer, self.distances ), minutes( self.total( 'brush down', layer ) ) ) )
+        return '\n'.join( lines )
@@ -0,0 +1,173 @@
+# test_motion.py
+# Part of the WaterColorBot driver for Inkscape
+#
+# Tests of the serial command pipeline (wcb_motion.MotionPipeline), against a
+# scripted port that stands in for the EBB.
+#
+# Usage: python -m pytest tests   (or: python -m unittest discover tests)
+
+import os
+import sys
+import unittest
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), '..', 'extensions' ) )
+
+from plotink import ebb_serial
+
+import wcb_conf
+import wcb_motion
+
+
+class ScriptedClock( object ):
+    '''A clock that only moves when slept on, so that no test waits.'''
+
+    def __init__( self ):
+        self.now = 0.0
+
+    def time( self ):
+        return self.now
+
+    def sleep( self, seconds ):
+        self.now += max( 0.0, seconds )
+
+
+class ScriptedPort( object ):
+    '''
+    Fake serial port. Each command written is answered as [replies] gives (by the
+    command string, without its "\\r"), or else with "OK". Every reply is ready to
+    read as soon as its command has been written.
+    '''
+
+    def __init__( self, replies=None ):
+        self.replies = replies or {}
+        self.writes = []      # Each write, as a list of the commands that it carried
+        self.answers = []     # (command, reply line) pairs, not yet read
+        self.reads = []       # Commands whose reply lines have been read, in order
+        self.partial = ''
+
+    def write( self, data ):
+        self.partial += data.decode( 'ascii' )
+        commands = self.partial.split( '\r' )
+        self.partial = commands.pop()
+        self.writes.append( commands )
+        for cmd in commands:
+            for line in self.replies.get( cmd, ['OK'] ):
+                self.answers.append( ( cmd, line + '\r\n' ) )
+
+    @property
+    def in_waiting( self ):
+        return sum( len( line ) for unused_cmd, line in self.answers )
+
+    def readline( self ):
+        if not self.answers:
+            return b''
+        cmd, line = self.answers.pop( 0 )
+        self.reads.append( cmd )
+        return line.encode( 'ascii' )
+
+    def close( self ):
+        pass
+
+    def written( self ):
+        return [cmd for commands in self.writes for cmd in commands]
+
+
+class MotionPipelineTest( unittest.TestCase ):
+
+    def setUp( self ):
+        self.lowWater = wcb_conf.N_Pipeline_Low_Water
+        wcb_conf.N_Pipeline_Low_Water = 0
+
+    def tearDown( self ):
+        wcb_conf.N_Pipeline_Low_Water = self.lowWater
+
+    def pipeline( self, port, depth=8, batch=4 ):
+        return wcb_motion.MotionPipeline( port, depth=depth, batch=batch, lookahead=0.2,
+            statusQueries=False, clock=ScriptedClock() )
+
+    def moves( self, count ):
+        return ['SM,100,{0},{1}'.format( i, -i ) for i in range( count )]
+
+    def testBatching( self ):
+        port = ScriptedPort()
+        pipeline = self.pipeline( port, batch=4 )
+        moves = self.moves( 20 )
+        for cmd in moves:
+            ebb_serial.command( pipeline, cmd + '\r' )
+        pipeline.flush()
+        self.assertEqual( port.written(), moves )
+        self.assertTrue( all( len( commands ) <= 4 for commands in port.writes ) )
+        self.assertTrue( any( len( commands ) > 1 for commands in port.writes ) )
+        self.assertLess( pipeline.writeCount, pipeline.commandCount )
+
+    def testNoPipelining( self ):
+        port = ScriptedPort()
+        pipeline = self.pipeline( port, depth=0 )
+        for cmd in self.moves( 5 ):
+            ebb_serial.command( pipeline, cmd + '\r' )
+            self.assertEqual( port.answers, [] )    # Each "OK" read at once
+        self.assertEqual( [len( commands ) for commands in port.writes], [1] * 5 )
+
+    def testDeferredAcks( self ):
+        port = ScriptedPort()
+        pipeline = self.pipeline( port, depth=8, batch=100 )
+        pipeline.write( b'SM,100,1,1\r' )
+        self.assertEqual( pipeline.localAcks, 1 )
+        self.assertEqual( pipeline.readline(), b'OK\r\n' )    # Answered locally
+        self.assertEqual( pipeline.localAcks, 0 )
+        self.assertEqual( port.reads, [] )
+
+        for cmd in self.moves( 30 ):
+            ebb_serial.command( pipeline, cmd + '\r' )
+            self.assertEqual( pipeline.localAcks, 0 )
+            self.assertLessEqual( len( pipeline.outstanding ), pipeline.depth )
+        self.assertEqual( len( port.reads ) + len( pipeline.outstanding ), len( port.written() ) )
+        pipeline.flush()
+        self.assertEqual( port.reads, port.written() )
+        self.assertEqual( pipeline.errors, [] )
+
+    def testErrors( self ):
+        port = ScriptedPort( { 'SM,100,2,-2': ['!8 Err: Unknown command'] } )
+        pipeline = self.pipeline( port )
+        for cmd in self.moves( 5 ):
+            ebb_serial.command( pipeline, cmd + '\r' )
+        self.assertEqual( pipeline.errors, [] )    # Not yet read
+        pipeline.flush()
+        self.assertEqual( pipeline.errors, [( 'SM,100,2,-2', '!8 Err: Unknown command' )] )
+
+    def testQueryDrainsAcks( self ):
+        port = ScriptedPort( { 'QB': ['1', 'OK'] } )
+        pipeline = self.pipeline( port, batch=100 )
+        moves = self.moves( 6 )
+        for cmd in moves:
+            ebb_serial.command( pipeline, cmd + '\r' )
+        self.assertEqual( pipeline.query( 'QB\r' ).strip(), '1' )
+        self.assertEqual( port.reads, moves + ['QB', 'QB'] )
+        self.assertEqual( len( pipeline.pending ), 0 )
+        self.assertEqual( len( pipeline.outstanding ), 0 )
+        self.assertEqual( port.answers, [] )
+
+    def testFlushDrainsAcks( self ):
+        port = ScriptedPort()
+        pipeline = self.pipeline( port, batch=3 )
+        moves = self.moves( 7 )
+        for cmd in moves:
+            ebb_serial.command( pipeline, cmd + '\r' )
+        pipeline.flush()
+        self.assertEqual( port.reads, moves )
+        self.assertEqual( len( pipeline.pending ), 0 )
+        self.assertEqual( len( pipeline.outstanding ), 0 )
+
+    def testMachineState( self ):
+        port = ScriptedPort()
+        port.machineState = {}
+        pipeline = self.pipeline( port )
+        for cmd in ( 'SC,4,12000', 'SC,5,16000', 'EM,1,1', 'SC,4,12000', 'EM,1,1', 'SC,5,15000' ):
+            ebb_serial.command( pipeline, cmd + '\r' )
+        pipeline.flush()
+        self.assertEqual( port.written(), ['SC,4,12000', 'SC,5,16000', 'EM,1,1', 'SC,5,15000'] )
+        self.assertEqual( pipeline.skipCount, 2 )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+# test_planner.py
+# Part of the WaterColorBot driver for Inkscape
+#
+# Tests of the velocity profiles of the lookahead planner (wcb_planner.py).
+#
+# Usage: python -m pytest tests   (or: python -m unittest discover tests)
+
+import math
+import os
+import sys
+import unittest
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), '..', 'extensions' ) )
+
+import wcb_planner
+
+V_MAX = 2000.0        # steps/s
+ACCEL = 8000.0        # steps/s^2
+DEVIATION = 10.0      # steps
+TIME_SLICE = 0.030    # s
+TOLERANCE = 1e-6
+
+
+def pieceSpeeds( pieces ):
+    return [distance / duration for distance, duration in pieces]
+
+
+class JunctionSpeedTest( unittest.TestCase ):
+
+    def testCornerLimits( self ):
+        square = [[0, 0], [4000, 0], [4000, 4000], [0, 4000], [0, 0]]
+        speeds = wcb_planner.junctionSpeeds( square, V_MAX, ACCEL, DEVIATION )
+        # Right angle: sin(theta/2) = sqrt(1/2)
+        sinHalf = math.sqrt( 0.5 )
+        corner = math.sqrt( ACCEL * DEVIATION * sinHalf / ( 1.0 - sinHalf ) )
+        self.assertLess( corner, V_MAX )
+        for speed in speeds[1:-1]:
+            self.assertAlmostEqual( speed, corner )
+
+    def testStraightAndReversal( self ):
+        straight = [[0, 0], [4000, 0], [8000, 0]]
+        self.assertAlmostEqual( wcb_planner.junctionSpeeds( straight, V_MAX, ACCEL, DEVIATION )[1], V_MAX )
+        reversal = [[0, 0], [4000, 0], [0, 0]]
+        self.assertEqual( wcb_planner.junctionSpeeds( reversal, V_MAX, ACCEL, DEVIATION )[1], 0.0 )
+
+    def testShallowerCornersAreFaster( self ):
+        limits = [wcb_planner.junctionLimit( ( 1.0, 0.0 ), ( math.cos( angle ), math.sin( angle ) ),
+            1e9, ACCEL, DEVIATION ) for angle in ( 2.5, 1.5, 0.5, 0.1 )]
+        self.assertEqual( limits, sorted( limits ) )
+
+    def testEndsAtRest( self ):
+        points = [[0, 0], [3000, 100], [6000, 0], [9000, 200]]
+        speeds = wcb_planner.junctionSpeeds( points, V_MAX, ACCEL, DEVIATION )
+        self.assertEqual( speeds[0], 0.0 )
+        self.assertEqual( speeds[-1], 0.0 )
+
+    def testAccelerationBetweenVertices( self ):
+        # Short segments, with gentle corners: the speeds are limited by acceleration.
+        points = [[i * 37, int( 40 * math.sin( i / 3.0 ) )] for i in range( 60 )]
+        points.append( points[-1][:] )    # A duplicated point must not force a stop
+        speeds = wcb_planner.junctionSpeeds( points, V_MAX, ACCEL, DEVIATION )
+        self.assertGreater( max( speeds ), 0.0 )
+        for i in range( len( points ) - 1 ):
+            length = math.hypot( points[i + 1][0] - points[i][0], points[i + 1][1] - points[i][1] )
+            self.assertLessEqual( abs( speeds[i + 1] ** 2 - speeds[i] ** 2 ),
+                2.0 * ACCEL * length + TOLERANCE )
+
+
+class SegmentProfileTest( unittest.TestCase ):
+
+    def checkProfile( self, length, vStart, vEnd ):
+        pieces = wcb_planner.segmentProfile( length, vStart, vEnd, V_MAX, ACCEL, TIME_SLICE )
+        self.assertAlmostEqual( sum( distance for distance, unused in pieces ), length )
+        speeds = pieceSpeeds( pieces )
+        self.assertLessEqual( max( speeds ), V_MAX + TOLERANCE )
+
+        # No change in speed, from the middle of one piece to the middle of the next,
+        # is faster than the acceleration limit.
+        for i in range( len( pieces ) - 1 ):
+            dt = ( pieces[i][1] + pieces[i + 1][1] ) / 2.0
+            self.assertLessEqual( abs( speeds[i + 1] - speeds[i] ) / dt, ACCEL * ( 1.0 + TOLERANCE ) )
+
+        # Entry and exit speeds: each end piece is half a ramp slice from them.
+        self.assertAlmostEqual( speeds[0], vStart, delta=ACCEL * TIME_SLICE / 2.0 + TOLERANCE )
+        self.assertAlmostEqual( speeds[-1], vEnd, delta=ACCEL * TIME_SLICE / 2.0 + TOLERANCE )
+        return pieces
+
+    def trapezoidTime( self, length, vStart, vEnd, vPeak ):
+        dRamps = ( 2.0 * vPeak * vPeak - vStart * vStart - vEnd * vEnd ) / ( 2.0 * ACCEL )
+        return ( vPeak - vStart ) / ACCEL + ( length - dRamps ) / vPeak + ( vPeak - vEnd ) / ACCEL
+
+    def testCruise( self ):
+        pieces = self.checkProfile( 5000.0, 0.0, 300.0 )
+        self.assertAlmostEqual( max( pieceSpeeds( pieces ) ), V_MAX )
+        self.assertAlmostEqual( sum( duration for unused, duration in pieces ),
+            self.trapezoidTime( 5000.0, 0.0, 300.0, V_MAX ) )
+
+    def testNoCruise( self ):
+        length = 200.0
+        vStart = 500.0
+        vEnd = 100.0
+        pieces = self.checkProfile( length, vStart, vEnd )
+        vPeak = math.sqrt( ( 2.0 * ACCEL * length + vStart * vStart + vEnd * vEnd ) / 2.0 )
+        self.assertLess( vPeak, V_MAX )
+        self.assertAlmostEqual( sum( duration for unused, duration in pieces ),
+            self.trapezoidTime( length, vStart, vEnd, vPeak ) )
+
+    def testConstantSpeed( self ):
+        pieces = self.checkProfile( 1000.0, V_MAX, V_MAX )
+        self.assertEqual( len( pieces ), 1 )
+        self.assertAlmostEqual( pieces[0][1], 1000.0 / V_MAX )
+
+    def testEmpty( self ):
+        self.assertEqual( wcb_planner.segmentProfile( 0.0, 0.0, 0.0, V_MAX, ACCEL, TIME_SLICE ), [] )
+
+
+class SliceMoveTest( unittest.TestCase ):
+
+    def testStepsAddUp( self ):
+        for nDeltaX, nDeltaY, vStart, vEnd in ( ( 5000, -1234, 0.0, 0.0 ), ( -17, 3, 400.0, 0.0 ),
+                ( 0, 2500, 1500.0, 1500.0 ), ( 1, 0, 0.0, 0.0 ), ( -800, -801, 300.0, 900.0 ) ):
+            moves = wcb_planner.sliceMove( nDeltaX, nDeltaY, vStart, vEnd, V_MAX, ACCEL, TIME_SLICE, 250.0 )
+            self.assertEqual( sum( move[0] for move in moves ), nDeltaX )
+            self.assertEqual( sum( move[1] for move in moves ), nDeltaY )
+            for xSteps, ySteps, duration in moves:
+                self.assertTrue( ( xSteps != 0 ) or ( ySteps != 0 ) )
+                self.assertGreaterEqual( duration, 1 )
+                self.assertLessEqual( duration, 250 )
+
+    def testDuration( self ):
+        moves = wcb_planner.sliceMove( 6000, 0, 0.0, 0.0, V_MAX, ACCEL, TIME_SLICE, 250.0 )
+        pieces = wcb_planner.segmentProfile( 6000.0, 0.0, 0.0, V_MAX, ACCEL, TIME_SLICE )
+        expected = 1000.0 * sum( duration for unused, duration in pieces )
+        self.assertAlmostEqual( sum( move[2] for move in moves ), expected, delta=1.0 )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+# test_resume.py
+# Part of the WaterColorBot driver for Inkscape
+#
+# Tests of pausing and resuming plots, painted with wcb_engine.PlotEngine on a
+# virtual EBB (wcb_virtual.VirtualEBB) that reports button presses.
+#
+# Usage: python -m pytest tests   (or: python -m unittest discover tests)
+
+import math
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), '..', 'extensions' ) )
+
+import plotink
+sys.path.insert( 0, os.path.dirname( plotink.__file__ ) )    # For plot_utils_import, as in an Inkscape install
+
+import wcb_conf
+import wcb_engine
+import wcb_virtual
+
+SETTINGS = { 'paintMode': 'pencil', 'penDownSpeed': 75 }
+
+
+def drawing( fileName ):
+    '''A short path, then a long zigzag, so that several pauses fall within one path.'''
+    zigzag = ' '.join( '{0:.1f},{1:.1f}'.format( 40 + 1.5 * i, 200 + 60 * math.sin( i / 4.0 ) )
+        for i in range( 400 ) )
+    with open( fileName, 'w' ) as outFile:
+        outFile.write( '<svg xmlns="http://www.w3.org/2000/svg" width="1000" height="700">\n'
+            '<path d="M 40,60 L 200,60 L 200,120" />\n'
+            '<polyline points="' + zigzag + '" />\n</svg>\n' )
+
+
+class PauseResumeTest( unittest.TestCase ):
+
+    def setUp( self ):
+        self.conf = ( wcb_conf.S_Journal_Dir, wcb_conf.S_Geometry_Cache_File, wcb_conf.N_Button_Poll_Time,
+            wcb_conf.N_Button_Poll_Nodes )
+        wcb_conf.S_Journal_Dir = ''
+        wcb_conf.S_Geometry_Cache_File = ''
+        wcb_conf.N_Button_Poll_Time = 0    # Query the button after every move
+        wcb_conf.N_Button_Poll_Nodes = 0
+        self.directory = tempfile.mkdtemp()
+        self.fileName = os.path.join( self.directory, 'drawing.svg' )
+        drawing( self.fileName )
+        self.ebbs = []
+
+    def tearDown( self ):
+        ( wcb_conf.S_Journal_Dir, wcb_conf.S_Geometry_Cache_File, wcb_conf.N_Button_Poll_Time,
+            wcb_conf.N_Button_Poll_Nodes ) = self.conf
+        os.remove( self.fileName )
+        os.rmdir( self.directory )
+
+    def engine( self, pressAfter=None ):
+        def openPort():
+            self.ebbs.append( wcb_virtual.VirtualEBB( pressAfter=pressAfter ) )
+            return self.ebbs[-1]
+        engine = wcb_engine.PlotEngine( SETTINGS, openPort )
+        engine.load( self.fileName )
+        return engine
+
+    def plotState( self, engine ):
+        for node in engine.document.getroot().iter():
+            if isinstance( node.tag, str ) and node.tag.endswith( 'WCB' ):
+                return ( int( node.get( 'lastpath' ) ), int( node.get( 'node' ) ), node.get( 'checkpoint' ),
+                    node.get( 'drawinghash' ) )
+        return None
+
+    def testPauseTwiceInOnePath( self ):
+        self.assertTrue( self.engine().plot() )
+        painted = self.ebbs[-1].penDownDistance
+        del self.ebbs[:]
+
+        engine = self.engine( pressAfter=120 )
+        finished = engine.plot()
+        pauses = []
+        while not finished:
+            pauses.append( self.plotState( engine ) )
+            self.assertLess( len( pauses ), 10 )
+            finished = engine.resume()
+
+        # Paused twice or more in the zigzag, after the first path was finished:
+        self.assertGreaterEqual( len( pauses ), 2 )
+        self.assertEqual( ( pauses[0][0], pauses[1][0] ), ( 1, 1 ) )
+        nodes = [pause[1] for pause in pauses]
+        self.assertEqual( nodes, sorted( set( nodes ) ) )
+        # The checkpoint at the end of the first path is kept, for resuming without a full traversal:
+        self.assertTrue( pauses[0][2] and pauses[0][3] )
+        self.assertEqual( pauses[1][2:], pauses[0][2:] )
+        self.assertAlmostEqual( sum( ebb.penDownDistance for ebb in self.ebbs ), painted, places=3 )
+
+
+if __name__ == '__main__':
+    unittest.main()